@@ -0,0 +1,237 @@
+# Analítica: ocupación por día y hora, comensales por tipo y zona y tasas de
+# cancelación y de no presentados, leídas de los agregados rollup_daily y rollup_hourly.
+# Solo trabaja sobre el cursor que recibe: app.py le pasa las mesas, el horario y las
+# ocurrencias de las reservas fijas, que no son filas de reservations y no están en los
+# agregados
+from datetime import date, timedelta
+
+def rollup_daily_sql(row, sign):
+    # Reservas y comensales por fecha, tipo, zona de la mesa principal y estado
+    return f'''
+        INSERT INTO rollup_daily (reservation_date, type, location, status, reservations, covers)
+        VALUES ({row}.reservation_date, COALESCE({row}.type, ''),
+            COALESCE((SELECT location FROM tables WHERE id = {row}.table_id), ''), COALESCE({row}.status, ''),
+            {sign}1, {sign}COALESCE({row}.guests, 0))
+        ON CONFLICT (reservation_date, type, location, status) DO UPDATE
+        SET reservations = reservations + excluded.reservations, covers = covers + excluded.covers;
+    '''
+
+def rollup_hourly_sql(row, sign, tables, source=''):
+    # Minutos de mesa ocupados en cada hora que toca la reserva
+    return f'''
+        INSERT INTO rollup_hourly (reservation_date, hour, table_minutes)
+        SELECT {row}.reservation_date, h.hour,
+            {sign}(MIN({row}.end_minute, h.hour * 60 + 60) - MAX({row}.start_minute, h.hour * 60)) * {tables}
+        FROM rollup_hours h {source}
+        WHERE {row}.status = 'confirmed' AND h.hour * 60 < {row}.end_minute AND h.hour * 60 + 60 > {row}.start_minute
+        ON CONFLICT (reservation_date, hour) DO UPDATE SET table_minutes = table_minutes + excluded.table_minutes;
+    '''
+
+def create_rollups(cursor):
+    # Agregados mantenidos por triggers con cada escritura venga de donde venga: los
+    # informes leen unas filas por día en lugar de todo el histórico. Al archivar se
+    # borran reservas sin tocarlos, así que conservan los meses archivados
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS rollup_daily (
+        reservation_date TEXT NOT NULL,
+        type TEXT NOT NULL,
+        location TEXT NOT NULL,
+        status TEXT NOT NULL,
+        reservations INTEGER NOT NULL,
+        covers INTEGER NOT NULL,
+        PRIMARY KEY (reservation_date, type, location, status)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS rollup_hourly (
+        reservation_date TEXT NOT NULL,
+        hour INTEGER NOT NULL,
+        table_minutes INTEGER NOT NULL,
+        PRIMARY KEY (reservation_date, hour)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE TABLE IF NOT EXISTS rollup_hours (hour INTEGER PRIMARY KEY)")
+    cursor.executemany("INSERT OR IGNORE INTO rollup_hours (hour) VALUES (?)", [(hour,) for hour in range(24)])
+    
+    # Una reserva ocupa su mesa principal y las de reservation_tables
+    tables = '(1 + (SELECT COUNT(*) FROM reservation_tables WHERE reservation_id = {row}.id))'
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_reservations_insert_rollup
+    AFTER INSERT ON reservations
+    BEGIN
+        {rollup_daily_sql('NEW', '+')}
+        {rollup_hourly_sql('NEW', '+', tables.format(row='NEW'))}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_reservations_update_rollup
+    AFTER UPDATE OF table_id, reservation_date, start_minute, end_minute, guests, type, status ON reservations
+    BEGIN
+        {rollup_daily_sql('OLD', '-')}
+        {rollup_daily_sql('NEW', '+')}
+        {rollup_hourly_sql('OLD', '-', tables.format(row='OLD'))}
+        {rollup_hourly_sql('NEW', '+', tables.format(row='NEW'))}
+    END
+    ''')
+    # Mesas adicionales: cuentan con las horas que tenga la reserva en ese momento. Si la
+    # reserva ya no existe (archivado) el borrado no descuenta nada
+    for event, row, sign in (('INSERT', 'NEW', '+'), ('DELETE', 'OLD', '-')):
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_reservation_tables_{event.lower()}_rollup
+        AFTER {event} ON reservation_tables
+        BEGIN
+            {rollup_hourly_sql('r', sign, 1, f'JOIN reservations r ON r.id = {row}.reservation_id')}
+        END
+        ''')
+
+def create_rebuild_tables(cursor):
+    # Tablas temporales donde se suman los agregados antes de sustituir los actuales
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS rollup_daily_build "
+                   "(reservation_date, type, location, status, reservations, covers)")
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS rollup_hourly_build (reservation_date, hour, table_minutes)")
+    cursor.execute("DELETE FROM temp.rollup_daily_build")
+    cursor.execute("DELETE FROM temp.rollup_hourly_build")
+
+def drop_rebuild_tables(cursor):
+    cursor.execute("DROP TABLE IF EXISTS temp.rollup_daily_build")
+    cursor.execute("DROP TABLE IF EXISTS temp.rollup_hourly_build")
+
+def accumulate_rollups(cursor, schema):
+    # Suma en las tablas temporales de recálculo los agregados de las reservas de
+    # 'schema' (main o un mes archivado), con un GROUP BY por tabla en lugar de fila a fila
+    exclude = "AND NOT EXISTS (SELECT 1 FROM main.reservations m WHERE m.id = r.id)" if schema != 'main' else ''
+    cursor.execute(f'''
+    INSERT INTO temp.rollup_daily_build
+    SELECT r.reservation_date, COALESCE(r.type, ''), COALESCE(t.location, ''), COALESCE(r.status, ''),
+        COUNT(*), SUM(COALESCE(r.guests, 0))
+    FROM {schema}.reservations r
+    LEFT JOIN main.tables t ON t.id = r.table_id
+    WHERE r.reservation_date IS NOT NULL {exclude}
+    GROUP BY 1, 2, 3, 4
+    ''')
+    cursor.execute(f'''
+    INSERT INTO temp.rollup_hourly_build
+    SELECT r.reservation_date, h.hour,
+        SUM((MIN(r.end_minute, h.hour * 60 + 60) - MAX(r.start_minute, h.hour * 60))
+            * (1 + (SELECT COUNT(*) FROM {schema}.reservation_tables rt WHERE rt.reservation_id = r.id)))
+    FROM {schema}.reservations r
+    JOIN main.rollup_hours h ON h.hour * 60 < r.end_minute AND h.hour * 60 + 60 > r.start_minute
+    WHERE r.status = 'confirmed' {exclude}
+    GROUP BY 1, 2
+    ''')
+
+def replace_rollups(cursor):
+    # Dentro de la transacción de escritura: los agregados pasan a ser los sumados
+    cursor.execute("DELETE FROM rollup_daily")
+    cursor.execute('''
+    INSERT INTO rollup_daily (reservation_date, type, location, status, reservations, covers)
+    SELECT reservation_date, type, location, status, SUM(reservations), SUM(covers)
+    FROM temp.rollup_daily_build GROUP BY 1, 2, 3, 4
+    ''')
+    cursor.execute("DELETE FROM rollup_hourly")
+    cursor.execute('''
+    INSERT INTO rollup_hourly (reservation_date, hour, table_minutes)
+    SELECT reservation_date, hour, SUM(table_minutes) FROM temp.rollup_hourly_build GROUP BY 1, 2
+    ''')
+
+def standing_rollups(standing):
+    # Las ocurrencias de reservas fijas [(fecha, tipo, zona, personas, inicio, fin)] como
+    # filas de rollup_daily y rollup_hourly: una reserva confirmada en una mesa cada una
+    daily, hourly = {}, {}
+    for reservation_date, reservation_type, location, guests, start_minute, end_minute in standing:
+        key = (reservation_date, reservation_type or '', location or '', 'confirmed')
+        reservations, covers = daily.get(key, (0, 0))
+        daily[key] = (reservations + 1, covers + (guests or 0))
+        for hour in range(start_minute // 60, (end_minute + 59) // 60):
+            minutes = min(end_minute, hour * 60 + 60) - max(start_minute, hour * 60)
+            hourly[reservation_date, hour] = hourly.get((reservation_date, hour), 0) + minutes
+    return ([key + value for key, value in daily.items()],
+            [key + (minutes,) for key, minutes in hourly.items()])
+
+def build_report(cursor, date_from, date_to, tables, opening, closing, standing=()):
+    # Informe del intervalo a partir de los agregados: unas filas por día y hora, sea
+    # cual sea el tamaño del histórico, más las ocurrencias de reservas fijas del
+    # intervalo ('standing'). La ocupación se mide sobre las 'tables' mesas actuales
+    cursor.execute('''
+    SELECT reservation_date, type, location, status, reservations, covers FROM rollup_daily
+    WHERE reservation_date BETWEEN ? AND ? AND reservations != 0
+    ''', (date_from, date_to))
+    daily = cursor.fetchall()
+    cursor.execute('''
+    SELECT reservation_date, hour, table_minutes FROM rollup_hourly
+    WHERE reservation_date BETWEEN ? AND ? AND table_minutes != 0
+    ''', (date_from, date_to))
+    hourly = cursor.fetchall()
+    standing = list(standing)
+    standing_daily, standing_hourly = standing_rollups(standing)
+    
+    first, last = date.fromisoformat(date_from), date.fromisoformat(date_to)
+    day_count = (last - first).days + 1
+    tables = tables or 1
+    
+    days = {(first + timedelta(days=offset)).isoformat(): dict(reservations=0, covers=0, cancelled=0, no_show=0,
+                                                               standing=0, table_minutes=0)
+            for offset in range(day_count)}
+    for reservation_date, *_ in standing:
+        days[reservation_date]['standing'] += 1
+    by_type, by_location = {}, {}
+    for reservation_date, reservation_type, location, status, reservations, covers in daily + standing_daily:
+        day = days[reservation_date]
+        day['reservations'] += reservations
+        if status == 'cancelled':
+            day['cancelled'] += reservations
+        elif status == 'no_show':
+            day['no_show'] += reservations
+        else:
+            day['covers'] += covers
+            by_type[reservation_type] = by_type.get(reservation_type, 0) + covers
+            by_location[location] = by_location.get(location, 0) + covers
+    hours = {hour: 0 for hour in range(opening // 60, (closing + 59) // 60)}
+    for reservation_date, hour, table_minutes in hourly + standing_hourly:
+        days[reservation_date]['table_minutes'] += table_minutes
+        hours[hour] = hours.get(hour, 0) + table_minutes
+    for day in days.values():
+        day['utilization'] = round(day['table_minutes'] / (tables * (closing - opening)), 4)
+    
+    total = sum(day['reservations'] for day in days.values())
+    cancelled = sum(day['cancelled'] for day in days.values())
+    no_show = sum(day['no_show'] for day in days.values())
+    return {
+        'date_from': date_from,
+        'date_to': date_to,
+        'tables': tables,
+        'reservations': total,
+        'standing': len(standing),
+        'covers': sum(day['covers'] for day in days.values()),
+        'cancelled': cancelled,
+        'no_show': no_show,
+        'cancellation_rate': round(cancelled / total, 4) if total else 0,
+        'no_show_rate': round(no_show / total, 4) if total else 0,
+        'utilization': round(sum(day['table_minutes'] for day in days.values())
+                             / (tables * (closing - opening) * day_count), 4),
+        'days': [dict(day, reservation_date=reservation_date) for reservation_date, day in days.items()],
+        'hours': [{'hour': hour, 'table_minutes': minutes,
+                   'utilization': round(minutes / (tables * 60 * day_count), 4)}
+                  for hour, minutes in sorted(hours.items())],
+        'covers_by_type': dict(sorted(by_type.items())),
+        'covers_by_location': dict(sorted(by_location.items())),
+    }
+
+def venue_totals(cursor, date_from, date_to, standing=()):
+    # Reservas, comensales y cancelaciones del intervalo para el informe conjunto de
+    # sedes, de los agregados (incluyen los meses archivados) y las reservas fijas
+    cursor.execute('''
+    SELECT COALESCE(SUM(reservations), 0),
+        COALESCE(SUM(CASE WHEN status NOT IN ('cancelled', 'no_show') THEN covers END), 0),
+        COALESCE(SUM(CASE WHEN status = 'cancelled' THEN reservations END), 0)
+    FROM rollup_daily
+    WHERE reservation_date BETWEEN ? AND ?
+    ''', (date_from, date_to))
+    reservations, covers, cancelled = cursor.fetchone()
+    standing = list(standing)
+    return {
+        'reservations': reservations + len(standing),
+        'standing': len(standing),
+        'covers': covers + sum(guests or 0 for _, _, _, guests, _, _ in standing),
+        'cancelled': cancelled,
+    }
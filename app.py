@@ -1,14 +1,794 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import (Flask, render_template, request, redirect, url_for, flash, jsonify, g, Response, session,
+                   stream_with_context, stream_template, has_request_context)
+import calendar
+import click
+import cProfile
+import csv
+import io
+import json
+import logging
+import os
+import pstats
 import sqlite3
-from datetime import datetime
+import queue
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from werkzeug.exceptions import NotFound
+from functools import lru_cache, wraps
+from datetime import date, datetime, timedelta, timezone
 import copy
 
+from analytics import (accumulate_rollups, build_report, create_rebuild_tables, create_rollups,
+                       drop_rebuild_tables, replace_rollups, venue_totals)
+
 app = Flask(__name__)
 app.secret_key = "restaurante_secreto"
+app.config['DATABASE'] = 'restaurant.db'
+app.config['DB_POOL_SIZE'] = 5
+app.config['DB_BUSY_TIMEOUT'] = 1.0
+app.config['DB_WRITE_RETRIES'] = 5
+app.config['AVAILABILITY_INDEX'] = True
+app.config['AVAILABILITY_INDEX_DATES'] = 64
+app.config['RESERVATIONS_PAGE_SIZE'] = 50
+app.config['OPENING_TIME'] = '10:00'
+app.config['CLOSING_TIME'] = '22:00'
+app.config['AVAILABILITY_GRID_MINUTES'] = 15
+app.config['MAX_COMBINED_TABLES'] = 4
+app.config['RESERVATIONS_MAX_PAGE_SIZE'] = 500
+# Búsqueda del hueco libre más cercano: ±horas alrededor de la hora pedida, días
+# por delante (contando el pedido), paso entre horas de inicio y huecos devueltos
+app.config['SLOT_SEARCH_HOURS'] = 2
+app.config['SLOT_SEARCH_DAYS'] = 14
+app.config['SLOT_SEARCH_MAX_DAYS'] = 60
+app.config['SLOT_SEARCH_STEP_MINUTES'] = 15
+app.config['SLOT_SEARCH_RESULTS'] = 5
+# Reservas fijas: días por delante que muestra el listado sin fecha final, y días
+# en los que se buscan coincidencias entre dos reglas al dar de alta una nueva
+app.config['RECURRING_LISTING_DAYS'] = 90
+app.config['RECURRING_CONFLICT_DAYS'] = 366
+# Archivo: las reservas con fecha anterior a hoy menos ARCHIVE_AFTER_DAYS se mueven a un
+# fichero SQLite por mes (en ARCHIVE_DIRECTORY o junto a la base de datos); el listado
+# solo las incluye con ?history=1
+app.config['ARCHIVE_AFTER_DAYS'] = 180
+app.config['ARCHIVE_DIRECTORY'] = None
+app.config['ARCHIVE_BATCH_SIZE'] = 5000
+# Directorio de clientes: prefijo internacional de los teléfonos escritos sin él y
+# resultados de cada búsqueda por nombre o teléfono
+app.config['PHONE_COUNTRY_CODE'] = '34'
+app.config['CUSTOMER_SEARCH_RESULTS'] = 20
+# Con varios procesos (gunicorn/uvicorn --workers) cada uno tiene su propio índice:
+# antes de usar una fecha se comprueba su versión en la base de datos
+app.config['AVAILABILITY_INDEX_REVALIDATE'] = False
+# Cola de escritura opcional: un único hilo escritor por base de datos aplica en orden
+# las reservas, ediciones y cancelaciones y las confirma en lotes de hasta
+# WRITE_QUEUE_BATCH operaciones, una transacción por lote. Cada proceso tiene la suya
+app.config['WRITE_QUEUE'] = False
+app.config['WRITE_QUEUE_BATCH'] = 64
+app.config['RESPONSE_CACHE'] = True
+app.config['RESPONSE_CACHE_SIZE'] = 256
+app.config['AVAILABILITY_EVENTS_MAX_SUBSCRIBERS'] = 32
+app.config['AVAILABILITY_EVENTS_KEEPALIVE'] = 15
+# Solo con AVAILABILITY_INDEX_REVALIDATE: cada cuánto se miran los cambios de otros procesos
+app.config['AVAILABILITY_EVENTS_POLL'] = 1.0
+# Varias sedes, cada una con su propio fichero SQLite: nombre -> ruta de la base de datos.
+# Se accede con el prefijo /<sede>/ o por el nombre de host (VENUE_HOSTS: host -> sede);
+# sin sede se usa DEFAULT_VENUE y, si no hay, la petición responde 404. DATABASE es la
+# base de datos de una instalación sin VENUES
+app.config['VENUES'] = {}
+app.config['VENUE_HOSTS'] = {}
+app.config['DEFAULT_VENUE'] = None
+app.config['VENUES_MAX_PARALLEL'] = 8
+# Nivel del registro de la aplicación (FLASK_LOG_LEVEL=DEBUG muestra cada comprobación)
+app.config['LOG_LEVEL'] = 'WARNING'
+# Métricas en /metrics: latencia por ruta, consultas SQL por petición y aciertos de caché
+app.config['METRICS'] = True
+app.config['SLOW_REQUEST_SECONDS'] = 0.5
+# Solo para diagnóstico: con ?profile=1 se devuelven las estadísticas de cProfile de la petición
+app.config['PROFILING'] = False
+app.config['PROFILING_LIMIT'] = 40
+# Ajustes de despliegue por variables de entorno, p. ej. FLASK_DATABASE=/srv/restaurant.db
+app.config.from_prefixed_env()
+app.logger.setLevel(app.config['LOG_LEVEL'])
+
+# Estadísticas SQL de una conexión: sentencias ejecutadas y tiempo dentro de SQLite
+class QueryStats:
+    __slots__ = ('statements', 'seconds')
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Se cronometran execute y fetch*; la iteración directa sobre el cursor no
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            self.connection.stats.seconds += time.perf_counter() - start
+    
+    def execute(self, *args):
+        return self._timed(sqlite3.Cursor.execute, *args)
+    
+    def executemany(self, *args):
+        return self._timed(sqlite3.Cursor.executemany, *args)
+    
+    def fetchone(self):
+        return self._timed(sqlite3.Cursor.fetchone)
+    
+    def fetchmany(self, *args):
+        return self._timed(sqlite3.Cursor.fetchmany, *args)
+    
+    def fetchall(self):
+        return self._timed(sqlite3.Cursor.fetchall)
+
+class InstrumentedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = QueryStats()
+        # La traza cuenta cada sentencia que ejecuta SQLite, también las de los triggers
+        self.set_trace_callback(self._trace)
+    
+    def _trace(self, statement):
+        self.stats.statements += 1
+    
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+    
+    # Los atajos de Connection crean su cursor sin pasar por cursor()
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+    
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            self.stats.seconds += time.perf_counter() - start
+
+# Pool de conexiones SQLite reutilizables entre peticiones
+class ConnectionPool:
+    # Ajustes por conexión; con el pool se ejecutan una sola vez por conexión
+    PRAGMAS = (
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA cache_size = -16000",
+        "PRAGMA mmap_size = 268435456",
+        "PRAGMA temp_store = MEMORY",
+    )
+    
+    def __init__(self, database, size, busy_timeout, instrumented=False):
+        self.database = database
+        self.size = size
+        self.busy_timeout = busy_timeout
+        self.factory = InstrumentedConnection if instrumented else sqlite3.Connection
+        self._idle = queue.LifoQueue(maxsize=size)
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=self.busy_timeout, check_same_thread=False,
+                               factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+    
+    def release(self, conn):
+        # Nunca devolver al pool una conexión con una transacción abierta
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+    
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+# Enrutado por sede: el prefijo /<sede> pasa a SCRIPT_NAME, así las rutas no cambian
+# y url_for genera los enlaces ya con el prefijo. Con varias sedes, una petición sin
+# prefijo, host conocido ni DEFAULT_VENUE no es de ninguna sede: 404
+class VenueDispatcher:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+    
+    def __call__(self, environ, start_response):
+        venue, _, rest = environ.get('PATH_INFO', '').lstrip('/').partition('/')
+        if venue in app.config['VENUES']:
+            environ['reserva.venue'] = venue
+            environ['SCRIPT_NAME'] = f"{environ.get('SCRIPT_NAME', '')}/{venue}"
+            environ['PATH_INFO'] = f'/{rest}'
+        elif (app.config['VENUES'] and not app.config['DEFAULT_VENUE']
+              and environ.get('HTTP_HOST', '').partition(':')[0] not in app.config['VENUE_HOSTS']):
+            return NotFound('Sede desconocida.')(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+app.wsgi_app = VenueDispatcher(app.wsgi_app)
+
+def get_venue():
+    # Sede del contexto actual: la del prefijo o el host en una petición, la fijada
+    # con venue_context fuera de ellas (CLI, informes) o la sede por defecto
+    if 'venue' not in g:
+        venue = None
+        if has_request_context():
+            venue = (request.environ.get('reserva.venue')
+                     or app.config['VENUE_HOSTS'].get(request.host.partition(':')[0]))
+        g.venue = venue or app.config['DEFAULT_VENUE']
+    return g.venue
+
+def get_database():
+    # Fichero SQLite de la sede actual: conexiones, índices y cachés se guardan por fichero.
+    # DATABASE solo se usa sin VENUES: con sedes nunca se crea ni se abre ese fichero
+    venue = get_venue()
+    venues = app.config['VENUES']
+    if not venues:
+        return app.config['DATABASE']
+    if venue not in venues:
+        raise RuntimeError(f'Sede desconocida: {venue}. Con VENUES, indique la sede o DEFAULT_VENUE.')
+    return venues[venue]
+
+def venue_names():
+    # Todas las sedes configuradas; None es la instalación de una sola sede (DATABASE)
+    return list(app.config['VENUES']) or [None]
+
+@contextmanager
+def venue_context(venue):
+    # Contexto de aplicación ligado a la base de datos de una sede
+    with app.app_context():
+        g.venue = venue
+        yield
+
+def across_venues(func, *args):
+    # Ejecuta func en cada sede en paralelo, cada una en su hilo y con su propia conexión;
+    # devuelve [(sede, resultado)] en el orden de venue_names()
+    venues = venue_names()
+    
+    def run(venue):
+        with venue_context(venue):
+            return func(*args)
+    
+    with ThreadPoolExecutor(max_workers=min(len(venues), app.config['VENUES_MAX_PARALLEL'])) as executor:
+        return list(zip(venues, executor.map(run, venues)))
+
+_pools = {}
+_registry_lock = threading.Lock()
+
+def get_pool():
+    database = get_database()
+    with _registry_lock:
+        pool = _pools.get(database)
+        if pool is None:
+            pool = _pools[database] = ConnectionPool(database, app.config['DB_POOL_SIZE'],
+                                                     app.config['DB_BUSY_TIMEOUT'], app.config['METRICS'])
+    return pool
+
+def close_pools():
+    # Antes de un fork: las conexiones SQLite no deben heredarse entre procesos
+    with _registry_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
+
+def get_db():
+    # Una sola conexión por petición (o contexto de aplicación)
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+        # Las métricas de la petición empiezan con la conexión
+        stats = getattr(g.db, 'stats', None)
+        if stats is not None:
+            stats.reset()
+    return g.db
+
+@app.teardown_appcontext
+def close_db(exception):
+    db = g.pop('db', None)
+    if db is not None:
+        get_pool().release(db)
+
+@contextmanager
+def write_transaction():
+    # BEGIN IMMEDIATE toma el bloqueo de escritura antes de leer, de modo que la
+    # comprobación y la escritura no pueden intercalarse con otro escritor
+    conn = get_db()
+    retries = app.config['DB_WRITE_RETRIES']
+    for attempt in range(retries):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            break
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) or attempt == retries - 1:
+                raise
+            time.sleep(0.01 * (attempt + 1))
+    # Las reservas fijas leídas antes del bloqueo podrían haber cambiado entretanto
+    g.pop('recurring_rules', None)
+    try:
+        yield conn.cursor()
+        # Si la confirmación falla (SQLITE_BUSY, E/S) la transacción seguiría abierta
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+# Escritor único: las peticiones encolan operation(cursor) y esperan su Future; el hilo
+# escritor toma de la cola lo que haya (hasta un lote), lo aplica en una sola transacción
+# y la confirma una vez. Cada operación va en su SAVEPOINT: si falla (un conflicto), solo
+# se deshace la suya y su Future recibe la excepción
+class WriteQueue:
+    def __init__(self, venue, batch_size):
+        self.venue = venue
+        self.batch_size = batch_size
+        self.batches = 0
+        self.operations = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+        self._thread.start()
+    
+    @property
+    def alive(self):
+        return self._thread.is_alive()
+    
+    def submit(self, operation):
+        future = Future()
+        self._queue.put((operation, future))
+        return future
+    
+    def _run(self):
+        with venue_context(self.venue):
+            while True:
+                batch = [self._queue.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self._apply([(operation, future) for operation, future in batch
+                             if future.set_running_or_notify_cancel()])
+    
+    def _apply(self, batch):
+        results = []
+        try:
+            with write_transaction() as cursor:
+                for operation, future in batch:
+                    cursor.execute("SAVEPOINT operation")
+                    try:
+                        results.append((future, operation(cursor), None))
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO operation")
+                        results.append((future, None, e))
+                    cursor.execute("RELEASE operation")
+        except Exception as e:
+            # El lote entero se ha deshecho: ninguna operación quedó aplicada
+            app.logger.error("write_queue_batch_failed operations=%s error=%s", len(batch), e)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.operations += len(batch)
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+_write_queues = {}
+
+def get_write_queue():
+    # None con la cola desactivada. Un hilo no sobrevive a un fork: se crea otra cola
+    if not app.config['WRITE_QUEUE']:
+        return None
+    database = get_database()
+    with _registry_lock:
+        write_queue = _write_queues.get(database)
+        if write_queue is None or not write_queue.alive:
+            write_queue = _write_queues[database] = WriteQueue(get_venue(), app.config['WRITE_QUEUE_BATCH'])
+    return write_queue
+
+def run_write(operation):
+    # operation(cursor) dentro de una transacción de escritura: en el lote del escritor
+    # único si la cola está activa, o en una transacción propia en esta conexión
+    write_queue = get_write_queue()
+    if write_queue is not None:
+        return write_queue.submit(operation).result()
+    with write_transaction() as cursor:
+        return operation(cursor)
+
+# Migraciones del esquema, aplicadas en orden según PRAGMA user_version
+def _migration_reservation_indexes(cursor):
+    # Comprobación de solapes por mesa y listado ordenado de /reservations
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_reservations_table_slot
+    ON reservations (table_id, reservation_date, status, start_time, end_time)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_reservations_date_start
+    ON reservations (reservation_date, start_time)
+    ''')
+
+def _migration_combinable_tables(cursor):
+    # Reservas de grupo en varias mesas: la mesa principal sigue en reservations.table_id
+    # y las adicionales en reservation_tables
+    cursor.execute("ALTER TABLE tables ADD COLUMN combinable INTEGER NOT NULL DEFAULT 0")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS table_adjacency (
+        table_id INTEGER,
+        adjacent_table_id INTEGER,
+        PRIMARY KEY (table_id, adjacent_table_id),
+        FOREIGN KEY (table_id) REFERENCES tables (id),
+        FOREIGN KEY (adjacent_table_id) REFERENCES tables (id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS reservation_tables (
+        reservation_id INTEGER,
+        table_id INTEGER,
+        PRIMARY KEY (reservation_id, table_id),
+        FOREIGN KEY (reservation_id) REFERENCES reservations (id),
+        FOREIGN KEY (table_id) REFERENCES tables (id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_reservation_tables_table
+    ON reservation_tables (table_id, reservation_id)
+    ''')
+    # Una fila por cada mesa ocupada por una reserva; las consultas de solapes leen de aquí.
+    # CROSS JOIN recorre primero reservation_tables (solo mesas adicionales, pocas filas)
+    # para que la comprobación por mesa use su índice en lugar de todo el día
+    cursor.execute('''
+    CREATE VIEW IF NOT EXISTS table_bookings AS
+    SELECT id, table_id, reservation_date, start_time, end_time, status FROM reservations
+    UNION ALL
+    SELECT r.id, rt.table_id, r.reservation_date, r.start_time, r.end_time, r.status
+    FROM reservation_tables rt
+    CROSS JOIN reservations r ON r.id = rt.reservation_id
+    ''')
+
+def _migration_catalog_version(cursor):
+    # Contador de cambios del catálogo de mesas: los triggers lo incrementan con
+    # cualquier escritura en tables o table_adjacency, venga de donde venga
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS catalog_meta (
+        key TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO catalog_meta (key, version) VALUES ('tables', 0)")
+    for table in ('tables', 'table_adjacency'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_catalog
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE catalog_meta SET version = version + 1 WHERE key = 'tables';
+            END
+            ''')
+
+def _migration_reservation_day_versions(cursor):
+    # Versión por fecha de las reservas, incrementada por triggers con cada cambio:
+    # permite a cada proceso saber si su copia en memoria de una fecha sigue al día
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS reservation_day_versions (
+        reservation_date TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    bump = '''
+        INSERT INTO reservation_day_versions (reservation_date, version) VALUES ({date}, 1)
+        ON CONFLICT (reservation_date) DO UPDATE SET version = version + 1;
+    '''
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_reservations_insert_day
+    AFTER INSERT ON reservations
+    BEGIN {bump.format(date='NEW.reservation_date')} END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_reservations_update_day
+    AFTER UPDATE ON reservations
+    BEGIN
+        {bump.format(date='OLD.reservation_date')}
+        {bump.format(date='NEW.reservation_date')}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_reservations_delete_day
+    AFTER DELETE ON reservations
+    BEGIN {bump.format(date='OLD.reservation_date')} END
+    ''')
+    for event, row in (('INSERT', 'NEW'), ('DELETE', 'OLD')):
+        date = f'(SELECT reservation_date FROM reservations WHERE id = {row}.reservation_id)'
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_reservation_tables_{event.lower()}_day
+        AFTER {event} ON reservation_tables
+        WHEN {date} IS NOT NULL
+        BEGIN {bump.format(date=date)} END
+        ''')
+
+def _migration_reservations_version(cursor):
+    # Contador global de cambios en las reservas, para los ETag de los listados
+    cursor.execute("INSERT OR IGNORE INTO catalog_meta (key, version) VALUES ('reservations', 0)")
+    for table, events in (('reservations', ('INSERT', 'UPDATE', 'DELETE')),
+                          ('reservation_tables', ('INSERT', 'DELETE'))):
+        for event in events:
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE catalog_meta SET version = version + 1 WHERE key = 'reservations';
+            END
+            ''')
+
+def _migration_integer_times(cursor):
+    # Horas como minutos desde medianoche: los solapes pasan a ser comparaciones de
+    # enteros. SQLite no cambia el tipo de una columna, así que se reconstruye la tabla;
+    # antes se quitan la vista y los triggers que la nombran, o el RENAME fallaría
+    cursor.connection.create_function('time_to_minutes', 1, time_to_minutes, deterministic=True)
+    cursor.execute("DROP VIEW IF EXISTS table_bookings")
+    cursor.execute("DROP TRIGGER IF EXISTS trg_reservation_tables_insert_day")
+    cursor.execute("DROP TRIGGER IF EXISTS trg_reservation_tables_delete_day")
+    cursor.execute('''
+    CREATE TABLE reservations_new (
+        id INTEGER PRIMARY KEY,
+        customer_name TEXT,
+        customer_phone TEXT,
+        table_id INTEGER,
+        reservation_date TEXT,
+        start_minute INTEGER NOT NULL,
+        end_minute INTEGER NOT NULL,
+        guests INTEGER,
+        type TEXT,
+        status TEXT,
+        FOREIGN KEY (table_id) REFERENCES tables (id)
+    )
+    ''')
+    cursor.execute('''
+    INSERT INTO reservations_new
+    SELECT id, customer_name, customer_phone, table_id, reservation_date,
+        time_to_minutes(start_time), time_to_minutes(end_time), guests, type, status
+    FROM reservations
+    ''')
+    cursor.execute("DROP TABLE reservations")
+    cursor.execute("ALTER TABLE reservations_new RENAME TO reservations")
+    cursor.execute('''
+    CREATE INDEX idx_reservations_table_slot
+    ON reservations (table_id, reservation_date, status, start_minute, end_minute)
+    ''')
+    cursor.execute('''
+    CREATE INDEX idx_reservations_date_start
+    ON reservations (reservation_date, start_minute)
+    ''')
+    # Los triggers de versión desaparecieron con la tabla antigua
+    _migration_reservation_day_versions(cursor)
+    _migration_reservations_version(cursor)
+    cursor.execute('''
+    CREATE VIEW table_bookings AS
+    SELECT id, table_id, reservation_date, start_minute, end_minute, status FROM reservations
+    UNION ALL
+    SELECT r.id, rt.table_id, r.reservation_date, r.start_minute, r.end_minute, r.status
+    FROM reservation_tables rt
+    CROSS JOIN reservations r ON r.id = rt.reservation_id
+    ''')
+    # Vista de compatibilidad con las horas en texto 'HH:MM', para exportaciones e informes
+    cursor.execute('''
+    CREATE VIEW reservations_hhmm AS
+    SELECT id, customer_name, customer_phone, table_id, reservation_date,
+        printf('%02d:%02d', start_minute / 60, start_minute % 60) AS start_time,
+        printf('%02d:%02d', end_minute / 60, end_minute % 60) AS end_time,
+        start_minute, end_minute, guests, type, status
+    FROM reservations
+    ''')
+
+def _migration_recurring_reservations(cursor):
+    # Reservas fijas: una fila por regla de repetición (estilo RRULE) en lugar de una por
+    # semana; las ocurrencias se calculan al consultar cada fecha. Una excepción anula
+    # una ocurrencia concreta
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS recurring_reservations (
+        id INTEGER PRIMARY KEY,
+        customer_name TEXT,
+        customer_phone TEXT,
+        table_id INTEGER NOT NULL,
+        start_minute INTEGER NOT NULL,
+        end_minute INTEGER NOT NULL,
+        guests INTEGER,
+        type TEXT,
+        dtstart TEXT NOT NULL,
+        rrule TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'active',
+        FOREIGN KEY (table_id) REFERENCES tables (id)
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS recurring_exceptions (
+        rule_id INTEGER NOT NULL,
+        reservation_date TEXT NOT NULL,
+        PRIMARY KEY (rule_id, reservation_date)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO catalog_meta (key, version) VALUES ('recurring', 0)")
+    for table in ('recurring_reservations', 'recurring_exceptions'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE catalog_meta SET version = version + 1 WHERE key = 'recurring';
+            END
+            ''')
+
+def _migration_waitlist(cursor):
+    # Lista de espera: personas, fecha y ventana aceptable (la reserva de 'duration'
+    # minutos debe caber entre window_start y window_end). Al liberarse un hueco la
+    # petición pasa a 'offered' (con la mesa y hora ofrecidas) o a 'booked'
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS waitlist (
+        id INTEGER PRIMARY KEY,
+        customer_name TEXT,
+        customer_phone TEXT,
+        reservation_date TEXT NOT NULL,
+        window_start INTEGER NOT NULL,
+        window_end INTEGER NOT NULL,
+        duration INTEGER NOT NULL,
+        guests INTEGER NOT NULL,
+        type TEXT,
+        auto_book INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL DEFAULT 'waiting',
+        offer_table_id INTEGER,
+        offer_start_minute INTEGER,
+        reservation_id INTEGER,
+        created_at TEXT NOT NULL DEFAULT (datetime('now')),
+        FOREIGN KEY (offer_table_id) REFERENCES tables (id),
+        FOREIGN KEY (reservation_id) REFERENCES reservations (id)
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_waitlist_date_status
+    ON waitlist (reservation_date, status)
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO catalog_meta (key, version) VALUES ('waitlist', 0)")
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_waitlist_{event.lower()}_version
+        AFTER {event} ON waitlist
+        BEGIN
+            UPDATE catalog_meta SET version = version + 1 WHERE key = 'waitlist';
+        END
+        ''')
+
+def _migration_rollups(cursor):
+    # Agregados para la analítica (analytics.create_rollups), mantenidos por triggers
+    create_rollups(cursor)
+    # El recálculo inicial adjunta los meses archivados, y ATTACH no cabe en una transacción
+    cursor.connection.commit()
+    rebuild_rollups()
+
+def _migration_customers(cursor):
+    # Un cliente por teléfono normalizado (E.164): las reservas pasan a apuntar a su
+    # cliente y el nombre se busca por prefijos con FTS5, sin distinguir acentos
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS customers (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        phone_key TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (datetime('now'))
+    )
+    ''')
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_customers_phone_key ON customers (phone_key)")
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS customers_fts USING fts5(
+        name, content='customers', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    ''')
+    # Índice externo (content=customers): los triggers lo mantienen al día
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_customers_insert_fts AFTER INSERT ON customers
+    BEGIN
+        INSERT INTO customers_fts (rowid, name) VALUES (NEW.id, NEW.name);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_customers_delete_fts AFTER DELETE ON customers
+    BEGIN
+        INSERT INTO customers_fts (customers_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_customers_update_fts AFTER UPDATE OF name ON customers
+    BEGIN
+        INSERT INTO customers_fts (customers_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+        INSERT INTO customers_fts (rowid, name) VALUES (NEW.id, NEW.name);
+    END
+    ''')
+    cursor.execute("ALTER TABLE reservations ADD COLUMN customer_id INTEGER REFERENCES customers (id)")
+    dedupe_customers(cursor)
+    # Después del enlace masivo: crearlo antes haría mantener el índice fila a fila
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_reservations_customer
+    ON reservations (customer_id, reservation_date)
+    ''')
+
+def _migration_customer_archived_visits(cursor):
+    # Reservas del cliente ya movidas al archivo y la fecha de la última: el directorio
+    # las suma sin abrir los meses archivados. Los ficheros existentes se cuentan al
+    # ponerlos al día (migrate_archives)
+    cursor.execute("ALTER TABLE customers ADD COLUMN archived_reservations INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("ALTER TABLE customers ADD COLUMN archived_last_visit TEXT")
+
+def _migration_recurring_customers(cursor):
+    # Las reservas fijas también dan de alta a su cliente. Las existentes se enlazan como
+    # en dedupe_customers: un cliente nuevo por clave (nombre de su regla más reciente)
+    # sin renombrar a los que ya existían
+    cursor.execute("ALTER TABLE recurring_reservations ADD COLUMN customer_id INTEGER REFERENCES customers (id)")
+    cursor.connection.create_function('normalize_phone', 1, normalize_phone, deterministic=True)
+    cursor.execute('''
+    INSERT INTO customers (name, phone, phone_key)
+    SELECT name, phone, phone_key FROM (
+        SELECT COALESCE(customer_name, '') AS name, customer_phone AS phone, phone_key,
+            ROW_NUMBER() OVER (PARTITION BY phone_key ORDER BY id DESC) AS position
+        FROM (SELECT *, normalize_phone(customer_phone) AS phone_key FROM recurring_reservations)
+        WHERE phone_key IS NOT NULL
+    ) WHERE position = 1
+    ORDER BY phone_key
+    ON CONFLICT (phone_key) DO NOTHING
+    ''')
+    cursor.execute('''
+    UPDATE recurring_reservations SET customer_id = c.id
+    FROM customers c WHERE c.phone_key = normalize_phone(recurring_reservations.customer_phone)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_recurring_customer
+    ON recurring_reservations (customer_id, status)
+    ''')
+
+MIGRATIONS = [
+    _migration_reservation_indexes,
+    _migration_combinable_tables,
+    _migration_catalog_version,
+    _migration_reservation_day_versions,
+    _migration_reservations_version,
+    _migration_integer_times,
+    _migration_recurring_reservations,
+    _migration_waitlist,
+    _migration_rollups,
+    _migration_customers,
+    _migration_customer_archived_visits,
+    _migration_recurring_customers,
+]
+
+def migrate_db(conn):
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    version = cursor.fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        migration(cursor)
+        cursor.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+    if version < len(MIGRATIONS):
+        cursor.execute("ANALYZE")
 
 # Inicializar la base de datos
 def init_db():
-    conn = sqlite3.connect('restaurant.db')
+    conn = get_db()
+    # WAL es persistente en el fichero: los lectores ya no esperan a los escritores
+    conn.execute("PRAGMA journal_mode = WAL")
     cursor = conn.cursor()
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS tables (
@@ -35,6 +815,10 @@ def init_db():
     )
     ''')
     
+    conn.commit()
+    migrate_db(conn)
+    migrate_archives()
+    
     # Verificar si ya hay mesas en la base de datos
     cursor.execute("SELECT COUNT(*) FROM tables")
     count = cursor.fetchone()[0]
@@ -42,81 +826,883 @@ def init_db():
     if count == 0:
         # Insertar algunas mesas de ejemplo
         tables = [
-            (1, 4, 'Ventana'),
-            (2, 2, 'Bar'),
-            (3, 6, 'Jardin'),
-            (4, 8, 'Area privada'),
-            (5, 4, 'Area principal'),
+            (1, 4, 'Ventana', 0),
+            (2, 2, 'Bar', 0),
+            (3, 6, 'Jardin', 1),
+            (4, 8, 'Area privada', 1),
+            (5, 4, 'Area principal', 0),
         ]
-        cursor.executemany("INSERT INTO tables (number, capacity, location) VALUES (?, ?, ?)", tables)
+        cursor.executemany("INSERT INTO tables (number, capacity, location, combinable) VALUES (?, ?, ?, ?)", tables)
+        # Las mesas 3 y 4 pueden juntarse
+        cursor.execute('''
+        INSERT INTO table_adjacency (table_id, adjacent_table_id)
+        SELECT a.id, b.id FROM tables a, tables b
+        WHERE (a.number = 3 AND b.number = 4) OR (a.number = 4 AND b.number = 3)
+        ''')
     
     conn.commit()
-    conn.close()
+    conn.execute("PRAGMA optimize")
 
 def reset_db():
-    conn = sqlite3.connect('restaurant.db')
+    conn = get_db()
     cursor = conn.cursor()
+    cursor.execute("DROP VIEW IF EXISTS table_bookings")
+    cursor.execute("DROP VIEW IF EXISTS reservations_hhmm")
+    cursor.execute("DROP TABLE IF EXISTS reservation_tables")
+    cursor.execute("DROP TABLE IF EXISTS table_adjacency")
     cursor.execute("DROP TABLE IF EXISTS reservations")
     cursor.execute("DROP TABLE IF EXISTS tables")
+    cursor.execute("DROP TABLE IF EXISTS catalog_meta")
+    cursor.execute("DROP TABLE IF EXISTS reservation_day_versions")
+    cursor.execute("DROP TABLE IF EXISTS recurring_reservations")
+    cursor.execute("DROP TABLE IF EXISTS recurring_exceptions")
+    cursor.execute("DROP TABLE IF EXISTS waitlist")
+    cursor.execute("DROP TABLE IF EXISTS rollup_daily")
+    cursor.execute("DROP TABLE IF EXISTS rollup_hourly")
+    cursor.execute("DROP TABLE IF EXISTS rollup_hours")
+    cursor.execute("DROP TABLE IF EXISTS customers_fts")
+    cursor.execute("DROP TABLE IF EXISTS customers")
+    cursor.execute("PRAGMA user_version = 0")
     conn.commit()
-    conn.close()
+    get_availability_index().clear()
+    # Los contadores vuelven a empezar: una versión antigua podría coincidir con la nueva
+    get_table_catalog().clear()
+    get_recurring_index().clear()
+    get_waitlist_index().clear()
+    get_response_cache().clear()
+    # Los meses archivados pertenecen a la base de datos que se acaba de borrar
+    for month in archived_months():
+        os.remove(archive_path(month))
     init_db()
 
-# Patrón Flyweight - Gestor de mesas
-class TableManager:
-    _tables = {}
+# Único analizador de horas: 'HH:MM' (también 'H:MM' y 'HH:MM:SS') y 'HH:MM AM/PM',
+# a minutos desde medianoche. Las horas distintas son pocas, así que se cachean
+@lru_cache(maxsize=4096)
+def time_to_minutes(value):
+    text = value.strip().upper()
+    meridiem = None
+    if text.endswith(('AM', 'PM')):
+        text, meridiem = text[:-2].rstrip(), text[-2:]
+    parts = text.split(':')
+    if len(parts) not in (2, 3) or not all(part.isdigit() for part in parts):
+        raise ValueError(f'Hora no válida: {value}')
+    hours, minutes = int(parts[0]), int(parts[1])
+    if meridiem is not None:
+        if not 1 <= hours <= 12:
+            raise ValueError(f'Hora no válida: {value}')
+        hours = hours % 12 + (12 if meridiem == 'PM' else 0)
+    if hours > 23 or minutes > 59:
+        raise ValueError(f'Hora no válida: {value}')
+    return hours * 60 + minutes
+
+# Fechas recibidas del cliente: solo 'AAAA-MM-DD' real. Se comprueban al entrar en
+# cada ruta; los índices y consultas de más abajo dan la fecha por buena
+def check_date(value):
+    try:
+        valid = date.fromisoformat(value).isoformat() == value
+    except (TypeError, ValueError):
+        valid = False
+    if not valid:
+        raise ValueError(f'Fecha no válida: {value}')
+    return value
+
+# Las 1440 horas del día ya formateadas: formatear un listado es indexar una tupla
+TIME_LABELS = tuple(f'{minute // 60:02d}:{minute % 60:02d}' for minute in range(24 * 60))
+TIME_LABELS_12H = tuple(f'{(minute // 60 - 1) % 12 + 1:02d}:{minute % 60:02d} {"AM" if minute < 12 * 60 else "PM"}'
+                        for minute in range(24 * 60))
+
+# Línea de tiempo de una mesa en una fecha: intervalos ordenados por inicio
+class TableTimeline:
+    def __init__(self, intervals=()):
+        self.intervals = sorted(intervals)
+        self._reindex()
+    
+    def _reindex(self):
+        self._starts = [start for start, _, _ in self.intervals]
+        # Máximo acumulado de las horas de fin, para responder solapes con una búsqueda binaria
+        self._max_ends = []
+        max_end = -1
+        for _, end, _ in self.intervals:
+            max_end = max(max_end, end)
+            self._max_ends.append(max_end)
+    
+    def add(self, start_time, end_time, reservation_id):
+        insort(self.intervals, (start_time, end_time, reservation_id))
+        self._reindex()
+    
+    def remove(self, reservation_id):
+        self.intervals = [interval for interval in self.intervals if interval[2] != reservation_id]
+        self._reindex()
+    
+    def overlaps(self, start_time, end_time):
+        # Solo pueden solapar los intervalos que empiezan antes de end_time
+        candidates = bisect_left(self._starts, end_time)
+        return candidates > 0 and self._max_ends[candidates - 1] > start_time
+    
+    def gap_around(self, start_time, end_time):
+        # Minutos libres que quedarían antes y después del intervalo en esta mesa
+        previous = bisect_left(self._starts, start_time)
+        previous_end = self._max_ends[previous - 1] if previous else time_to_minutes(app.config['OPENING_TIME'])
+        following = bisect_left(self._starts, end_time)
+        next_start = (self._starts[following] if following < len(self._starts)
+                      else time_to_minutes(app.config['CLOSING_TIME']))
+        return start_time - previous_end + next_start - end_time
+
+def first_free_start(intervals, first, last, duration, step):
+    # Primera hora first + k·step (hasta last) en la que caben 'duration' minutos sin
+    # solapar ninguno de los intervalos, o None. Una sola pasada por los intervalos
+    candidate = first
+    for start, end, _ in sorted(intervals):
+        if candidate + duration <= start:
+            break
+        if end > candidate:
+            candidate = first + -(-(end - first) // step) * step
+            if candidate > last:
+                return None
+    return candidate if candidate <= last else None
+
+def get_day_version(cursor, reservation_date):
+    # Las reservas fijas cambian muchas fechas a la vez: su contador se suma al del día.
+    # Los dos solo crecen, así que la suma cambia en cuanto cambia cualquiera de ellos
+    cursor.execute('''
+    SELECT COALESCE((SELECT version FROM reservation_day_versions WHERE reservation_date = ?), 0)
+        + (SELECT version FROM catalog_meta WHERE key = 'recurring')
+    ''', (reservation_date,))
+    return cursor.fetchone()[0]
+
+def load_booking(cursor, reservation_id):
+    # Fecha, horario y mesas que ocupa una reserva confirmada, o None
+    cursor.execute('''
+    SELECT reservation_date, start_minute, end_minute, table_id FROM table_bookings
+    WHERE id = ? AND status = 'confirmed'
+    ''', (reservation_id,))
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    reservation_date, start_time, end_time, _ = rows[0]
+    return reservation_date, start_time, end_time, sorted(row[3] for row in rows)
+
+def load_day_timelines(cursor, reservation_date):
+    day = load_range_intervals(cursor, reservation_date, reservation_date).get(reservation_date, {})
+    return {table_id: TableTimeline(table_intervals) for table_id, table_intervals in day.items()}
+
+def load_range_intervals(cursor, first, last):
+    # Intervalos ocupados de todas las fechas del tramo con una sola consulta:
+    # {fecha: {mesa: [(inicio, fin, id)]}}; las fechas sin reservas no aparecen
+    cursor.execute('''
+    SELECT reservation_date, id, table_id, start_minute, end_minute FROM table_bookings
+    WHERE reservation_date BETWEEN ? AND ? AND status = 'confirmed'
+    ''', (first, last))
+    intervals = {}
+    for reservation_date, reservation_id, table_id, start_time, end_time in cursor.fetchall():
+        intervals.setdefault(reservation_date, {}).setdefault(table_id, []).append(
+            (start_time, end_time, reservation_id))
+    # Las reservas fijas entran con el id de su regla en negativo
+    for reservation_date, standing in get_recurring_index().occurrences_between(first, last):
+        intervals.setdefault(reservation_date, {}).setdefault(standing.table_id, []).append(
+            (standing.start_minute, standing.end_minute, -standing.id))
+    return intervals
+
+# Índice en memoria de reservas confirmadas por (mesa, fecha), con carga
+# perezosa por fecha y expulsión LRU de las fechas menos consultadas
+class AvailabilityIndex:
+    def __init__(self, max_dates):
+        self.max_dates = max_dates
+        self._dates = OrderedDict()
+        self._versions = {}
+        self._locations = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+    
+    def _timelines(self, reservation_date):
+        version = None
+        if app.config['AVAILABILITY_INDEX_REVALIDATE']:
+            # Otro proceso pudo cambiar la fecha: se descarta si su versión ya no coincide.
+            # Las escrituras propias también la cambian y provocan una recarga, nunca un error
+            version = get_day_version(get_db().cursor(), reservation_date)
+            if self._versions.get(reservation_date) != version:
+                self._drop(reservation_date)
+        
+        timelines = self._dates.get(reservation_date)
+        if timelines is not None:
+            self._dates.move_to_end(reservation_date)
+            self.hits += 1
+            return timelines
+        
+        self.misses += 1
+        # Se carga bajo el bloqueo para no perder escrituras concurrentes. La versión se
+        # lee antes que las reservas: si hay cambios entre medias, la fecha se recargará
+        timelines = self._dates[reservation_date] = load_day_timelines(get_db().cursor(), reservation_date)
+        self._versions[reservation_date] = version
+        loaded = {}
+        for table_id, timeline in timelines.items():
+            for _, _, reservation_id in timeline.intervals:
+                # Las ocurrencias de reservas fijas no se editan una a una
+                if reservation_id < 0:
+                    continue
+                # Una reserva de grupo aparece en la línea de tiempo de cada una de sus mesas
+                loaded.setdefault(reservation_id, set()).add(table_id)
+        # Manda la fecha recién leída: si otro proceso movió la reserva, la entrada
+        # anterior apunta a otra fecha y mesas, y se sustituye en lugar de mezclarse
+        for reservation_id, table_ids in loaded.items():
+            self._locations[reservation_id] = (reservation_date, table_ids)
+        
+        while len(self._dates) > self.max_dates:
+            self._drop(next(iter(self._dates)))
+        return timelines
+    
+    def _drop(self, reservation_date):
+        timelines = self._dates.pop(reservation_date, {})
+        self._versions.pop(reservation_date, None)
+        for timeline in timelines.values():
+            for _, _, reservation_id in timeline.intervals:
+                # Solo si la entrada es de esta fecha: la reserva pudo moverse a otra ya cargada
+                location = self._locations.get(reservation_id)
+                if location is not None and location[0] == reservation_date:
+                    del self._locations[reservation_id]
+    
+    def day_intervals(self, reservation_date):
+        with self._lock:
+            timelines = self._timelines(reservation_date)
+            return {table_id: list(timeline.intervals) for table_id, timeline in timelines.items()}
+    
+    def busy_table_ids(self, reservation_date, start_time, end_time):
+        with self._lock:
+            timelines = self._timelines(reservation_date)
+            return {table_id for table_id, timeline in timelines.items()
+                    if timeline.overlaps(start_time, end_time)}
+    
+    def add(self, reservation_id, table_ids, reservation_date, start_time, end_time):
+        # Solo se mantienen las fechas ya cargadas; el resto se leerá de la base de datos
+        with self._lock:
+            timelines = self._dates.get(reservation_date)
+            if timelines is None or reservation_id in self._locations:
+                return
+            for table_id in table_ids:
+                timelines.setdefault(table_id, TableTimeline()).add(start_time, end_time, reservation_id)
+            self._locations[reservation_id] = (reservation_date, set(table_ids))
+    
+    def remove(self, reservation_id):
+        with self._lock:
+            location = self._locations.pop(reservation_id, None)
+            if location is None:
+                return
+            reservation_date, table_ids = location
+            # La fecha o la mesa pueden faltar si otro proceso cambió la reserva entre medias
+            timelines = self._dates.get(reservation_date)
+            if timelines is None:
+                return
+            for table_id in table_ids:
+                timeline = timelines.get(table_id)
+                if timeline is None:
+                    continue
+                timeline.remove(reservation_id)
+                if not timeline.intervals:
+                    del timelines[table_id]
+    
+    def invalidate(self, reservation_date):
+        # La fecha se volverá a cargar en la próxima consulta
+        with self._lock:
+            self._drop(reservation_date)
+    
+    def clear(self):
+        with self._lock:
+            self._dates.clear()
+            self._versions.clear()
+            self._locations.clear()
+
+_indexes = {}
+
+def get_availability_index():
+    database = get_database()
+    with _registry_lock:
+        index = _indexes.get(database)
+        if index is None:
+            index = _indexes[database] = AvailabilityIndex(app.config['AVAILABILITY_INDEX_DATES'])
+    return index
+
+# Clase Table para el patrón Flyweight: una única instancia por mesa y versión del catálogo
+class Table:
+    __slots__ = ('id', 'number', 'capacity', 'location', 'combinable')
+    
+    def __init__(self, table_id, number, capacity, location, combinable=False):
+        self.id = table_id
+        self.number = number
+        self.capacity = capacity
+        self.location = location
+        self.combinable = combinable
+    
+    def __str__(self):
+        return f"Mesa #{self.number} (Capacidad: {self.capacity}, Ubicación: {self.location})"
+
+# Foto inmutable del catálogo: mesas ordenadas por id, acceso por id y adyacencias combinables
+CatalogSnapshot = namedtuple('CatalogSnapshot', ['version', 'tables', 'by_id', 'adjacency'])
+
+# Catálogo de mesas en memoria, cargado una vez por versión de catalog_meta
+class TableCatalog:
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
     
     @staticmethod
-    def get_table(table_id, number, capacity, location):
-        key = f"{table_id}_{number}_{capacity}_{location}"
-        if key not in TableManager._tables:
-            TableManager._tables[key] = Table(table_id, number, capacity, location)
-        return TableManager._tables[key]
+    def _load(cursor, version):
+        cursor.execute("SELECT id, number, capacity, location, combinable FROM tables ORDER BY id")
+        tables = tuple(Table(table_id, number, capacity, location, bool(combinable))
+                       for table_id, number, capacity, location, combinable in cursor.fetchall())
+        by_id = {table.id: table for table in tables}
+        
+        cursor.execute("SELECT table_id, adjacent_table_id FROM table_adjacency")
+        adjacency = {}
+        for table_id, adjacent_table_id in cursor.fetchall():
+            if (table_id in by_id and adjacent_table_id in by_id
+                    and by_id[table_id].combinable and by_id[adjacent_table_id].combinable):
+                adjacency.setdefault(table_id, set()).add(adjacent_table_id)
+                adjacency.setdefault(adjacent_table_id, set()).add(table_id)
+        return CatalogSnapshot(version, tables, by_id, adjacency)
+    
+    def snapshot(self):
+        # Dentro de una petición el catálogo no cambia: se comprueba la versión una sola vez
+        if has_request_context() and 'table_catalog' in g:
+            return g.table_catalog
+        
+        cursor = get_db().cursor()
+        cursor.execute("SELECT version FROM catalog_meta WHERE key = 'tables'")
+        version = cursor.fetchone()[0]
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != version:
+                    # Las filas se leen después de la versión: como mucho son más nuevas
+                    # que ella, y entonces la siguiente comprobación vuelve a cargar
+                    snapshot = self._snapshot = self._load(cursor, version)
+                    self.misses += 1
+        else:
+            self.hits += 1
+        
+        if has_request_context():
+            g.table_catalog = snapshot
+        return snapshot
+    
+    def clear(self):
+        with self._lock:
+            self._snapshot = None
+
+_catalogs = {}
+
+def get_table_catalog():
+    database = get_database()
+    with _registry_lock:
+        catalog = _catalogs.get(database)
+        if catalog is None:
+            catalog = _catalogs[database] = TableCatalog()
+    return catalog
+
+# Regla de repetición al estilo RRULE (RFC 5545), con el subconjunto que usa el
+# restaurante: FREQ=DAILY|WEEKLY|MONTHLY, INTERVAL, BYDAY, BYMONTHDAY, UNTIL y COUNT
+class RecurrenceRule:
+    FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+    WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+    DAY_NAMES = ('lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo')
+    # COUNT solo se busca en estos años a partir de la fecha de inicio
+    COUNT_SEARCH_YEARS = 50
+    __slots__ = ('dtstart', 'freq', 'interval', 'weekdays', 'monthdays', 'until', 'count')
+    
+    def __init__(self, rrule, dtstart):
+        self.dtstart = dtstart if isinstance(dtstart, date) else date.fromisoformat(dtstart)
+        parts = {}
+        for part in filter(None, rrule.upper().replace(' ', '').split(';')):
+            key, _, value = part.partition('=')
+            parts[key] = value
+        try:
+            self.freq = parts.pop('FREQ', None)
+            self.interval = int(parts.pop('INTERVAL', 1))
+            weekdays = parts.pop('BYDAY', None)
+            monthdays = parts.pop('BYMONTHDAY', None)
+            self.weekdays = frozenset(self.WEEKDAYS.index(day) for day in weekdays.split(',')) if weekdays else None
+            self.monthdays = frozenset(int(day) for day in monthdays.split(',')) if monthdays else None
+            until = parts.pop('UNTIL', None)
+            self.until = datetime.strptime(until.replace('-', '')[:8], '%Y%m%d').date() if until else None
+            self.count = int(parts.pop('COUNT')) if 'COUNT' in parts else None
+        except ValueError:
+            raise ValueError(f'Regla de repetición no válida: {rrule}')
+        
+        if self.freq not in self.FREQUENCIES:
+            raise ValueError('La frecuencia debe ser DAILY, WEEKLY o MONTHLY.')
+        if parts or self.interval < 1 or (self.count is not None and (self.count < 1 or self.until)):
+            raise ValueError(f'Regla de repetición no válida: {rrule}')
+        if (self.weekdays and self.freq != 'WEEKLY') or (self.monthdays and self.freq != 'MONTHLY'):
+            raise ValueError('BYDAY solo se admite con WEEKLY y BYMONTHDAY con MONTHLY.')
+        if self.monthdays and not all(1 <= day <= 31 for day in self.monthdays):
+            raise ValueError('Los días del mes van del 1 al 31.')
+        if self.until is not None and self.until < self.dtstart:
+            raise ValueError('La fecha final de la repetición es anterior a la de inicio.')
+        # Sin días explícitos se repite el día de la semana o del mes de la fecha de inicio
+        if self.freq == 'WEEKLY' and not self.weekdays:
+            self.weekdays = frozenset([self.dtstart.weekday()])
+        if self.freq == 'MONTHLY' and not self.monthdays:
+            self.monthdays = frozenset([self.dtstart.day])
+        if self.count is not None:
+            # COUNT se traduce una vez a la fecha de la última ocurrencia
+            self.until = self._count_until()
+            if self.until is None:
+                raise ValueError(f'La regla de repetición no tiene suficientes ocurrencias: {rrule}')
+    
+    def _candidates(self, last_year):
+        # Fechas que puede generar la regla hasta last_year, en orden y saltando de periodo
+        # en periodo (INTERVAL días, semanas o meses); pueden empezar antes de dtstart
+        if self.freq == 'DAILY':
+            day = self.dtstart
+            while day.year <= last_year:
+                yield day
+                day += timedelta(days=self.interval)
+        elif self.freq == 'WEEKLY':
+            monday = self.dtstart - timedelta(days=self.dtstart.weekday())
+            while monday.year <= last_year:
+                for weekday in sorted(self.weekdays):
+                    yield monday + timedelta(days=weekday)
+                monday += timedelta(weeks=self.interval)
+        else:
+            months = self.dtstart.year * 12 + self.dtstart.month - 1
+            while months // 12 <= last_year:
+                year, month = divmod(months, 12)
+                # Un día 31 no existe en los meses más cortos: ese mes no hay ocurrencia
+                length = calendar.monthrange(year, month + 1)[1]
+                for day in sorted(self.monthdays):
+                    if day <= length:
+                        yield date(year, month + 1, day)
+                months += self.interval
+    
+    def _count_until(self):
+        # Fecha de la ocurrencia número COUNT, o None si no llega en COUNT_SEARCH_YEARS
+        # (p. ej. el día 30 cada 12 meses empezando en febrero)
+        found = 0
+        try:
+            for day in self._candidates(min(self.dtstart.year + self.COUNT_SEARCH_YEARS, date.max.year)):
+                if day >= self.dtstart:
+                    found += 1
+                    if found == self.count:
+                        return day
+        except OverflowError:
+            # Fuera del calendario (año 9999)
+            pass
+        return None
+    
+    def occurs_on(self, day):
+        if day < self.dtstart or (self.until is not None and day > self.until):
+            return False
+        if self.freq == 'DAILY':
+            return (day - self.dtstart).days % self.interval == 0
+        if self.freq == 'WEEKLY':
+            # Semanas contadas desde el lunes de la semana de inicio
+            weeks = ((day - self.dtstart).days + self.dtstart.weekday()) // 7
+            return day.weekday() in self.weekdays and weeks % self.interval == 0
+        months = (day.year - self.dtstart.year) * 12 + day.month - self.dtstart.month
+        return day.day in self.monthdays and months % self.interval == 0
+    
+    def possible_weekdays(self):
+        return self.weekdays if self.freq == 'WEEKLY' else range(7)
+    
+    def __str__(self):
+        parts = [f'FREQ={self.freq}']
+        if self.interval != 1:
+            parts.append(f'INTERVAL={self.interval}')
+        if self.freq == 'WEEKLY':
+            parts.append('BYDAY=' + ','.join(self.WEEKDAYS[day] for day in sorted(self.weekdays)))
+        if self.freq == 'MONTHLY':
+            parts.append('BYMONTHDAY=' + ','.join(str(day) for day in sorted(self.monthdays)))
+        if self.count is not None:
+            parts.append(f'COUNT={self.count}')
+        elif self.until is not None:
+            parts.append(f'UNTIL={self.until:%Y%m%d}')
+        return ';'.join(parts)
+    
+    def describe(self):
+        unit = {'DAILY': ('día', 'días'), 'WEEKLY': ('semana', 'semanas'), 'MONTHLY': ('mes', 'meses')}[self.freq]
+        text = f'Cada {unit[0]}' if self.interval == 1 else f'Cada {self.interval} {unit[1]}'
+        if self.freq == 'WEEKLY':
+            text += ': ' + ', '.join(self.DAY_NAMES[day] for day in sorted(self.weekdays))
+        elif self.freq == 'MONTHLY':
+            text += ', día ' + ', '.join(str(day) for day in sorted(self.monthdays))
+        if self.until is not None:
+            text += f' hasta el {self.until.isoformat()}'
+        return text
+
+StandingReservation = namedtuple('StandingReservation', [
+    'id', 'customer_name', 'customer_phone', 'table_id', 'start_minute', 'end_minute', 'guests', 'type', 'rule'])
+# Foto inmutable de las reservas fijas activas, repartidas por día de la semana
+RecurringSnapshot = namedtuple('RecurringSnapshot', ['version', 'rules', 'by_weekday', 'exceptions'])
+
+# Reglas de reservas fijas en memoria, cargadas una vez por versión como el catálogo de
+# mesas. Para una fecha solo se evalúan las reglas que pueden caer en su día de la semana
+class RecurringIndex:
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
     
     @staticmethod
-    def get_all_tables():
-        conn = sqlite3.connect('restaurant.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, number, capacity, location FROM tables")
-        tables_data = cursor.fetchall()
-        conn.close()
+    def _load(cursor, version):
+        cursor.execute('''
+        SELECT id, customer_name, customer_phone, table_id, start_minute, end_minute, guests, type, dtstart, rrule
+        FROM recurring_reservations WHERE status = 'active' ORDER BY id
+        ''')
+        rules = tuple(StandingReservation(*tuple(row)[:8], RecurrenceRule(row['rrule'], row['dtstart']))
+                      for row in cursor.fetchall())
+        by_weekday = [[] for _ in range(7)]
+        for standing in rules:
+            for weekday in standing.rule.possible_weekdays():
+                by_weekday[weekday].append(standing)
+        cursor.execute("SELECT rule_id, reservation_date FROM recurring_exceptions")
+        exceptions = frozenset((rule_id, reservation_date) for rule_id, reservation_date in cursor.fetchall())
+        return RecurringSnapshot(version, rules, tuple(tuple(day) for day in by_weekday), exceptions)
+    
+    def snapshot(self):
+        if has_request_context() and 'recurring_rules' in g:
+            return g.recurring_rules
         
-        tables = []
-        for table_data in tables_data:
-            table_id, number, capacity, location = table_data
-            table = TableManager.get_table(table_id, number, capacity, location)
-            tables.append(table)
+        cursor = get_db().cursor()
+        cursor.execute("SELECT version FROM catalog_meta WHERE key = 'recurring'")
+        version = cursor.fetchone()[0]
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != version:
+                    snapshot = self._snapshot = self._load(cursor, version)
+                    self.misses += 1
+        else:
+            self.hits += 1
         
-        return tables
+        if has_request_context():
+            g.recurring_rules = snapshot
+        return snapshot
+    
+    def occurrences_on(self, reservation_date):
+        snapshot = self.snapshot()
+        if not snapshot.rules:
+            return []
+        day = date.fromisoformat(reservation_date)
+        return [standing for standing in snapshot.by_weekday[day.weekday()]
+                if standing.rule.occurs_on(day) and (standing.id, reservation_date) not in snapshot.exceptions]
+    
+    def occurrences_between(self, first, last):
+        # [(fecha, reserva fija)] en orden de fecha; sin primera fecha, desde la regla más antigua
+        snapshot = self.snapshot()
+        if not snapshot.rules:
+            return []
+        earliest = min(standing.rule.dtstart for standing in snapshot.rules)
+        day = max(date.fromisoformat(first), earliest) if first else earliest
+        last = date.fromisoformat(last)
+        occurrences = []
+        while day <= last:
+            reservation_date = day.isoformat()
+            occurrences.extend((reservation_date, standing) for standing in snapshot.by_weekday[day.weekday()]
+                               if standing.rule.occurs_on(day)
+                               and (standing.id, reservation_date) not in snapshot.exceptions)
+            day += timedelta(days=1)
+        return occurrences
+    
+    def busy_table_ids(self, reservation_date, start_time, end_time):
+        return {standing.table_id for standing in self.occurrences_on(reservation_date)
+                if standing.start_minute < end_time and standing.end_minute > start_time}
+    
+    def clear(self):
+        with self._lock:
+            self._snapshot = None
+
+_recurring_indexes = {}
+
+def get_recurring_index():
+    database = get_database()
+    with _registry_lock:
+        index = _recurring_indexes.get(database)
+        if index is None:
+            index = _recurring_indexes[database] = RecurringIndex()
+    return index
+
+# Lista de espera en memoria, por fecha y número de personas
+WaitlistEntry = namedtuple('WaitlistEntry', ('id', 'customer_name', 'customer_phone', 'reservation_date',
+                                             'window_start', 'window_end', 'duration', 'guests', 'type',
+                                             'auto_book'))
+WAITLIST_COLUMNS = ', '.join(WaitlistEntry._fields)
+
+class WaitlistBucket:
+    # Peticiones de un mismo número de personas, ordenadas por el inicio de su ventana
+    __slots__ = ('entries', 'max_span')
+    
+    def __init__(self):
+        self.entries = []
+        self.max_span = 0
+    
+    def position(self, entry):
+        position = bisect_left(self.entries, (entry.window_start, entry.id))
+        if position < len(self.entries) and self.entries[position][1] == entry.id:
+            return position
+        return None
+
+class WaitlistIndex:
+    # Para un hueco libre solo se miran los grupos de personas que caben en la mesa y, en
+    # cada uno, las peticiones cuya ventana empieza entre el inicio del hueco menos la
+    # ventana más larga del grupo y el final del hueco: dos búsquedas binarias, sin
+    # recorrer la lista entera aunque una noche tenga miles de peticiones
+    def __init__(self):
+        self._dates = {}
+        self._versions = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+    
+    def _buckets(self, cursor, reservation_date):
+        version = None
+        if app.config['AVAILABILITY_INDEX_REVALIDATE']:
+            # Como en AvailabilityIndex: otro proceso pudo cambiar la lista de espera
+            cursor.execute("SELECT version FROM catalog_meta WHERE key = 'waitlist'")
+            version = cursor.fetchone()[0]
+            if self._versions.get(reservation_date) != version:
+                self._dates.pop(reservation_date, None)
+        
+        buckets = self._dates.get(reservation_date)
+        if buckets is not None:
+            self.hits += 1
+            return buckets
+        
+        self.misses += 1
+        cursor.execute(f'''
+        SELECT {WAITLIST_COLUMNS} FROM waitlist
+        WHERE reservation_date = ? AND status = 'waiting'
+        ''', (reservation_date,))
+        buckets = self._dates[reservation_date] = {}
+        self._versions[reservation_date] = version
+        for row in cursor.fetchall():
+            self._insert(buckets, WaitlistEntry(*row))
+        return buckets
     
     @staticmethod
-    def is_table_available(table_id, reservation_date, start_time, end_time):
-        conn = sqlite3.connect('restaurant.db')
+    def _insert(buckets, entry):
+        bucket = buckets.get(entry.guests)
+        if bucket is None:
+            bucket = buckets[entry.guests] = WaitlistBucket()
+        if bucket.position(entry) is None:
+            insort(bucket.entries, (entry.window_start, entry.id, entry))
+            bucket.max_span = max(bucket.max_span, entry.window_end - entry.window_start)
+    
+    def add(self, entry):
+        # Solo se mantienen las fechas ya cargadas; el resto se leerá de la base de datos
+        with self._lock:
+            buckets = self._dates.get(entry.reservation_date)
+            if buckets is not None:
+                self._insert(buckets, entry)
+    
+    def remove(self, entry):
+        with self._lock:
+            bucket = self._dates.get(entry.reservation_date, {}).get(entry.guests)
+            position = bucket.position(entry) if bucket else None
+            if position is not None:
+                del bucket.entries[position]
+    
+    def match(self, cursor, reservation_date, capacity, gap_start, gap_end, exclude=()):
+        # La petición que mejor aprovecha una mesa de 'capacity' plazas libre entre
+        # gap_start y gap_end: la de más personas que quepa; dentro de ese grupo, la que
+        # puede empezar justo al inicio del hueco con la ventana más cercana y, si no hay,
+        # la primera que empieza después. A igual ventana, la más antigua. Cada búsqueda se
+        # detiene en la primera que encaja. Devuelve (petición, hora de inicio) o None
+        def fits(item, start):
+            entry = item[2]
+            return entry.id not in exclude and start + entry.duration <= min(gap_end, entry.window_end)
+        
+        with self._lock:
+            buckets = self._buckets(cursor, reservation_date)
+            for guests in sorted((guests for guests in buckets if guests <= capacity), reverse=True):
+                bucket = buckets[guests]
+                entries = bucket.entries
+                low = bisect_left(entries, (gap_start - bucket.max_span,))
+                middle = bisect_left(entries, (gap_start + 1,))
+                high = bisect_left(entries, (gap_end,))
+                # Ventanas abiertas antes del hueco: de la más cercana hacia atrás
+                for position in range(middle - 1, low - 1, -1):
+                    if fits(entries[position], gap_start):
+                        # La más antigua entre las de la misma hora de inicio
+                        first = bisect_left(entries, (entries[position][0],))
+                        for item in entries[first:position + 1]:
+                            if fits(item, gap_start):
+                                return item[2], gap_start
+                # Ventanas que empiezan dentro del hueco, de la primera en adelante
+                for position in range(middle, high):
+                    item = entries[position]
+                    if fits(item, item[0]):
+                        return item[2], item[0]
+        return None
+    
+    def clear(self):
+        with self._lock:
+            self._dates.clear()
+            self._versions.clear()
+
+_waitlist_indexes = {}
+
+def get_waitlist_index():
+    database = get_database()
+    with _registry_lock:
+        index = _waitlist_indexes.get(database)
+        if index is None:
+            index = _waitlist_indexes[database] = WaitlistIndex()
+    return index
+
+# Patrón Observer - Bus de publicación/suscripción de cambios de disponibilidad por fecha
+class AvailabilityBus:
+    def __init__(self, max_subscribers):
+        self.max_subscribers = max_subscribers
+        self._subscribers = {}
+        self._count = 0
+        self._lock = threading.Lock()
+    
+    def subscribe(self, reservation_date):
+        # None si ya hay demasiados suscriptores: el cliente puede seguir consultando
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            subscription = queue.SimpleQueue()
+            self._subscribers.setdefault(reservation_date, set()).add(subscription)
+            self._count += 1
+        return subscription
+    
+    def unsubscribe(self, reservation_date, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(reservation_date)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[reservation_date]
+            self._count -= 1
+    
+    def publish(self, reservation_date, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(reservation_date, ()))
+        for subscription in subscribers:
+            subscription.put((event, data))
+    
+    def publish_all(self, event, data):
+        # Para los cambios que afectan a cualquier fecha, como las reservas fijas
+        with self._lock:
+            subscribers = [subscription for day in self._subscribers.values() for subscription in day]
+        for subscription in subscribers:
+            subscription.put((event, data))
+
+_buses = {}
+
+def get_availability_bus():
+    database = get_database()
+    with _registry_lock:
+        bus = _buses.get(database)
+        if bus is None:
+            bus = _buses[database] = AvailabilityBus(app.config['AVAILABILITY_EVENTS_MAX_SUBSCRIBERS'])
+    return bus
+
+def publish_booking(event, reservation_id, reservation_date, start_minute, end_minute, table_ids):
+    # 'booked' o 'released': las mesas de una reserva se ocupan o quedan libres en ese horario
+    get_availability_bus().publish(reservation_date, event, {
+        'reservation_id': reservation_id,
+        'tables': list(table_ids),
+        'start_time': TIME_LABELS[start_minute],
+        'end_time': TIME_LABELS[end_minute],
+    })
+
+# Patrón Flyweight - Gestor de mesas
+class TableManager:
+    @staticmethod
+    def get_table(table_id):
+        return get_table_catalog().snapshot().by_id.get(table_id)
+    
+    @staticmethod
+    def get_all_tables():
+        return list(get_table_catalog().snapshot().tables)
+    
+    @staticmethod
+    def get_capacity(table_ids):
+        # Capacidad conjunta de una o varias mesas; None si ninguna existe
+        by_id = get_table_catalog().snapshot().by_id
+        tables = [by_id[table_id] for table_id in table_ids if table_id in by_id]
+        return sum(table.capacity for table in tables) if tables else None
+    
+    @staticmethod
+    def is_table_available(table_id, reservation_date, start_time, end_time, exclude_reservation_id=None):
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute('''
-        SELECT COUNT(*) FROM reservations
+        SELECT COUNT(*) FROM table_bookings
         WHERE table_id = ? 
         AND reservation_date = ?
         AND status = 'confirmed'
+        AND id IS NOT ?
         AND (
-            (? < end_time AND ? > start_time)
+            (? < end_minute AND ? > start_minute)
         )
-        ''', (table_id, reservation_date, start_time, end_time))
+        ''', (table_id, reservation_date, exclude_reservation_id, start_time, end_time))
         count = cursor.fetchone()[0]
-        conn.close()
-        print(f"Checking table {table_id} on {reservation_date} from {start_time} to {end_time}: {'available' if count == 0 else 'unavailable'}")
-        return count == 0
-
-# Clase Table para el patrón Flyweight
-class Table:
-    def __init__(self, table_id, number, capacity, location):
-        self.id = table_id
-        self.number = number
-        self.capacity = capacity
-        self.location = location
+        available = count == 0 and table_id not in get_recurring_index().busy_table_ids(
+            reservation_date, start_time, end_time)
+        app.logger.debug("table_check table=%s date=%s start=%s end=%s available=%s", table_id,
+                         reservation_date, TIME_LABELS[start_time], TIME_LABELS[end_time], available)
+        return available
     
-    def __str__(self):
-        return f"Mesa #{self.number} (Capacidad: {self.capacity}, Ubicación: {self.location})"
+    @staticmethod
+    def get_busy_table_ids(reservation_date, start_time, end_time):
+        if app.config['AVAILABILITY_INDEX']:
+            return get_availability_index().busy_table_ids(reservation_date, start_time, end_time)
+        
+        # Una sola consulta: las mesas con alguna reserva confirmada que se solape;
+        # los datos de las mesas salen del catálogo
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT DISTINCT table_id FROM table_bookings
+        WHERE reservation_date = ?
+        AND status = 'confirmed'
+        AND (? < end_minute AND ? > start_minute)
+        ''', (reservation_date, start_time, end_time))
+        busy = {table_id for table_id, in cursor.fetchall()}
+        return busy | get_recurring_index().busy_table_ids(reservation_date, start_time, end_time)
+    
+    @staticmethod
+    def get_tables_availability(reservation_date, start_time, end_time):
+        busy = TableManager.get_busy_table_ids(reservation_date, start_time, end_time)
+        return [(table, table.id not in busy) for table in TableManager.get_all_tables()]
+    
+    @staticmethod
+    def get_available_tables(reservation_date, start_time, end_time):
+        busy = TableManager.get_busy_table_ids(reservation_date, start_time, end_time)
+        return [table for table in TableManager.get_all_tables() if table.id not in busy]
+    
+    @staticmethod
+    def get_availability_grid(reservation_date, granularity):
+        # Un bit por franja: bit i ocupado si alguna reserva confirmada pisa la franja i
+        opening = time_to_minutes(app.config['OPENING_TIME'])
+        closing = time_to_minutes(app.config['CLOSING_TIME'])
+        slot_count = -(-(closing - opening) // granularity)
+        
+        if app.config['AVAILABILITY_INDEX']:
+            day = get_availability_index().day_intervals(reservation_date)
+        else:
+            timelines = load_day_timelines(get_db().cursor(), reservation_date)
+            day = {table_id: timeline.intervals for table_id, timeline in timelines.items()}
+        
+        grid = []
+        for table in TableManager.get_all_tables():
+            busy = 0
+            for start_time, end_time, _ in day.get(table.id, ()):
+                first = max(0, (start_time - opening) // granularity)
+                last = min(slot_count, -(-(end_time - opening) // granularity))
+                if last > first:
+                    busy |= ((1 << (last - first)) - 1) << first
+            grid.append((table, format(busy, f'0{slot_count}b')[::-1]))
+        
+        return slot_count, grid
 
 # Patrón Abstract Factory - Fábricas de componentes del restaurante
 class RestaurantComponentFactory:
@@ -128,10 +1714,13 @@ class RestaurantComponentFactory:
     
     def create_staff(self):
         pass
+    
+    def preferred_locations(self):
+        return ()
 
 class StandardRestaurantFactory(RestaurantComponentFactory):
-    def create_table(self, table_id, number, capacity, location):
-        return TableManager.get_table(table_id, number, capacity, location)
+    def create_table(self, table_id):
+        return TableManager.get_table(table_id)
     
     def create_menu(self):
         return StandardMenu()
@@ -140,8 +1729,8 @@ class StandardRestaurantFactory(RestaurantComponentFactory):
         return StandardStaff()
 
 class VIPRestaurantFactory(RestaurantComponentFactory):
-    def create_table(self, table_id, number, capacity, location):
-        table = TableManager.get_table(table_id, number, capacity, location)
+    def create_table(self, table_id):
+        table = TableManager.get_table(table_id)
         return table
     
     def create_menu(self):
@@ -149,6 +1738,14 @@ class VIPRestaurantFactory(RestaurantComponentFactory):
     
     def create_staff(self):
         return VIPStaff()
+    
+    def preferred_locations(self):
+        return ('Area privada', 'Ventana', 'Jardin')
+
+def restaurant_factory_for(reservation_type):
+    if reservation_type == 'vip':
+        return VIPRestaurantFactory()
+    return StandardRestaurantFactory()
 
 # Clases de menú y personal para Abstract Factory
 class Menu:
@@ -223,80 +1820,1646 @@ class GroupReservationFactory(ReservationFactory):
         reservation.type = "group"
         return reservation
 
-# Clase Reservation
-class Reservation:
-    def __init__(self):
-        self.customer_name = None
-        self.customer_phone = None
-        self.table_id = None
-        self.reservation_date = None
-        self.start_time = None
-        self.end_time = None
-        self.guests = None
-        self.type = None
-        self.status = 'confirmed'
+# Clase Reservation
+class Reservation:
+    def __init__(self):
+        self.id = None
+        self.customer_name = None
+        self.customer_phone = None
+        self.table_id = None
+        self.joined_table_ids = []
+        self.reservation_date = None
+        self.start_time = None
+        self.end_time = None
+        self.start_minute = None
+        self.end_minute = None
+        self.guests = None
+        self.type = None
+        self.status = 'confirmed'
+        self.customer_id = None
+        # Peticiones de la lista de espera atendidas con lo que liberó la última modificación
+        self.waitlist_matches = []
+    
+    @property
+    def table_ids(self):
+        return [self.table_id] + list(self.joined_table_ids)
+    
+    def _normalize_times(self):
+        # Un solo análisis por reserva: minutos para guardar y comparar, 'HH:MM' para mostrar
+        self.start_minute = time_to_minutes(self.start_time)
+        self.end_minute = time_to_minutes(self.end_time)
+        self.start_time = TIME_LABELS[self.start_minute]
+        self.end_time = TIME_LABELS[self.end_minute]
+    
+    def save(self):
+        self._normalize_times()
+        # Comprobación e inserción en la misma transacción para evitar dobles reservas
+        run_write(self._insert)
+        
+        if self.status == 'confirmed':
+            get_availability_index().add(self.id, self.table_ids, self.reservation_date,
+                                         self.start_minute, self.end_minute)
+            publish_booking('booked', self.id, self.reservation_date, self.start_minute, self.end_minute,
+                            self.table_ids)
+    
+    def _insert(self, cursor):
+        # En las reservas de grupo se reservan todas las mesas o ninguna
+        for table_id in self.table_ids:
+            if not TableManager.is_table_available(table_id, self.reservation_date,
+                                                   self.start_minute, self.end_minute):
+                raise ValueError("Table is not available for the selected time slot")
+        
+        self.customer_id = upsert_customer(cursor, self.customer_name, self.customer_phone)
+        cursor.execute('''
+        INSERT INTO reservations 
+        (customer_name, customer_phone, table_id, reservation_date, start_minute, end_minute, guests, type, status,
+         customer_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (self.customer_name, self.customer_phone, self.table_id, self.reservation_date, 
+              self.start_minute, self.end_minute, self.guests, self.type, self.status, self.customer_id))
+        self.id = cursor.lastrowid
+        cursor.executemany("INSERT INTO reservation_tables (reservation_id, table_id) VALUES (?, ?)",
+                           [(self.id, table_id) for table_id in self.joined_table_ids])
+    
+    def update(self, reservation_id):
+        self._normalize_times()
+        previous = run_write(lambda cursor: self._update(cursor, reservation_id))
+        self.id = reservation_id
+        
+        index = get_availability_index()
+        index.remove(reservation_id)
+        if previous is not None:
+            publish_booking('released', reservation_id, *previous)
+        if self.status == 'confirmed':
+            index.add(reservation_id, self.table_ids, self.reservation_date, self.start_minute, self.end_minute)
+            publish_booking('booked', reservation_id, self.reservation_date, self.start_minute, self.end_minute,
+                            self.table_ids)
+        waitlist_matched(self.waitlist_matches)
+    
+    def _update(self, cursor, reservation_id):
+        # Comprueba la disponibilidad excluyendo esta reserva y la actualiza; devuelve lo
+        # que ocupaba antes (load_booking)
+        for table_id in self.table_ids:
+            if not TableManager.is_table_available(table_id, self.reservation_date,
+                                                   self.start_minute, self.end_minute,
+                                                   exclude_reservation_id=reservation_id):
+                raise ValueError('La mesa no está disponible para el horario seleccionado.')
+        
+        previous = load_booking(cursor, reservation_id)
+        self.customer_id = upsert_customer(cursor, self.customer_name, self.customer_phone)
+        cursor.execute('''
+        UPDATE reservations
+        SET customer_name = ?, customer_phone = ?, table_id = ?, reservation_date = ?,
+            start_minute = ?, end_minute = ?, guests = ?, type = ?, status = ?, customer_id = ?
+        WHERE id = ?
+        ''', (self.customer_name, self.customer_phone, self.table_id, self.reservation_date,
+              self.start_minute, self.end_minute, self.guests, self.type, self.status, self.customer_id,
+              reservation_id))
+        cursor.execute("DELETE FROM reservation_tables WHERE reservation_id = ?", (reservation_id,))
+        cursor.executemany("INSERT INTO reservation_tables (reservation_id, table_id) VALUES (?, ?)",
+                           [(reservation_id, table_id) for table_id in self.joined_table_ids])
+        # Lo que la reserva deja libre (otra hora, mesa o fecha, o menos tiempo) pasa a la lista de espera
+        if previous is not None:
+            current = ((self.reservation_date, self.start_minute, self.end_minute, self.table_ids)
+                       if self.status == 'confirmed' else None)
+            self.waitlist_matches = fill_from_waitlist(cursor, previous[0], freed_intervals(previous, current))
+        return previous
+    
+    def clone(self):
+        return copy.deepcopy(self)
+
+# Patrón Builder - Construcción paso a paso de reservas complejas
+class ReservationBuilder:
+    def __init__(self):
+        self.reservation = Reservation()
+    
+    def set_customer_info(self, name, phone):
+        self.reservation.customer_name = name
+        self.reservation.customer_phone = phone
+        return self
+    
+    def set_table(self, table_id):
+        self.reservation.table_id = table_id
+        return self
+    
+    def set_joined_tables(self, table_ids):
+        self.reservation.joined_table_ids = list(table_ids)
+        return self
+    
+    def set_date_time(self, date, start_time, end_time):
+        self.reservation.reservation_date = date
+        self.reservation.start_time = start_time
+        self.reservation.end_time = end_time
+        return self
+    
+    def set_guests(self, guests):
+        self.reservation.guests = guests
+        return self
+    
+    def set_type(self, reservation_type):
+        self.reservation.type = reservation_type
+        return self
+    
+    def set_status(self, status):
+        self.reservation.status = status
+        return self
+    
+    def build(self):
+        return self.reservation
+
+# Asignación automática de mesas: la mesa más pequeña que basta, con las
+# preferencias de ubicación de la fábrica del tipo de reserva
+class TableAllocator:
+    def __init__(self, reservation_date, timelines=None, tables=None):
+        self.reservation_date = reservation_date
+        # tables limita las mesas candidatas; por defecto, todas las del catálogo
+        tables = TableManager.get_all_tables() if tables is None else tables
+        self.tables = sorted(tables, key=lambda table: (table.capacity, table.id))
+        self._orders = {}
+        self._adjacency = None
+        if timelines is None:
+            if app.config['AVAILABILITY_INDEX']:
+                day = get_availability_index().day_intervals(reservation_date)
+                timelines = {table_id: TableTimeline(intervals) for table_id, intervals in day.items()}
+            else:
+                timelines = load_day_timelines(get_db().cursor(), reservation_date)
+        self.timelines = timelines
+    
+    def choose(self, guests, start_time, end_time, reservation_type='standard'):
+        idle_day = (start_time - time_to_minutes(app.config['OPENING_TIME'])
+                    + time_to_minutes(app.config['CLOSING_TIME']) - end_time)
+        best, best_gap, best_class = None, None, None
+        for table_class, table in self._order(restaurant_factory_for(reservation_type).preferred_locations()):
+            if table.capacity < guests:
+                continue
+            # Las mesas de una clase peor que la ya encontrada no pueden mejorarla
+            if best_class is not None and table_class != best_class:
+                break
+            timeline = self.timelines.get(table.id)
+            if timeline is not None and timeline.overlaps(start_time, end_time):
+                continue
+            # Entre mesas equivalentes, la que deja menos tiempo muerto alrededor
+            gap = timeline.gap_around(start_time, end_time) if timeline else idle_day
+            if best is None or gap < best_gap:
+                best, best_gap, best_class = table, gap, table_class
+                if gap == 0:
+                    break
+        return best
+    
+    def _order(self, preferred):
+        # Mesas ordenadas por (capacidad, preferencia de ubicación), calculado una vez por
+        # perfil: la ubicación solo decide entre mesas del mismo tamaño, nunca ocupa una
+        # mesa más grande de lo necesario
+        order = self._orders.get(preferred)
+        if order is None:
+            ranked = []
+            for table in self.tables:
+                rank = preferred.index(table.location) if table.location in preferred else len(preferred)
+                ranked.append(((table.capacity, rank), table))
+            # self.tables ya está ordenada por (capacidad, id) y sorted es estable
+            order = self._orders[preferred] = sorted(ranked, key=lambda item: item[0])
+        return order
+    
+    def _combinable_graph(self):
+        # Adyacencias entre mesas combinables, en ambos sentidos
+        if self._adjacency is None:
+            self._adjacency = get_table_catalog().snapshot().adjacency
+        return self._adjacency
+    
+    @staticmethod
+    def _connected_sets(nodes, adjacency, size):
+        # Enumera cada conjunto conexo de 'size' mesas exactamente una vez (algoritmo ESU):
+        # cada conjunto se genera solo desde su mesa de menor id
+        def extend(subset, extension, neighbourhood, seed):
+            if len(subset) == size:
+                yield subset
+                return
+            extension = set(extension)
+            while extension:
+                node = extension.pop()
+                exclusive = {n for n in adjacency[node] if n in nodes and n > seed and n not in neighbourhood}
+                yield from extend(subset | {node}, extension | exclusive, neighbourhood | exclusive, seed)
+        
+        for seed in nodes:
+            neighbours = {n for n in adjacency[seed] if n in nodes and n > seed}
+            yield from extend(frozenset([seed]), neighbours, neighbours | {seed}, seed)
+    
+    def choose_combination(self, guests, start_time, end_time):
+        # Mesas adyacentes libres que juntas alcanzan el número de personas: primero
+        # las combinaciones con menos mesas y, entre ellas, la de menos sillas sobrantes
+        adjacency = self._combinable_graph()
+        tables = {table.id: table for table in self.tables}
+        free = set()
+        for table_id in adjacency:
+            timeline = self.timelines.get(table_id)
+            if table_id in tables and (timeline is None or not timeline.overlaps(start_time, end_time)):
+                free.add(table_id)
+        
+        for size in range(2, app.config['MAX_COMBINED_TABLES'] + 1):
+            best, best_key = None, None
+            for combination in self._connected_sets(free, adjacency, size):
+                capacity = sum(tables[table_id].capacity for table_id in combination)
+                if capacity < guests:
+                    continue
+                key = (capacity, sorted(combination))
+                if best_key is None or key < best_key:
+                    best, best_key = combination, key
+            if best is not None:
+                # La mesa principal es la de mayor capacidad
+                return sorted((tables[table_id] for table_id in best), key=lambda table: (-table.capacity, table.id))
+        return None
+    
+    def assign(self, table, start_time, end_time, reservation_id=None):
+        self.timelines.setdefault(table.id, TableTimeline()).add(start_time, end_time, reservation_id)
+    
+    def optimize(self, reservations):
+        # Recoloca sobre las líneas de tiempo iniciales (lo que no se mueve): primero las
+        # reservas existentes por hora de inicio, después las peticiones pendientes de
+        # mayor a menor número de personas
+        existing = sorted((r for r in reservations if r.get('id') is not None),
+                          key=lambda r: (r['start_minute'], -r['guests']))
+        pending = sorted((r for r in reservations if r.get('id') is None),
+                         key=lambda r: (-r['guests'], r['start_minute']))
+        plan = []
+        for request_data in existing + pending:
+            table = self.choose(request_data['guests'], request_data['start_minute'], request_data['end_minute'],
+                                request_data.get('type') or 'standard')
+            if table is None:
+                if request_data.get('id') is not None:
+                    return None
+                plan.append((request_data, None))
+                continue
+            self.assign(table, request_data['start_minute'], request_data['end_minute'], request_data.get('id'))
+            plan.append((request_data, table))
+        return plan
+
+def optimize_day(reservation_date, pending=(), apply=False):
+    # Solo se toma el bloqueo de escritura si el plan se va a aplicar
+    with (write_transaction() if apply else nullcontext(get_db().cursor())) as cursor:
+        cursor.execute('''
+        SELECT id, table_id, guests, start_minute, end_minute, type,
+            EXISTS (SELECT 1 FROM reservation_tables rt WHERE rt.reservation_id = reservations.id) AS combined
+        FROM reservations
+        WHERE reservation_date = ? AND status = 'confirmed'
+        ''', (reservation_date,))
+        rows = [dict(row) for row in cursor.fetchall()]
+        reservations = [row for row in rows if not row['combined']]
+        pending = [dict(request_data, id=None) for request_data in pending]
+        
+        # Las reservas en varias mesas y las fijas se quedan donde están
+        fixed = {row['id'] for row in rows if row['combined']}
+        timelines = {}
+        for table_id, timeline in load_day_timelines(cursor, reservation_date).items():
+            intervals = [interval for interval in timeline.intervals if interval[2] in fixed or interval[2] < 0]
+            if intervals:
+                timelines[table_id] = TableTimeline(intervals)
+        
+        plan = TableAllocator(reservation_date, timelines=timelines).optimize(reservations + pending)
+        if plan is None:
+            raise ValueError('No es posible reubicar todas las reservas del día.')
+        
+        moves = [(table.id, request_data['id']) for request_data, table in plan
+                 if request_data['id'] is not None and request_data['table_id'] != table.id]
+        if apply:
+            cursor.executemany("UPDATE reservations SET table_id = ? WHERE id = ?", moves)
+    
+    if apply and moves:
+        get_availability_index().invalidate(reservation_date)
+        get_availability_bus().publish(reservation_date, 'reload', {})
+    
+    original_tables = {request_data['id']: request_data['table_id'] for request_data in reservations}
+    return {
+        'moved': [{'id': reservation_id, 'from': original_tables[reservation_id], 'to': table_id}
+                  for table_id, reservation_id in moves],
+        'pending': [dict(request_data, table_id=table.id if table else None)
+                    for request_data, table in plan if request_data['id'] is None],
+        'seated_covers': sum(request_data['guests'] for request_data, table in plan if table),
+        'applied': apply,
+    }
+
+# Reglas comunes a todas las vías de alta: formulario, edición e importación
+def find_next_slots(guests, reservation_date, start_minute, end_minute, hours=None, days=None,
+                    reservation_type='standard', limit=None):
+    # Huecos libres más cercanos al pedido, del mismo día en adelante y, dentro de cada
+    # día, por cercanía a la hora pedida. Las reservas de todo el tramo se leen con una
+    # sola consulta; de cada día solo pasan a TableAllocator las mesas con algún hueco
+    # en la ventana, así que un día completo se descarta sin probar hora a hora
+    hours = app.config['SLOT_SEARCH_HOURS'] if hours is None else hours
+    days = min(days or app.config['SLOT_SEARCH_DAYS'], app.config['SLOT_SEARCH_MAX_DAYS'])
+    limit = limit or app.config['SLOT_SEARCH_RESULTS']
+    step = app.config['SLOT_SEARCH_STEP_MINUTES']
+    duration = end_minute - start_minute
+    if duration <= 0:
+        raise ValueError('La hora de fin debe ser posterior a la hora de inicio.')
+    first_day = date.fromisoformat(check_date(reservation_date))
+    last_day = (first_day + timedelta(days=days - 1)).isoformat()
+    intervals = load_range_intervals(get_db().cursor(), reservation_date, last_day)
+    all_tables = TableManager.get_all_tables()
+    
+    opening = time_to_minutes(app.config['OPENING_TIME'])
+    closing = time_to_minutes(app.config['CLOSING_TIME'])
+    # Desplazamientos por distancia a la hora pedida; a igual distancia, antes que después
+    reach = min(hours, 24) * 60 // step * step
+    shifts = sorted(range(-reach, reach + 1, step), key=lambda shift: (abs(shift), shift))
+    now = datetime.now()
+    today, now_minute = now.strftime('%Y-%m-%d'), now.hour * 60 + now.minute
+    
+    slots = []
+    for offset in range(days):
+        day = (first_day + timedelta(days=offset)).isoformat()
+        if day < today:
+            continue
+        # Primera y última hora de inicio posibles del día, en la rejilla de la hora pedida
+        earliest = max(start_minute - reach, opening, now_minute if day == today else opening)
+        first = start_minute - (start_minute - earliest) // step * step
+        last = min(start_minute + reach, closing - duration)
+        if first > last:
+            continue
+        day_intervals = intervals.get(day, {})
+        tables, timelines = [], {}
+        for table in all_tables:
+            table_intervals = day_intervals.get(table.id)
+            if table_intervals is None:
+                tables.append(table)
+            elif first_free_start(table_intervals, first, last, duration, step) is not None:
+                tables.append(table)
+                timelines[table.id] = TableTimeline(table_intervals)
+        if not tables:
+            continue
+        allocator = TableAllocator(day, timelines, tables)
+        for shift in shifts:
+            start = start_minute + shift
+            end = start + duration
+            if start < first or start > last:
+                continue
+            table = allocator.choose(guests, start, end, reservation_type)
+            combination = [table] if table else allocator.choose_combination(guests, start, end)
+            if not combination:
+                continue
+            slots.append({
+                'reservation_date': day,
+                'start_time': TIME_LABELS[start],
+                'end_time': TIME_LABELS[end],
+                'table_id': combination[0].id,
+                'tables': [{'id': t.id, 'number': t.number, 'capacity': t.capacity, 'location': t.location}
+                           for t in combination],
+                'days_away': offset,
+                'minutes_away': shift,
+            })
+            if len(slots) == limit:
+                return slots
+    return slots
+
+def validate_reservation(start_minute, end_minute, guests, table_capacity):
+    if start_minute >= end_minute:
+        return 'La hora de fin debe ser posterior a la hora de inicio.'
+    opening_time, closing_time = app.config['OPENING_TIME'], app.config['CLOSING_TIME']
+    if start_minute < time_to_minutes(opening_time) or end_minute > time_to_minutes(closing_time):
+        return f'Las reservas deben estar entre las {opening_time} y las {closing_time}.'
+    # get_capacity devuelve None si la mesa no existe (p. ej. un table_id manipulado)
+    if table_capacity is None:
+        return 'Mesa no encontrada.'
+    if guests > table_capacity:
+        return f'El número de personas ({guests}) excede la capacidad de la mesa ({table_capacity}).'
+    return None
+
+# Reservas fijas: alta, baja y anulación de una ocurrencia
+def find_standing_conflict(cursor, table_id, start_minute, end_minute, rule):
+    # Primera fecha en la que la regla pisaría una reserva confirmada o fija de la mesa, o None.
+    # Las reservas sueltas son finitas y se comprueban todas; entre dos reglas sin fin se
+    # buscan coincidencias en los próximos RECURRING_CONFLICT_DAYS días
+    until = rule.until.isoformat() if rule.until else None
+    cursor.execute('''
+    SELECT DISTINCT reservation_date FROM table_bookings
+    WHERE table_id = ? AND reservation_date >= ? AND (? IS NULL OR reservation_date <= ?)
+    AND status = 'confirmed'
+    AND (? < end_minute AND ? > start_minute)
+    ORDER BY reservation_date
+    ''', (table_id, rule.dtstart.isoformat(), until, until, start_minute, end_minute))
+    for reservation_date, in cursor.fetchall():
+        if rule.occurs_on(date.fromisoformat(reservation_date)):
+            return reservation_date
+    
+    snapshot = get_recurring_index().snapshot()
+    others = [standing for standing in snapshot.rules
+              if standing.table_id == table_id and standing.start_minute < end_minute and standing.end_minute > start_minute]
+    if others:
+        day = rule.dtstart
+        last = rule.until or rule.dtstart + timedelta(days=app.config['RECURRING_CONFLICT_DAYS'])
+        while day <= last:
+            if rule.occurs_on(day) and any(standing.rule.occurs_on(day)
+                                           and (standing.id, day.isoformat()) not in snapshot.exceptions
+                                           for standing in others):
+                return day.isoformat()
+            day += timedelta(days=1)
+    return None
+
+def standing_reservations_changed():
+    # Una regla cambia muchas fechas a la vez: se descarta el índice de disponibilidad
+    # entero y las pantallas abiertas vuelven a consultar
+    g.pop('recurring_rules', None)
+    get_availability_index().clear()
+    get_availability_bus().publish_all('reload', {})
+
+def create_standing_reservation(customer_name, customer_phone, table_id, start_minute, end_minute,
+                                guests, reservation_type, rule):
+    with write_transaction() as cursor:
+        conflict = find_standing_conflict(cursor, table_id, start_minute, end_minute, rule)
+        if conflict:
+            raise ValueError(f'La mesa ya está ocupada el {conflict} en ese horario.')
+        customer_id = upsert_customer(cursor, customer_name, customer_phone)
+        cursor.execute('''
+        INSERT INTO recurring_reservations
+        (customer_name, customer_phone, table_id, start_minute, end_minute, guests, type, dtstart, rrule, customer_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (customer_name, customer_phone, table_id, start_minute, end_minute, guests, reservation_type,
+              rule.dtstart.isoformat(), str(rule), customer_id))
+        rule_id = cursor.lastrowid
+    standing_reservations_changed()
+    return rule_id
+
+def cancel_standing_reservation(rule_id):
+    with write_transaction() as cursor:
+        cursor.execute("UPDATE recurring_reservations SET status = 'cancelled' WHERE id = ? AND status = 'active'",
+                       (rule_id,))
+        cancelled = cursor.rowcount > 0
+    if cancelled:
+        standing_reservations_changed()
+    return cancelled
+
+def skip_standing_occurrence(rule_id, reservation_date):
+    # Anula una sola ocurrencia (el cliente no viene esa semana); solo cambia esa fecha
+    with write_transaction() as cursor:
+        standing = next((standing for standing in get_recurring_index().occurrences_on(reservation_date)
+                         if standing.id == rule_id), None)
+        if standing is None:
+            return False
+        cursor.execute("INSERT INTO recurring_exceptions (rule_id, reservation_date) VALUES (?, ?)",
+                       (rule_id, reservation_date))
+    g.pop('recurring_rules', None)
+    get_availability_index().invalidate(reservation_date)
+    publish_booking('released', -rule_id, reservation_date, standing.start_minute, standing.end_minute,
+                    [standing.table_id])
+    return True
+
+def rrule_from_form(form):
+    # El formulario elige frecuencia, intervalo, días y fecha final; también admite una RRULE escrita
+    if form.get('rrule'):
+        return form['rrule']
+    frequency = form.get('frequency', 'WEEKLY')
+    parts = [f'FREQ={frequency}', f"INTERVAL={form.get('interval') or 1}"]
+    if frequency == 'WEEKLY' and form.getlist('weekdays'):
+        parts.append('BYDAY=' + ','.join(form.getlist('weekdays')))
+    if form.get('until'):
+        parts.append(f"UNTIL={form['until'].replace('-', '')}")
+    return ';'.join(parts)
+
+# Lista de espera: alta, baja y reparto de los huecos que se liberan
+WaitlistMatch = namedtuple('WaitlistMatch', ('entry', 'table_id', 'start_minute', 'end_minute', 'reservation_id'))
+
+def add_waitlist_entry(customer_name, customer_phone, reservation_date, window_start, window_end, duration,
+                       guests, reservation_type, auto_book):
+    with write_transaction() as cursor:
+        cursor.execute('''
+        INSERT INTO waitlist
+        (customer_name, customer_phone, reservation_date, window_start, window_end, duration, guests, type, auto_book)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (customer_name, customer_phone, reservation_date, window_start, window_end, duration, guests,
+              reservation_type, int(auto_book)))
+        entry = WaitlistEntry(cursor.lastrowid, customer_name, customer_phone, reservation_date, window_start,
+                              window_end, duration, guests, reservation_type, int(auto_book))
+    get_waitlist_index().add(entry)
+    return entry
+
+def load_waitlist_entry(cursor, entry_id):
+    cursor.execute(f"SELECT {WAITLIST_COLUMNS}, status, offer_table_id, offer_start_minute FROM waitlist WHERE id = ?",
+                   (entry_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None, None
+    return WaitlistEntry(*tuple(row)[:len(WaitlistEntry._fields)]), row
+
+def cancel_waitlist_entry(entry_id):
+    with write_transaction() as cursor:
+        entry, _ = load_waitlist_entry(cursor, entry_id)
+        cursor.execute("UPDATE waitlist SET status = 'cancelled' WHERE id = ? AND status IN ('waiting', 'offered')",
+                       (entry_id,))
+        cancelled = cursor.rowcount > 0
+    if cancelled:
+        get_waitlist_index().remove(entry)
+    return cancelled
+
+def book_waitlist_entry(cursor, entry, table_id, start_minute):
+    # Dentro de una transacción de escritura ya abierta
+    cursor.execute('''
+    INSERT INTO reservations
+    (customer_name, customer_phone, table_id, reservation_date, start_minute, end_minute, guests, type, status,
+     customer_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'confirmed', ?)
+    ''', (entry.customer_name, entry.customer_phone, table_id, entry.reservation_date, start_minute,
+          start_minute + entry.duration, entry.guests, entry.type,
+          upsert_customer(cursor, entry.customer_name, entry.customer_phone)))
+    reservation_id = cursor.lastrowid
+    cursor.execute('''
+    UPDATE waitlist SET status = 'booked', offer_table_id = ?, offer_start_minute = ?, reservation_id = ?
+    WHERE id = ?
+    ''', (table_id, start_minute, reservation_id, entry.id))
+    return reservation_id
+
+def accept_waitlist_offer(entry_id):
+    # Convierte una oferta en reserva si el hueco sigue libre; si no, la petición vuelve
+    # a la lista de espera. Devuelve el WaitlistMatch de la reserva creada o None
+    with write_transaction() as cursor:
+        entry, row = load_waitlist_entry(cursor, entry_id)
+        if entry is None or row['status'] != 'offered':
+            raise ValueError('La petición no tiene ninguna oferta pendiente.')
+        table_id, start_minute = row['offer_table_id'], row['offer_start_minute']
+        end_minute = start_minute + entry.duration
+        if TableManager.is_table_available(table_id, entry.reservation_date, start_minute, end_minute):
+            match = WaitlistMatch(entry, table_id, start_minute, end_minute,
+                                  book_waitlist_entry(cursor, entry, table_id, start_minute))
+        else:
+            cursor.execute('''
+            UPDATE waitlist SET status = 'waiting', offer_table_id = NULL, offer_start_minute = NULL WHERE id = ?
+            ''', (entry_id,))
+            match = None
+    if match is None:
+        get_waitlist_index().add(entry)
+    else:
+        waitlist_matched([match])
+    return match
+
+def freed_intervals(previous, current):
+    # Tramos (mesa, inicio, fin) que deja libres una reserva al pasar de 'previous' a
+    # 'current', ambos (fecha, inicio, fin, mesas); current es None si deja de ocupar
+    reservation_date, start_minute, end_minute, table_ids = previous
+    freed = []
+    for table_id in table_ids:
+        if current is None or current[0] != reservation_date or table_id not in current[3]:
+            freed.append((table_id, start_minute, end_minute))
+            continue
+        _, new_start, new_end, _ = current
+        if start_minute < min(new_start, end_minute):
+            freed.append((table_id, start_minute, min(new_start, end_minute)))
+        if max(new_end, start_minute) < end_minute:
+            freed.append((table_id, max(new_end, start_minute), end_minute))
+    return freed
+
+def free_gap_around(cursor, table_id, reservation_date, start_minute):
+    # Hueco libre de la mesa que contiene el tramo liberado: desde el final de la reserva
+    # anterior hasta el inicio de la siguiente, con el índice por mesa y fecha
+    opening = time_to_minutes(app.config['OPENING_TIME'])
+    closing = time_to_minutes(app.config['CLOSING_TIME'])
+    cursor.execute('''
+    SELECT
+        (SELECT MAX(end_minute) FROM table_bookings
+         WHERE table_id = ? AND reservation_date = ? AND status = 'confirmed' AND start_minute < ?),
+        (SELECT MIN(start_minute) FROM table_bookings
+         WHERE table_id = ? AND reservation_date = ? AND status = 'confirmed' AND start_minute >= ?)
+    ''', (table_id, reservation_date, start_minute, table_id, reservation_date, start_minute))
+    previous_end, next_start = cursor.fetchone()
+    gap_start = max(opening, previous_end if previous_end is not None else opening)
+    gap_end = min(closing, next_start if next_start is not None else closing)
+    for standing in get_recurring_index().occurrences_on(reservation_date):
+        if standing.table_id != table_id:
+            continue
+        if standing.start_minute < start_minute:
+            gap_start = max(gap_start, standing.end_minute)
+        else:
+            gap_end = min(gap_end, standing.start_minute)
+    return gap_start, gap_end
+
+def fill_from_waitlist(cursor, reservation_date, freed):
+    # En la misma transacción que libera los tramos, antes de que otra petición pueda
+    # ocuparlos: en cada mesa liberada, la mejor petición en espera se reserva directamente
+    # (auto_book) o recibe la oferta del hueco. Devuelve [WaitlistMatch]
+    now = datetime.now()
+    today = now.strftime('%Y-%m-%d')
+    if not freed or reservation_date < today:
+        return []
+    earliest = now.hour * 60 + now.minute if reservation_date == today else 0
+    index = get_waitlist_index()
+    matches, taken = [], set()
+    for table_id, start_minute, _ in freed:
+        table = TableManager.get_table(table_id)
+        if table is None:
+            continue
+        gap_start, gap_end = free_gap_around(cursor, table_id, reservation_date, start_minute)
+        gap_start = max(gap_start, earliest)
+        while True:
+            found = index.match(cursor, reservation_date, table.capacity, gap_start, gap_end, taken)
+            if found is None:
+                break
+            entry, start = found
+            taken.add(entry.id)
+            if entry.auto_book:
+                cursor.execute("SELECT status FROM waitlist WHERE id = ?", (entry.id,))
+                row = cursor.fetchone()
+                waiting = row is not None and row[0] == 'waiting'
+                reservation_id = book_waitlist_entry(cursor, entry, table_id, start) if waiting else None
+            else:
+                cursor.execute('''
+                UPDATE waitlist SET status = 'offered', offer_table_id = ?, offer_start_minute = ?
+                WHERE id = ? AND status = 'waiting'
+                ''', (table_id, start, entry.id))
+                waiting = cursor.rowcount > 0
+                reservation_id = None
+            if not waiting:
+                # Atendida o cancelada desde otro proceso: el índice estaba desfasado
+                index.remove(entry)
+                continue
+            matches.append(WaitlistMatch(entry, table_id, start, start + entry.duration, reservation_id))
+            break
+    return matches
+
+def waitlist_matched(matches):
+    # Tras confirmar la transacción: las peticiones atendidas salen del índice y las
+    # reservas creadas se anuncian como cualquier otra
+    index = get_waitlist_index()
+    for match in matches:
+        entry = match.entry
+        index.remove(entry)
+        if match.reservation_id is not None:
+            get_availability_index().add(match.reservation_id, [match.table_id], entry.reservation_date,
+                                         match.start_minute, match.end_minute)
+            publish_booking('booked', match.reservation_id, entry.reservation_date, match.start_minute,
+                            match.end_minute, [match.table_id])
+        app.logger.info("waitlist_%s entry=%s table=%s date=%s start=%s",
+                        'booked' if match.reservation_id is not None else 'offered', entry.id, match.table_id,
+                        entry.reservation_date, TIME_LABELS[match.start_minute])
+
+def waitlist_message(match):
+    table = TableManager.get_table(match.table_id)
+    slot = (f"la mesa #{table.number if table else match.table_id} el {match.entry.reservation_date} de "
+            f"{TIME_LABELS[match.start_minute]} a {TIME_LABELS[match.end_minute]}")
+    if match.reservation_id is not None:
+        return f"Lista de espera: {slot} se ha reservado para {match.entry.customer_name}."
+    return f"Lista de espera: {slot} se ha ofrecido a {match.entry.customer_name}."
+
+# Directorio de clientes: alta implícita con cada reserva, búsqueda por teléfono o nombre
+def normalize_phone(phone):
+    # Clave E.164 ('+34612345678') de un teléfono escrito de cualquier forma: sin
+    # espacios ni signos, con '00' como '+' y el prefijo del país si falta. None si no
+    # parece un teléfono (menos de 6 o más de 15 cifras)
+    if not phone:
+        return None
+    text = phone.strip()
+    digits = ''.join(ch for ch in text if ch in '0123456789')
+    if text.startswith('+'):
+        pass
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    else:
+        # Número nacional: fuera el 0 de larga distancia, si lo hay
+        digits = app.config['PHONE_COUNTRY_CODE'] + (digits[1:] if digits.startswith('0') else digits)
+    if not 6 <= len(digits) <= 15:
+        return None
+    return '+' + digits
+
+def upsert_customer(cursor, name, phone):
+    # Dentro de una transacción de escritura ya abierta: el cliente del teléfono, creado
+    # si no existe; conserva el último nombre usado. Devuelve su id o None
+    phone_key = normalize_phone(phone)
+    if phone_key is None:
+        return None
+    cursor.execute('''
+    INSERT INTO customers (name, phone, phone_key) VALUES (?, ?, ?)
+    ON CONFLICT (phone_key) DO UPDATE SET name = excluded.name, phone = excluded.phone
+    WHERE customers.name != excluded.name OR customers.phone != excluded.phone
+    RETURNING id
+    ''', (name or '', phone, phone_key))
+    row = cursor.fetchone()
+    if row is None:
+        # Sin cambios, RETURNING no devuelve la fila existente
+        cursor.execute("SELECT id FROM customers WHERE phone_key = ?", (phone_key,))
+        row = cursor.fetchone()
+    return row[0]
+
+def dedupe_customers(cursor, schema='main'):
+    # Alta masiva de clientes para las reservas sin cliente: una sola pasada que calcula
+    # las claves, crea un cliente por clave (con el nombre de su reserva más reciente) y
+    # enlaza las reservas con un UPDATE ... FROM. 'schema' es main o un mes archivado
+    # adjunto; los clientes siempre están en main. Devuelve las reservas enlazadas
+    cursor.connection.create_function('normalize_phone', 1, normalize_phone, deterministic=True)
+    cursor.execute("CREATE TEMP TABLE customer_keys (id INTEGER PRIMARY KEY, phone_key TEXT NOT NULL)")
+    try:
+        cursor.execute(f'''
+        INSERT INTO temp.customer_keys (id, phone_key)
+        SELECT id, phone_key FROM (
+            SELECT id, normalize_phone(customer_phone) AS phone_key FROM {schema}.reservations
+            WHERE customer_id IS NULL
+        ) WHERE phone_key IS NOT NULL
+        ''')
+        cursor.execute(f'''
+        INSERT INTO main.customers (name, phone, phone_key)
+        SELECT name, phone, phone_key FROM (
+            SELECT COALESCE(r.customer_name, '') AS name, r.customer_phone AS phone, k.phone_key,
+                ROW_NUMBER() OVER (PARTITION BY k.phone_key ORDER BY r.id DESC) AS position
+            FROM temp.customer_keys k JOIN {schema}.reservations r ON r.id = k.id
+        ) WHERE position = 1
+        ORDER BY phone_key
+        ON CONFLICT (phone_key) DO NOTHING
+        ''')
+        cursor.execute(f'''
+        UPDATE {schema}.reservations SET customer_id = c.id
+        FROM temp.customer_keys k JOIN main.customers c ON c.phone_key = k.phone_key
+        WHERE reservations.id = k.id
+        ''')
+        return cursor.rowcount
+    finally:
+        cursor.execute("DROP TABLE temp.customer_keys")
+
+def customer_name_query(text):
+    # Cada palabra como prefijo entre comillas: 'mar garc' encuentra 'María García'
+    words = [word.replace('"', '""') for word in text.split()]
+    return ' '.join(f'"{word}"*' for word in words if word)
+
+def search_customers(text, limit=None):
+    # Teléfono (solo cifras y signos): rango sobre el índice único de phone_key, de modo
+    # que un número incompleto devuelve los que empiezan igual. Nombre: FTS5 por relevancia
+    limit = limit or app.config['CUSTOMER_SEARCH_RESULTS']
+    text = (text or '').strip()
+    columns = '''
+        c.id, c.name, c.phone, c.phone_key,
+        (SELECT COUNT(*) FROM reservations r WHERE r.customer_id = c.id) + c.archived_reservations AS reservations,
+        (SELECT MAX(visit) FROM (
+            SELECT MAX(reservation_date) AS visit FROM reservations r WHERE r.customer_id = c.id
+            UNION ALL SELECT c.archived_last_visit
+        )) AS last_visit,
+        (SELECT COUNT(*) FROM recurring_reservations s
+         WHERE s.customer_id = c.id AND s.status = 'active') AS standing
+    '''
+    cursor = get_db().cursor()
+    if not text:
+        return []
+    if all(ch in '0123456789+-(). ' for ch in text):
+        digits = ''.join(ch for ch in text if ch in '0123456789')
+        if len(digits) < 3:
+            return []
+        if text.startswith('+'):
+            prefix = '+' + digits
+        elif digits.startswith('00'):
+            prefix = '+' + digits[2:]
+        else:
+            prefix = '+' + app.config['PHONE_COUNTRY_CODE'] + (digits[1:] if digits.startswith('0') else digits)
+        # ':' es el carácter siguiente a '9'
+        cursor.execute(f'''
+        SELECT {columns} FROM customers c
+        WHERE c.phone_key >= ? AND c.phone_key < ?
+        ORDER BY c.phone_key LIMIT ?
+        ''', (prefix, prefix + ':', limit))
+        return cursor.fetchall()
+    query = customer_name_query(text)
+    if not query:
+        return []
+    cursor.execute(f'''
+    SELECT {columns} FROM customers_fts f
+    JOIN customers c ON c.id = f.rowid
+    WHERE customers_fts MATCH ?
+    ORDER BY f.rank LIMIT ?
+    ''', (query, limit))
+    return cursor.fetchall()
+
+def customer_reservations(customer):
+    # Historial completo del cliente, de la reserva más reciente a la más antigua: las
+    # vivas y, si tiene reservas archivadas, las de los meses hasta la última, adjuntos
+    # de uno en uno como en query_reservation_history y leídos por su índice de cliente
+    conn = get_db()
+    query = '''
+    SELECT r.*, COALESCE(t.number, r.table_id) AS table_number, {archived} AS archived
+    FROM {schema}.reservations r
+    LEFT JOIN main.tables t ON t.id = r.table_id
+    WHERE r.customer_id = ? {exclude}
+    '''
+    rows = conn.execute(query.format(schema='main', archived=0, exclude=''), (customer['id'],)).fetchall()
+    if customer['archived_reservations']:
+        for month in archived_months(date_to=customer['archived_last_visit']):
+            conn.execute("ATTACH DATABASE ? AS archive", (archive_path(month),))
+            try:
+                rows.extend(conn.execute(query.format(
+                    schema='archive', archived=1,
+                    exclude="AND NOT EXISTS (SELECT 1 FROM main.reservations m WHERE m.id = r.id)"),
+                    (customer['id'],)).fetchall())
+            finally:
+                conn.execute("DETACH DATABASE archive")
+    return sorted(rows, key=page_key, reverse=True)
+
+def customer_standing_reservations(customer, days=60):
+    # Reservas fijas activas del cliente con sus próximas fechas (como en /recurring_reservations)
+    cursor = get_db().cursor()
+    cursor.execute('''
+    SELECT * FROM recurring_reservations WHERE customer_id = ? AND status = 'active' ORDER BY id
+    ''', (customer['id'],))
+    rules = cursor.fetchall()
+    if not rules:
+        return []
+    today = date.today()
+    upcoming = {}
+    for reservation_date, occurrence in get_recurring_index().occurrences_between(
+            today.isoformat(), (today + timedelta(days=days)).isoformat()):
+        upcoming.setdefault(occurrence.id, []).append(reservation_date)
+    return [{'rule': rule, 'table': TableManager.get_table(rule['table_id']),
+             'repeat': RecurrenceRule(rule['rrule'], rule['dtstart']).describe(),
+             'upcoming': upcoming.get(rule['id'], [])[:3],
+             'start_time': TIME_LABELS[rule['start_minute']], 'end_time': TIME_LABELS[rule['end_minute']]}
+            for rule in rules]
+
+# Listado paginado por clave (fecha, hora de inicio, id): el coste de cada
+# página depende de las filas mostradas y no del histórico completo
+def page_key(row):
+    return row['reservation_date'], row['start_minute'], row['id']
+
+def encode_page_key(row):
+    return f"{row['reservation_date']},{row['start_minute']},{row['id']}"
+
+def decode_page_key(token):
+    try:
+        reservation_date, start_minute, reservation_id = token.split(',')
+        return check_date(reservation_date), int(start_minute), int(reservation_id)
+    except (AttributeError, ValueError):
+        return None
+
+def reservation_filters(date_from=None, date_to=None, status=None, after=None):
+    # Condiciones del listado sobre el alias r, comunes a las reservas vivas y archivadas
+    conditions, params = [], []
+    if date_from:
+        conditions.append("r.reservation_date >= ?")
+        params.append(date_from)
+    if date_to:
+        conditions.append("r.reservation_date <= ?")
+        params.append(date_to)
+    if status:
+        conditions.append("r.status = ?")
+        params.append(status)
+    if after:
+        conditions.append("(r.reservation_date, r.start_minute, r.id) > (?, ?, ?)")
+        params.extend(after)
+    return conditions, params
+
+def query_reservations(date_from=None, date_to=None, status=None, after=None, limit=50):
+    conditions, params = reservation_filters(date_from, date_to, status, after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
     
-    def save(self):
+    # CROSS JOIN fija reservations como tabla externa para recorrer el índice por fecha
+    cursor = get_db().cursor()
+    cursor.execute(f'''
+    SELECT r.*, t.number as table_number,
+        (SELECT group_concat(jt.number, ' + ') FROM reservation_tables rt
+         JOIN tables jt ON jt.id = rt.table_id
+         WHERE rt.reservation_id = r.id) AS joined_table_numbers
+    FROM reservations r 
+    CROSS JOIN tables t ON r.table_id = t.id
+    {where}
+    ORDER BY r.reservation_date, r.start_minute, r.id
+    LIMIT ?
+    ''', params + [limit + 1])
+    rows = cursor.fetchall()
+    
+    # Las reservas fijas no tienen filas: sus ocurrencias se generan solo para el tramo
+    # de fechas que cubre esta página y se intercalan en el mismo orden
+    if status in (None, '', 'confirmed') and get_recurring_index().snapshot().rules:
+        if len(rows) > limit:
+            last = rows[-1]['reservation_date']
+        else:
+            start = max(date_from or '', datetime.now().strftime('%Y-%m-%d'))
+            last = (date.fromisoformat(start) + timedelta(days=app.config['RECURRING_LISTING_DAYS'])).isoformat()
+        if date_to:
+            last = min(last, date_to)
+        first = max(filter(None, (date_from, after[0] if after else None)), default=None)
+        occurrences = [standing_occurrence_row(reservation_date, standing)
+                       for reservation_date, standing in get_recurring_index().occurrences_between(first, last)]
+        if after:
+            occurrences = [row for row in occurrences if page_key(row) > tuple(after)]
+        rows = sorted(list(rows) + occurrences, key=page_key)
+    
+    next_key = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_key = encode_page_key(rows[-1])
+    return rows, next_key
+
+def query_reservation_history(date_from=None, date_to=None, status=None, after=None, limit=50):
+    # Como query_reservations, uniendo además los meses archivados del intervalo. Los
+    # ficheros se adjuntan de uno en uno (SQLite limita los adjuntos por conexión) y,
+    # como los meses van en orden, se dejan de leer en cuanto la página está completa
+    rows, next_key = query_reservations(date_from, date_to, status, after, limit)
+    conditions, params = reservation_filters(date_from, date_to, status, after)
+    # Una reserva en ambos sitios es un archivado interrumpido: cuenta la viva
+    conditions.append("NOT EXISTS (SELECT 1 FROM main.reservations m WHERE m.id = r.id)")
+    first = max(filter(None, (date_from, after[0] if after else None)), default=None)
+    conn = get_db()
+    archived = []
+    for month in archived_months(first, date_to):
+        if len(archived) > limit:
+            break
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path(month),))
         try:
-            start_time = datetime.strptime(self.start_time, '%H:%M').strftime('%H:%M')
-            end_time = datetime.strptime(self.end_time, '%H:%M').strftime('%H:%M')
-        except ValueError:
-            start_time = datetime.strptime(self.start_time, '%I:%M %p').strftime('%H:%M')
-            end_time = datetime.strptime(self.end_time, '%I:%M %p').strftime('%H:%M')
-        self.start_time, self.end_time = start_time, end_time
+            cursor = conn.execute(f'''
+            SELECT r.*, COALESCE(t.number, r.table_id) AS table_number,
+                (SELECT group_concat(COALESCE(jt.number, rt.table_id), ' + ')
+                 FROM archive.reservation_tables rt
+                 LEFT JOIN main.tables jt ON jt.id = rt.table_id
+                 WHERE rt.reservation_id = r.id) AS joined_table_numbers,
+                1 AS archived
+            FROM archive.reservations r
+            LEFT JOIN main.tables t ON r.table_id = t.id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY r.reservation_date, r.start_minute, r.id
+            LIMIT ?
+            ''', params + [limit + 1 - len(archived)])
+            archived.extend(cursor.fetchall())
+        finally:
+            conn.execute("DETACH DATABASE archive")
+    if not archived:
+        return rows, next_key
+    
+    rows = sorted(list(rows) + archived, key=page_key)
+    more = next_key is not None or len(rows) > limit
+    rows = rows[:limit]
+    return rows, encode_page_key(rows[-1]) if more else None
+
+def standing_occurrence_row(reservation_date, standing):
+    # Una ocurrencia de reserva fija con las columnas del listado; el id es el de la regla en negativo
+    table = TableManager.get_table(standing.table_id)
+    return {
+        'id': -standing.id,
+        'customer_name': standing.customer_name,
+        'customer_phone': standing.customer_phone,
+        'table_id': standing.table_id,
+        'reservation_date': reservation_date,
+        'start_minute': standing.start_minute,
+        'end_minute': standing.end_minute,
+        'guests': standing.guests,
+        'type': standing.type,
+        'status': 'confirmed',
+        'table_number': table.number if table else standing.table_id,
+        'joined_table_numbers': None,
+        'recurring_id': standing.id,
+    }
+
+def format_reservation(row, labels=TIME_LABELS_12H):
+    # Sin análisis de texto: los minutos indexan directamente las horas ya formateadas
+    res_dict = dict(row)
+    res_dict['start_time'] = labels[row['start_minute']]
+    res_dict['end_time'] = labels[row['end_minute']]
+    return res_dict
+
+# Importación y exportación masiva de reservas (CSV y JSON Lines); en los ficheros
+# las horas van en texto 'HH:MM' y en la base de datos como minutos
+RESERVATION_FIELDS = ('customer_name', 'customer_phone', 'table_id', 'reservation_date',
+                      'start_time', 'end_time', 'guests', 'type', 'status')
+RESERVATION_COLUMNS = ('customer_name', 'customer_phone', 'table_id', 'reservation_date',
+                       'start_minute', 'end_minute', 'guests', 'type', 'status')
+RESERVATION_STATUSES = ('confirmed', 'cancelled', 'no_show')
+
+def guess_file_format(filename):
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return 'csv'
+
+class ReservationImporter:
+    def __init__(self, chunk_size=1000):
+        self.chunk_size = chunk_size
+        self.imported = 0
+        self.rejected = []
+        self._capacities = {table.id: table.capacity for table in TableManager.get_all_tables()}
+    
+    def _reject(self, line_number, error):
+        self.rejected.append({'row': line_number, 'error': error})
+    
+    def _read_rows(self, stream, file_format):
+        if file_format == 'csv':
+            # La fila 1 es la cabecera
+            yield from enumerate(csv.DictReader(stream), start=2)
+            return
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError:
+                self._reject(line_number, 'JSON no válido.')
+    
+    def _build(self, row):
+        reservation = (ReservationBuilder()
+            .set_customer_info(row['customer_name'], row['customer_phone'])
+            .set_table(int(row['table_id']))
+            .set_date_time(row['reservation_date'], row['start_time'], row['end_time'])
+            .set_guests(int(row['guests']))
+            .set_type(row.get('type') or 'standard')
+            .set_status(row.get('status') or 'confirmed')
+            .build())
+        # Un estado desconocido se saltaría la comprobación de solapes y podría volver a
+        # 'confirmed' al editar la reserva, con la mesa ya ocupada
+        if reservation.status not in RESERVATION_STATUSES:
+            raise ValueError(f'estado desconocido {reservation.status!r}')
+        datetime.strptime(reservation.reservation_date, '%Y-%m-%d')
+        reservation._normalize_times()
+        return reservation
+    
+    def _check(self, reservation, timelines, cursor):
+        table_capacity = self._capacities.get(reservation.table_id)
+        if table_capacity is None:
+            return f'La mesa {reservation.table_id} no existe.'
+        error = validate_reservation(reservation.start_minute, reservation.end_minute,
+                                     reservation.guests, table_capacity)
+        if error or reservation.status != 'confirmed':
+            return error
         
-        if not TableManager.is_table_available(self.table_id, self.reservation_date, self.start_time, self.end_time):
-            raise ValueError("Table is not available for the selected time slot")
+        # Solapes contra la base de datos y contra las filas ya aceptadas del lote
+        if reservation.reservation_date not in timelines:
+            timelines[reservation.reservation_date] = load_day_timelines(cursor, reservation.reservation_date)
+        day = timelines[reservation.reservation_date]
+        timeline = day.setdefault(reservation.table_id, TableTimeline())
+        if timeline.overlaps(reservation.start_minute, reservation.end_minute):
+            return 'La mesa no está disponible para el horario seleccionado.'
+        timeline.add(reservation.start_minute, reservation.end_minute, None)
+        return None
+    
+    def _import_chunk(self, chunk):
+        accepted = []
+        with write_transaction() as cursor:
+            # Las líneas de tiempo se recargan en cada lote, bajo el bloqueo de escritura
+            timelines = {}
+            for line_number, row in chunk:
+                try:
+                    reservation = self._build(row)
+                except KeyError as e:
+                    self._reject(line_number, f'Falta el campo {e.args[0]}.')
+                    continue
+                except (AttributeError, TypeError, ValueError) as e:
+                    self._reject(line_number, f'Valor no válido: {e}')
+                    continue
+                error = self._check(reservation, timelines, cursor)
+                if error:
+                    self._reject(line_number, error)
+                    continue
+                accepted.append(reservation)
+            
+            columns = RESERVATION_COLUMNS + ('customer_id',)
+            for reservation in accepted:
+                reservation.customer_id = upsert_customer(cursor, reservation.customer_name,
+                                                          reservation.customer_phone)
+            cursor.executemany(f'''
+            INSERT INTO reservations ({', '.join(columns)})
+            VALUES ({', '.join('?' * len(columns))})
+            ''', [tuple(getattr(reservation, column) for column in columns) for reservation in accepted])
         
-        conn = sqlite3.connect('restaurant.db')
-        cursor = conn.cursor()
+        self.imported += len(accepted)
+        index = get_availability_index()
+        bus = get_availability_bus()
+        for reservation_date in {reservation.reservation_date for reservation in accepted}:
+            index.invalidate(reservation_date)
+            bus.publish(reservation_date, 'reload', {})
+    
+    def import_stream(self, stream, file_format):
+        chunk = []
+        for line_number, row in self._read_rows(stream, file_format):
+            chunk.append((line_number, row))
+            if len(chunk) >= self.chunk_size:
+                self._import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._import_chunk(chunk)
+        return {'imported': self.imported, 'rejected': self.rejected}
+
+def export_reservations(file_format, batch_size=1000):
+    # Generador: recorre la tabla por lotes sin cargarla entera en memoria
+    fields = ('id',) + RESERVATION_FIELDS
+    cursor = get_db().cursor()
+    cursor.execute(f"SELECT {', '.join(fields)} FROM reservations_hhmm ORDER BY id")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if file_format == 'csv':
+        writer.writerow(fields)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            if file_format == 'csv':
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(dict(zip(fields, row)), ensure_ascii=False) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+# Archivo de reservas pasadas: un fichero SQLite por mes, con las mismas columnas.
+# En reservations queda solo el conjunto vivo, así que las consultas de siempre no
+# cambian; el histórico une bajo demanda los meses archivados que necesita
+ARCHIVE_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS archive.reservations (
+        id INTEGER PRIMARY KEY,
+        customer_name TEXT,
+        customer_phone TEXT,
+        table_id INTEGER,
+        reservation_date TEXT,
+        start_minute INTEGER NOT NULL,
+        end_minute INTEGER NOT NULL,
+        guests INTEGER,
+        type TEXT,
+        status TEXT,
+        customer_id INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS archive.reservation_tables (
+        reservation_id INTEGER,
+        table_id INTEGER,
+        PRIMARY KEY (reservation_id, table_id)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS archive.idx_reservations_date_start
+    ON reservations (reservation_date, start_minute)
+    ''',
+)
+
+# PRAGMA user_version de cada fichero de archivo: 1 = reservas enlazadas con su cliente
+ARCHIVE_VERSION = 1
+
+def add_archived_visits(cursor, rows):
+    # Suma a cada cliente las reservas que pasan al archivo ('rows': consulta con
+    # customer_id y reservation_date) y adelanta su última visita archivada
+    cursor.execute(f'''
+    UPDATE main.customers
+    SET archived_reservations = archived_reservations + v.visits,
+        archived_last_visit = MAX(COALESCE(archived_last_visit, ''), v.last_visit)
+    FROM (
+        SELECT customer_id, COUNT(*) AS visits, MAX(reservation_date) AS last_visit
+        FROM ({rows}) WHERE customer_id IS NOT NULL GROUP BY customer_id
+    ) v
+    WHERE customers.id = v.customer_id
+    ''')
+
+def prepare_archive(conn):
+    # Crea el esquema del mes adjunto como 'archive' o pone al día un fichero anterior:
+    # los de antes de la versión 1 no copiaban customer_id, así que sus reservas se
+    # enlazan por teléfono como en la migración de clientes y se suman a sus contadores
+    for statement in ARCHIVE_SCHEMA:
+        conn.execute(statement)
+    if conn.execute("PRAGMA archive.user_version").fetchone()[0] >= ARCHIVE_VERSION:
+        return
+    columns = {row[1] for row in conn.execute("PRAGMA archive.table_info(reservations)")}
+    with write_transaction() as cursor:
+        if 'customer_id' not in columns:
+            cursor.execute("ALTER TABLE archive.reservations ADD COLUMN customer_id INTEGER")
+        dedupe_customers(cursor, 'archive')
+        # Una reserva en ambos sitios es un archivado interrumpido: cuenta la viva
+        add_archived_visits(cursor, '''
+        SELECT customer_id, reservation_date FROM archive.reservations r
+        WHERE NOT EXISTS (SELECT 1 FROM main.reservations m WHERE m.id = r.id)
+        ''')
         cursor.execute('''
-        INSERT INTO reservations 
-        (customer_name, customer_phone, table_id, reservation_date, start_time, end_time, guests, type, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (self.customer_name, self.customer_phone, self.table_id, self.reservation_date, 
-              self.start_time, self.end_time, self.guests, self.type, self.status))
-        
+        CREATE INDEX IF NOT EXISTS archive.idx_reservations_customer
+        ON reservations (customer_id, reservation_date)
+        ''')
+        cursor.execute(f"PRAGMA archive.user_version = {ARCHIVE_VERSION}")
+
+def migrate_archives():
+    # Pone al día los ficheros de archivo ya existentes, de uno en uno
+    conn = get_db()
+    for month in archived_months():
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path(month),))
+        try:
+            prepare_archive(conn)
+        finally:
+            conn.execute("DETACH DATABASE archive")
+
+def _archive_location():
+    database = get_database()
+    directory = app.config['ARCHIVE_DIRECTORY'] or os.path.dirname(os.path.abspath(database))
+    return directory, f"{os.path.splitext(os.path.basename(database))[0]}-archive-"
+
+def archive_path(month):
+    # Un fichero por base de datos (y por tanto por sede) y mes: restaurant-archive-2024-03.db
+    directory, prefix = _archive_location()
+    return os.path.join(directory, f'{prefix}{month}.db')
+
+def archived_months(date_from=None, date_to=None):
+    # Meses 'AAAA-MM' con fichero de archivo que se solapan con el intervalo, en orden
+    directory, prefix = _archive_location()
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    months = []
+    for name in names:
+        month = name[len(prefix):-len('.db')]
+        if not (name.startswith(prefix) and name.endswith('.db') and len(month) == 7):
+            continue
+        if (date_from and month < date_from[:7]) or (date_to and month > date_to[:7]):
+            continue
+        months.append(month)
+    return sorted(months)
+
+def archive_reservations(before=None):
+    # Mueve a los ficheros de archivo las reservas con fecha anterior a 'before' (por
+    # defecto, hoy menos ARCHIVE_AFTER_DAYS). Son fechas pasadas, así que todas están
+    # canceladas o ya completadas. Devuelve {mes: reservas archivadas}
+    today = date.today()
+    if before is None:
+        before = (today - timedelta(days=app.config['ARCHIVE_AFTER_DAYS'])).isoformat()
+    elif date.fromisoformat(before) > today:
+        raise ValueError('Solo pueden archivarse reservas de fechas pasadas.')
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT substr(reservation_date, 1, 7) FROM reservations WHERE reservation_date < ?",
+                   (before,))
+    months = sorted(row[0] for row in cursor.fetchall())
+    columns = ', '.join(('id',) + RESERVATION_COLUMNS + ('customer_id',))
+    archived, dates = {}, set()
+    for month in months:
+        year, number = map(int, month.split('-'))
+        month_end = min(before, date(year + number // 12, number % 12 + 1, 1).isoformat())
+        path = archive_path(month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # ATTACH no se admite dentro de una transacción: se adjunta antes del primer lote
+        conn.execute("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            prepare_archive(conn)
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY, reservation_date TEXT)")
+            count = 0
+            while True:
+                # Lotes cortos para no retener el bloqueo de escritura. La reserva con el id
+                # más alto nunca se archiva: SQLite no volverá a repartir ids ya archivados
+                with write_transaction() as tx:
+                    tx.execute("DELETE FROM temp.archive_batch")
+                    tx.execute('''
+                    INSERT INTO temp.archive_batch
+                    SELECT id, reservation_date FROM main.reservations
+                    WHERE reservation_date >= ? AND reservation_date < ?
+                        AND id < (SELECT MAX(id) FROM main.reservations)
+                    LIMIT ?
+                    ''', (f'{month}-01', month_end, app.config['ARCHIVE_BATCH_SIZE']))
+                    moved = tx.rowcount
+                    if moved:
+                        tx.execute(f'''
+                        INSERT OR REPLACE INTO archive.reservations ({columns})
+                        SELECT {columns} FROM main.reservations WHERE id IN (SELECT id FROM temp.archive_batch)
+                        ''')
+                        tx.execute('''
+                        INSERT OR REPLACE INTO archive.reservation_tables (reservation_id, table_id)
+                        SELECT reservation_id, table_id FROM main.reservation_tables
+                        WHERE reservation_id IN (SELECT id FROM temp.archive_batch)
+                        ''')
+                        add_archived_visits(tx, '''
+                        SELECT customer_id, reservation_date FROM main.reservations
+                        WHERE id IN (SELECT id FROM temp.archive_batch)
+                        ''')
+                        # Primero las reservas: así los triggers de los agregados no descuentan
+                        # las mesas adicionales de lo que solo cambia de fichero
+                        tx.execute("DELETE FROM main.reservations WHERE id IN (SELECT id FROM temp.archive_batch)")
+                        tx.execute("DELETE FROM main.reservation_tables WHERE reservation_id IN "
+                                   "(SELECT id FROM temp.archive_batch)")
+                        tx.execute("SELECT DISTINCT reservation_date FROM temp.archive_batch")
+                        dates.update(row[0] for row in tx.fetchall())
+                count += moved
+                if moved < app.config['ARCHIVE_BATCH_SIZE']:
+                    break
+            # Los ficheros archivados solo se leen: se compactan sin páginas libres
+            conn.execute("VACUUM archive")
+        finally:
+            conn.execute("DROP TABLE IF EXISTS temp.archive_batch")
+            conn.execute("DETACH DATABASE archive")
+        if count:
+            archived[month] = count
+            app.logger.info("reservations_archived month=%s count=%s path=%s", month, count, path)
+    # Los triggers ya han cambiado las versiones; este proceso descarta además sus copias
+    index = get_availability_index()
+    for reservation_date in dates:
+        index.invalidate(reservation_date)
+    if archived:
+        conn.execute("PRAGMA optimize")
+    return archived
+
+# Analítica (módulo analytics): agregados rollup_daily y rollup_hourly, más las
+# ocurrencias de las reservas fijas, que no pasan por reservations
+def rebuild_rollups():
+    # Recalcula los agregados desde cero, incluidos los meses archivados: estos se suman
+    # antes en tablas temporales y el cambio se aplica en una sola transacción
+    conn = get_db()
+    create_rebuild_tables(conn.cursor())
+    try:
         conn.commit()
-        conn.close()
-    
-    def clone(self):
-        return copy.deepcopy(self)
+        for month in archived_months():
+            conn.execute("ATTACH DATABASE ? AS archive", (archive_path(month),))
+            try:
+                accumulate_rollups(conn.cursor(), 'archive')
+                conn.commit()
+            finally:
+                conn.execute("DETACH DATABASE archive")
+        with write_transaction() as cursor:
+            accumulate_rollups(cursor, 'main')
+            replace_rollups(cursor)
+    finally:
+        drop_rebuild_tables(conn.cursor())
 
-# Patrón Builder - Construcción paso a paso de reservas complejas
-class ReservationBuilder:
-    def __init__(self):
-        self.reservation = Reservation()
+def standing_occurrences(date_from, date_to):
+    # Ocurrencias de reservas fijas del intervalo como las espera analytics:
+    # (fecha, tipo, zona, personas, inicio, fin). Solo las de reglas activas
+    locations = {table.id: table.location for table in TableManager.get_all_tables()}
+    return [(reservation_date, standing.type, locations.get(standing.table_id, ''), standing.guests,
+             standing.start_minute, standing.end_minute)
+            for reservation_date, standing in get_recurring_index().occurrences_between(date_from, date_to)]
+
+def analytics_report(date_from, date_to):
+    return build_report(get_db().cursor(), date_from, date_to, len(TableManager.get_all_tables()),
+                        time_to_minutes(app.config['OPENING_TIME']), time_to_minutes(app.config['CLOSING_TIME']),
+                        standing_occurrences(date_from, date_to))
+
+# Caché de respuestas ya renderizadas por URL, válidas mientras no cambie su versión
+class ResponseCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
     
-    def set_customer_info(self, name, phone):
-        self.reservation.customer_name = name
-        self.reservation.customer_phone = phone
-        return self
+    def get(self, key, etag):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
     
-    def set_table(self, table_id):
-        self.reservation.table_id = table_id
-        return self
+    def put(self, key, etag, body, mimetype):
+        entry = (etag, body, mimetype, datetime.now(timezone.utc).replace(microsecond=0))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
     
-    def set_date_time(self, date, start_time, end_time):
-        self.reservation.reservation_date = date
-        self.reservation.start_time = start_time
-        self.reservation.end_time = end_time
-        return self
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_response_caches = {}
+
+def get_response_cache():
+    database = get_database()
+    with _registry_lock:
+        cache = _response_caches.get(database)
+        if cache is None:
+            cache = _response_caches[database] = ResponseCache(app.config['RESPONSE_CACHE_SIZE'])
+    return cache
+
+def data_etag(reservation_date=None):
+    # Versión del catálogo de mesas más la de las reservas: la de una fecha concreta
+    # si la respuesta solo depende de ese día, o la global si no. Incluye el día de
+    # hoy porque algunas páginas lo muestran
+    cursor = get_db().cursor()
+    cursor.execute("SELECT key, version FROM catalog_meta")
+    versions = dict(cursor.fetchall())
+    if reservation_date is None:
+        reservations_version = f"r{versions['reservations']}.{versions['recurring']}"
+    else:
+        reservations_version = f"d{get_day_version(cursor, reservation_date)}"
+    return f"{versions['tables']}-{reservations_version}-{datetime.now():%Y%m%d}"
+
+def cached_response(per_date=False):
+    # ETag/Last-Modified y caché del cuerpo por endpoint y parámetros: una petición
+    # condicional responde 304 y una repetida se sirve sin SQL ni Jinja
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Los mensajes flash pendientes y las respuestas en streaming no se cachean
+            if (not app.config['RESPONSE_CACHE'] or '_flashes' in session or request.args.get('stream')
+                    or 'profiler' in g):
+                return view(*args, **kwargs)
+            
+            etag = data_etag(request.args.get('reservation_date') if per_date else None)
+            # Con el prefijo de sede los enlaces de la página cambian aunque los datos no
+            key = (request.script_root, request.endpoint, tuple(sorted(request.args.items(multi=True))))
+            cache = get_response_cache()
+            entry = cache.get(key, etag)
+            if entry is None:
+                # La versión se lee antes que los datos: si cambian entre medias, la
+                # siguiente petición verá otra versión y volverá a renderizar
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                entry = cache.put(key, etag, response.get_data(), response.mimetype)
+            
+            _, body, mimetype, last_modified = entry
+            response = Response(body, mimetype=mimetype)
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            # El navegador debe revalidar siempre; con el ETag la respuesta es un 304
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+def init_venues():
+    # Esquema y migraciones en la base de datos de cada sede
+    for venue in venue_names():
+        with venue_context(venue):
+            init_db()
+
+def venue_summary(date_from, date_to):
+    # Resumen de una sede para el informe conjunto: reservas, comensales y cancelaciones
+    summary = venue_totals(get_db().cursor(), date_from, date_to, standing_occurrences(date_from, date_to))
+    return dict(summary, tables=len(TableManager.get_all_tables()))
+
+# Métricas del proceso en el formato de texto de Prometheus. Con varios workers cada
+# proceso lleva las suyas y /metrics muestra las del que atiende la petición
+class Metrics:
+    LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
     
-    def set_guests(self, guests):
-        self.reservation.guests = guests
-        return self
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._latency = {}
+        self._queries = {}
     
-    def set_type(self, reservation_type):
-        self.reservation.type = reservation_type
-        return self
+    def observe_request(self, endpoint, method, status, seconds, stats=None):
+        with self._lock:
+            key = (endpoint, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            # Un contador por cubo más la suma de segundos; se acumulan al exportar
+            latency = self._latency.get(endpoint)
+            if latency is None:
+                latency = self._latency[endpoint] = [0] * (len(self.LATENCY_BUCKETS) + 1) + [0.0]
+            latency[bisect_left(self.LATENCY_BUCKETS, seconds)] += 1
+            latency[-1] += seconds
+            if stats is not None:
+                queries = self._queries.setdefault(endpoint, [0, 0.0])
+                queries[0] += stats.statements
+                queries[1] += stats.seconds
     
-    def set_status(self, status):
-        self.reservation.status = status
-        return self
+    @staticmethod
+    def _labels(**labels):
+        pairs = []
+        for name, value in labels.items():
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+            pairs.append(f'{name}="{value}"')
+        return '{' + ','.join(pairs) + '}'
     
-    def build(self):
-        return self.reservation
+    def render(self, caches=()):
+        with self._lock:
+            requests = sorted(self._requests.items())
+            latency = sorted((endpoint, list(values)) for endpoint, values in self._latency.items())
+            queries = sorted((endpoint, list(values)) for endpoint, values in self._queries.items())
+        
+        lines = ['# TYPE reserva_requests_total counter']
+        for (endpoint, method, status), count in requests:
+            lines.append(f"reserva_requests_total{self._labels(endpoint=endpoint, method=method, status=status)} {count}")
+        
+        lines.append('# TYPE reserva_request_duration_seconds histogram')
+        for endpoint, values in latency:
+            cumulative = 0
+            for bound, count in zip(self.LATENCY_BUCKETS + ('+Inf',), values):
+                cumulative += count
+                lines.append(f"reserva_request_duration_seconds_bucket{self._labels(endpoint=endpoint, le=bound)} {cumulative}")
+            lines.append(f"reserva_request_duration_seconds_sum{self._labels(endpoint=endpoint)} {values[-1]:.6f}")
+            lines.append(f"reserva_request_duration_seconds_count{self._labels(endpoint=endpoint)} {cumulative}")
+        
+        lines.append('# TYPE reserva_sql_statements_total counter')
+        lines.extend(f"reserva_sql_statements_total{self._labels(endpoint=endpoint)} {statements}"
+                     for endpoint, (statements, _) in queries)
+        lines.append('# TYPE reserva_sql_seconds_total counter')
+        lines.extend(f"reserva_sql_seconds_total{self._labels(endpoint=endpoint)} {seconds:.6f}"
+                     for endpoint, (_, seconds) in queries)
+        
+        caches = list(caches)
+        for name, kind in (('hits', 'counter'), ('misses', 'counter'), ('hit_ratio', 'gauge')):
+            lines.append(f'# TYPE reserva_cache_{name}{"_total" if kind == "counter" else ""} {kind}')
+            for cache, database, hits, misses in caches:
+                labels = self._labels(cache=cache, database=database)
+                if name == 'hit_ratio':
+                    lines.append(f"reserva_cache_hit_ratio{labels} {hits / (hits + misses) if hits + misses else 0:.4f}")
+                else:
+                    lines.append(f"reserva_cache_{name}_total{labels} {hits if name == 'hits' else misses}")
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+def cache_statistics():
+    # (caché, base de datos, aciertos, fallos) de las cachés de cada base de datos
+    with _registry_lock:
+        registries = (('response', list(_response_caches.items())),
+                      ('availability_index', list(_indexes.items())),
+                      ('table_catalog', list(_catalogs.items())),
+                      ('recurring_rules', list(_recurring_indexes.items())),
+                      ('waitlist', list(_waitlist_indexes.items())))
+    return [(cache, database, instance.hits, instance.misses)
+            for cache, instances in registries for database, instance in instances]
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if app.config['PROFILING'] and request.args.get('profile') == '1':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def finish_request_timer(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(app.config['PROFILING_LIMIT'])
+        response = Response(output.getvalue(), mimetype='text/plain')
+    # Un flujo de eventos dura lo que la conexión: no cuenta como latencia de la ruta
+    if response.mimetype == 'text/event-stream':
+        g.pop('request_started', None)
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_metrics(exception):
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    stats = getattr(g.get('db'), 'stats', None)
+    status = g.get('response_status', 500)
+    if app.config['METRICS']:
+        metrics.observe_request(request.endpoint or '', request.method, status, seconds, stats)
+    if seconds >= app.config['SLOW_REQUEST_SECONDS']:
+        app.logger.warning("slow_request endpoint=%s method=%s status=%s seconds=%.3f sql_statements=%s sql_seconds=%s",
+                           request.endpoint, request.method, status, seconds,
+                           stats.statements if stats else '-', f'{stats.seconds:.3f}' if stats else '-')
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Crea el esquema y aplica las migraciones pendientes en cada sede (antes de arrancar los workers).
+
+    Los demás comandos trabajan sobre la sede de FLASK_DEFAULT_VENUE.
+    """
+    init_venues()
+    click.echo('Base de datos inicializada.')
+
+@app.cli.command('optimize-day')
+@click.argument('reservation_date')
+@click.option('--apply', is_flag=True, help='Guardar los cambios de mesa.')
+def optimize_day_command(reservation_date, apply):
+    """Reasigna las mesas de un día para aprovechar mejor la capacidad."""
+    try:
+        report = optimize_day(reservation_date, apply=apply)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for move in report['moved']:
+        click.echo(f"Reserva {move['id']}: mesa {move['from']} -> {move['to']}")
+    click.echo(f"{len(report['moved'])} reservas {'movidas' if apply else 'a mover'}")
+
+@app.cli.command('import-reservations')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']))
+def import_reservations_command(path, file_format):
+    """Importa reservas desde un fichero CSV o JSON Lines."""
+    with open(path, encoding='utf-8', newline='') as stream:
+        report = ReservationImporter().import_stream(stream, file_format or guess_file_format(path))
+    click.echo(f"{report['imported']} reservas importadas, {len(report['rejected'])} rechazadas")
+    for reject in report['rejected']:
+        click.echo(f"Fila {reject['row']}: {reject['error']}", err=True)
+
+@app.cli.command('export-reservations')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True), default='-')
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']))
+def export_reservations_command(path, file_format):
+    """Exporta todas las reservas a CSV o JSON Lines."""
+    with click.open_file(path, 'w', encoding='utf-8') as output:
+        for chunk in export_reservations(file_format or guess_file_format(path)):
+            output.write(chunk)
+
+@app.cli.command('archive-reservations')
+@click.option('--before', help='Archivar las reservas anteriores a esta fecha (AAAA-MM-DD).')
+def archive_reservations_command(before):
+    """Mueve las reservas pasadas a los ficheros de archivo mensuales."""
+    try:
+        archived = archive_reservations(before)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for month, count in archived.items():
+        click.echo(f"{month}: {count} reservas archivadas en {archive_path(month)}")
+    click.echo(f"{sum(archived.values())} reservas archivadas")
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recalcula los agregados de analítica desde las reservas vivas y archivadas."""
+    rebuild_rollups()
+    cursor = get_db().execute("SELECT COUNT(*), MIN(reservation_date), MAX(reservation_date) FROM rollup_daily")
+    rows, first, last = cursor.fetchone()
+    click.echo(f"{rows} filas de agregados diarios ({first} a {last})")
+
+@app.cli.command('dedupe-customers')
+def dedupe_customers_command():
+    """Crea los clientes que falten y enlaza con ellos las reservas sin cliente."""
+    with write_transaction() as cursor:
+        linked = dedupe_customers(cursor)
+    click.echo(f"{linked} reservas enlazadas con su cliente")
 
 # Rutas de Flask
 @app.route('/')
@@ -305,6 +3468,7 @@ def index():
     return render_template('index.html', tables=tables)
 
 @app.route('/tables')
+@cached_response(per_date=True)
 def view_tables():
     tables = TableManager.get_all_tables()
     reservation_date = request.args.get('reservation_date')
@@ -312,16 +3476,20 @@ def view_tables():
     end_time = request.args.get('end_time')
     
     if reservation_date and start_time and end_time:
-        if start_time >= end_time:
-            flash('La hora de fin debe ser posterior a la hora de inicio.', 'error')
+        try:
+            check_date(reservation_date)
+            start_minute, end_minute = time_to_minutes(start_time), time_to_minutes(end_time)
+            if start_minute >= end_minute:
+                raise ValueError('La hora de fin debe ser posterior a la hora de inicio.')
+        except ValueError as e:
+            flash(str(e), 'error')
             tables_with_status = [
                 {'id': table.id, 'number': table.number, 'capacity': table.capacity, 'location': table.location, 'status': None}
                 for table in tables
             ]
         else:
             tables_with_status = []
-            for table in tables:
-                is_available = TableManager.is_table_available(table.id, reservation_date, start_time, end_time)
+            for table, is_available in TableManager.get_tables_availability(reservation_date, start_minute, end_minute):
                 tables_with_status.append({
                     'id': table.id,
                     'number': table.number,
@@ -329,7 +3497,9 @@ def view_tables():
                     'location': table.location,
                     'status': 'available' if is_available else 'reserved'
                 })
-            print(f"Tables for {reservation_date} {start_time}-{end_time}: {[t['id'] for t in tables_with_status if t['status'] == 'available']} available")
+            if app.logger.isEnabledFor(logging.DEBUG):
+                app.logger.debug("tables date=%s start=%s end=%s available=%s", reservation_date, start_time, end_time,
+                                 [t['id'] for t in tables_with_status if t['status'] == 'available'])
     else:
         tables_with_status = [
             {'id': table.id, 'number': table.number, 'capacity': table.capacity, 'location': table.location, 'status': None}
@@ -340,62 +3510,89 @@ def view_tables():
                          start_time=start_time, end_time=end_time, today=datetime.now().strftime('%Y-%m-%d'))
 
 @app.route('/reservations')
+@cached_response()
 def view_reservations():
-    conn = sqlite3.connect('restaurant.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('''
-    SELECT r.*, t.number as table_number 
-    FROM reservations r 
-    JOIN tables t ON r.table_id = t.id
-    ORDER BY r.reservation_date, r.start_time
-    ''')
-    reservations = cursor.fetchall()
-    conn.close()
+    filters = {
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', ''),
+        'status': request.args.get('status', ''),
+    }
+    for key in ('date_from', 'date_to'):
+        if filters[key]:
+            try:
+                check_date(filters[key])
+            except ValueError as e:
+                if request.args.get('format') == 'json':
+                    return jsonify({'error': str(e)}), 400
+                flash(str(e), 'error')
+                filters[key] = ''
+    limit = request.args.get('limit', app.config['RESERVATIONS_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['RESERVATIONS_MAX_PAGE_SIZE']))
+    after = decode_page_key(request.args.get('after'))
+    # Las reservas archivadas solo se consultan cuando se pide el histórico
+    history = bool(request.args.get('history'))
+    query = query_reservation_history if history else query_reservations
     
-    formatted_reservations = []
-    for res in reservations:
-        res_dict = dict(res)
-        start_time = datetime.strptime(res['start_time'], '%H:%M')
-        end_time = datetime.strptime(res['end_time'], '%H:%M')
-        res_dict['start_time'] = start_time.strftime('%I:%M %p')
-        res_dict['end_time'] = end_time.strftime('%I:%M %p')
-        formatted_reservations.append(res_dict)
+    reservations, next_key = query(after=after, limit=limit, **filters)
+    active_filters = {key: value for key, value in filters.items() if value}
+    if history:
+        active_filters['history'] = 1
+    first_url = url_for('view_reservations', **active_filters) if after else None
+    next_url = url_for('view_reservations', after=next_key, limit=limit, **active_filters) if next_key else None
     
-    return render_template('reservations.html', reservations=formatted_reservations)
+    if request.args.get('format') == 'json':
+        return jsonify({'reservations': [format_reservation(res, TIME_LABELS) for res in reservations],
+                        'next': next_key})
+    
+    formatted_reservations = (format_reservation(res) for res in reservations)
+    if request.args.get('stream'):
+        return Response(stream_template('reservations.html', reservations=formatted_reservations,
+                                        filters=filters, history=history, first_url=first_url,
+                                        next_url=next_url, today=date.today().isoformat()))
+    return render_template('reservations.html', reservations=formatted_reservations,
+                           filters=filters, history=history, first_url=first_url, next_url=next_url,
+                           today=date.today().isoformat())
 
 @app.route('/new_reservation', methods=['GET', 'POST'])
 def new_reservation():
     if request.method == 'POST':
         customer_name = request.form['customer_name']
         customer_phone = request.form['customer_phone']
-        table_id = int(request.form['table_id'])
         reservation_date = request.form['reservation_date']
         start_time = request.form['start_time']
         end_time = request.form['end_time']
         guests = int(request.form['guests'])
         reservation_type = request.form['reservation_type']
-        
-        # Validate time slot
-        if start_time >= end_time:
-            flash('La hora de fin debe ser posterior a la hora de inicio.', 'error')
+        try:
+            check_date(reservation_date)
+            start_minute, end_minute = time_to_minutes(start_time), time_to_minutes(end_time)
+        except ValueError as e:
+            flash(str(e), 'error')
             tables = TableManager.get_all_tables()
             return render_template('new_reservation.html', tables=tables, form_data=request.form)
         
-        # Validate operating hours
-        if start_time < '10:00' or end_time > '22:00':
-            flash('Las reservas deben estar entre las 10:00 y las 22:00.', 'error')
-            tables = TableManager.get_all_tables()
-            return render_template('new_reservation.html', tables=tables, form_data=request.form)
+        # Asignación automática: la mejor mesa libre o, si ninguna basta, varias mesas juntas
+        joined_table_ids = []
+        if request.form['table_id'] == 'auto':
+            allocator = TableAllocator(reservation_date)
+            table = allocator.choose(guests, start_minute, end_minute, reservation_type)
+            combination = [table] if table else allocator.choose_combination(guests, start_minute, end_minute)
+            if not combination:
+                flash('No hay ninguna mesa libre para ese número de personas en el horario seleccionado.', 'error')
+                tables = TableManager.get_all_tables()
+                return render_template('new_reservation.html', tables=tables, form_data=request.form,
+                                       suggestions=alternative_slots(guests, reservation_date, start_minute,
+                                                                     end_minute, reservation_type))
+            table_id = combination[0].id
+            joined_table_ids = [table.id for table in combination[1:]]
+        else:
+            table_id = int(request.form['table_id'])
         
-        # Validate guests against table capacity
-        conn = sqlite3.connect('restaurant.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT capacity FROM tables WHERE id = ?", (table_id,))
-        table_capacity = cursor.fetchone()[0]
-        conn.close()
-        if guests > table_capacity:
-            flash(f'El número de personas ({guests}) excede la capacidad de la mesa ({table_capacity}).', 'error')
+        # Validate time slot, operating hours and guests against table capacity
+        table_capacity = TableManager.get_capacity([table_id] + joined_table_ids)
+        error = validate_reservation(start_minute, end_minute, guests, table_capacity)
+        if error:
+            flash(error, 'error')
             tables = TableManager.get_all_tables()
             return render_template('new_reservation.html', tables=tables, form_data=request.form)
         
@@ -404,6 +3601,7 @@ def new_reservation():
         reservation = (builder
             .set_customer_info(customer_name, customer_phone)
             .set_table(table_id)
+            .set_joined_tables(joined_table_ids)
             .set_date_time(reservation_date, start_time, end_time)
             .set_guests(guests)
             .set_type(reservation_type)
@@ -416,8 +3614,11 @@ def new_reservation():
         except ValueError as e:
             flash(str(e), 'error')
             tables = TableManager.get_all_tables()
-            print(f"Error saving reservation: {str(e)}")
-            return render_template('new_reservation.html', tables=tables, form_data=request.form)
+            app.logger.warning("reservation_rejected date=%s start=%s end=%s error=%s",
+                               reservation_date, start_time, end_time, e)
+            return render_template('new_reservation.html', tables=tables, form_data=request.form,
+                                   suggestions=alternative_slots(guests, reservation_date, start_minute,
+                                                                 end_minute, reservation_type))
     
     # For GET requests, show available tables
     tables = TableManager.get_all_tables()
@@ -426,17 +3627,23 @@ def new_reservation():
     end_time = request.args.get('end_time')
     table_id = request.args.get('table_id')
     
+    available_tables = tables
     if reservation_date and start_time and end_time:
-        available_tables = [
-            table for table in tables
-            if TableManager.is_table_available(table.id, reservation_date, start_time, end_time)
-        ]
-        print(f"Available tables for {reservation_date} {start_time}-{end_time}: {[table.id for table in available_tables]}")
-    else:
-        available_tables = tables
+        try:
+            check_date(reservation_date)
+            start_minute, end_minute = time_to_minutes(start_time), time_to_minutes(end_time)
+        except ValueError:
+            pass
+        else:
+            available_tables = TableManager.get_available_tables(reservation_date, start_minute, end_minute)
+            if app.logger.isEnabledFor(logging.DEBUG):
+                app.logger.debug("available_tables date=%s start=%s end=%s tables=%s", reservation_date, start_time,
+                                 end_time, [table.id for table in available_tables])
     
     return render_template('new_reservation.html', tables=available_tables, 
                          form_data={
+                             'customer_name': request.args.get('customer_name', ''),
+                             'customer_phone': request.args.get('customer_phone', ''),
                              'reservation_date': reservation_date or '',
                              'start_time': start_time or '19:00',
                              'end_time': end_time or '21:00',
@@ -505,39 +3712,359 @@ def use_template(template_type):
                           today=today)
 
 @app.route('/get_available_tables', methods=['GET'])
+@cached_response(per_date=True)
 def get_available_tables():
     reservation_date = request.args.get('reservation_date')
     start_time = request.args.get('start_time')
     end_time = request.args.get('end_time')
     
     if not (reservation_date and start_time and end_time):
-        print("Missing date/time parameters for get_available_tables")
+        app.logger.debug("available_tables missing=date/time")
         return jsonify({'tables': []})
+    try:
+        check_date(reservation_date)
+        start_minute, end_minute = time_to_minutes(start_time), time_to_minutes(end_time)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    tables = TableManager.get_all_tables()
     available_tables = [
         {'id': table.id, 'number': table.number, 'capacity': table.capacity, 'location': table.location}
-        for table in tables
-        if TableManager.is_table_available(table.id, reservation_date, start_time, end_time)
+        for table in TableManager.get_available_tables(reservation_date, start_minute, end_minute)
     ]
     
-    print(f"Returning {len(available_tables)} available tables for {reservation_date} {start_time}-{end_time}")
+    app.logger.debug("available_tables date=%s start=%s end=%s count=%d",
+                     reservation_date, start_time, end_time, len(available_tables))
     return jsonify({'tables': available_tables})
 
+@app.route('/suggest_table', methods=['GET'])
+def suggest_table():
+    reservation_date = request.args.get('reservation_date')
+    start_time = request.args.get('start_time')
+    end_time = request.args.get('end_time')
+    guests = request.args.get('guests', type=int)
+    if not (reservation_date and start_time and end_time and guests):
+        return jsonify({'table': None, 'tables': []})
+    try:
+        check_date(reservation_date)
+        start_minute, end_minute = time_to_minutes(start_time), time_to_minutes(end_time)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    allocator = TableAllocator(reservation_date)
+    table = allocator.choose(guests, start_minute, end_minute, request.args.get('reservation_type', 'standard'))
+    combination = [table] if table else allocator.choose_combination(guests, start_minute, end_minute)
+    if not combination:
+        return jsonify({'table': None, 'tables': []})
+    tables = [
+        {'id': table.id, 'number': table.number, 'capacity': table.capacity, 'location': table.location}
+        for table in combination
+    ]
+    return jsonify({'table': tables[0] if table else None, 'tables': tables})
+
+def alternative_slots(guests, reservation_date, start_minute, end_minute, reservation_type):
+    # Huecos que se ofrecen en el formulario cuando la mesa u hora pedidas están ocupadas
+    try:
+        return find_next_slots(guests, reservation_date, start_minute, end_minute,
+                               reservation_type=reservation_type)
+    except ValueError:
+        return []
+
+@app.route('/next_available_slots', methods=['GET'])
+def next_available_slots():
+    # Huecos libres más cercanos a la fecha y hora pedidas (±hours, próximos days días)
+    reservation_date = request.args.get('reservation_date')
+    start_time = request.args.get('start_time')
+    end_time = request.args.get('end_time')
+    guests = request.args.get('guests', type=int)
+    if not (reservation_date and start_time and end_time and guests):
+        return jsonify({'error': 'Faltan reservation_date, start_time, end_time o guests.'}), 400
+    limit = request.args.get('limit', type=int)
+    try:
+        slots = find_next_slots(guests, reservation_date, time_to_minutes(start_time), time_to_minutes(end_time),
+                                hours=request.args.get('hours', type=int), days=request.args.get('days', type=int),
+                                reservation_type=request.args.get('reservation_type', 'standard'),
+                                limit=max(1, min(limit, 50)) if limit else None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'slots': slots})
+
+@app.route('/optimize_day', methods=['POST'])
+def optimize_day_view():
+    data = request.get_json(silent=True) or {}
+    reservation_date = data.get('reservation_date')
+    if not reservation_date:
+        return jsonify({'error': 'Falta la fecha.'}), 400
+    try:
+        pending = [
+            {'guests': int(item['guests']), 'start_time': item['start_time'], 'end_time': item['end_time'],
+             'start_minute': time_to_minutes(item['start_time']), 'end_minute': time_to_minutes(item['end_time']),
+             'type': item.get('type', 'standard')}
+            for item in data.get('pending', [])
+        ]
+        return jsonify(optimize_day(check_date(reservation_date), pending, apply=bool(data.get('apply'))))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/availability_grid', methods=['GET'])
+@cached_response(per_date=True)
+def availability_grid():
+    # Disponibilidad del día completo: el formulario resuelve cualquier horario sin más peticiones
+    reservation_date = request.args.get('reservation_date')
+    granularity = request.args.get('granularity', app.config['AVAILABILITY_GRID_MINUTES'], type=int)
+    if not reservation_date or not 1 <= granularity <= 120:
+        return jsonify({'error': 'Parámetros no válidos.'}), 400
+    try:
+        check_date(reservation_date)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    slot_count, grid = TableManager.get_availability_grid(reservation_date, granularity)
+    return jsonify({
+        'reservation_date': reservation_date,
+        'open': app.config['OPENING_TIME'],
+        'close': app.config['CLOSING_TIME'],
+        'granularity': granularity,
+        'slots': slot_count,
+        'tables': [
+            {'id': table.id, 'number': table.number, 'capacity': table.capacity, 'location': table.location,
+             'busy': busy}
+            for table, busy in grid
+        ],
+    })
+
+@app.route('/availability_events', methods=['GET'])
+def availability_events():
+    # Server-sent events con los cambios de disponibilidad de una fecha: 'booked' y
+    # 'released' con las mesas y el horario, 'reload' cuando hay que volver a consultar
+    reservation_date = request.args.get('reservation_date')
+    if not reservation_date:
+        return jsonify({'error': 'Falta la fecha (reservation_date).'}), 400
+    try:
+        check_date(reservation_date)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    bus = get_availability_bus()
+    subscription = bus.subscribe(reservation_date)
+    if subscription is None:
+        return jsonify({'error': 'Demasiadas pantallas conectadas; vuelva a intentarlo más tarde.'}), 503
+    
+    # El flujo no retiene una conexión a la base de datos: solo la pide al comprobar versiones
+    pool = get_pool()
+    revalidate = app.config['AVAILABILITY_INDEX_REVALIDATE']
+    keepalive = app.config['AVAILABILITY_EVENTS_KEEPALIVE']
+    wait = app.config['AVAILABILITY_EVENTS_POLL'] if revalidate else keepalive
+    
+    def day_version():
+        conn = pool.acquire()
+        try:
+            return get_day_version(conn.cursor(), reservation_date)
+        finally:
+            pool.release(conn)
+    
+    def stream():
+        version = day_version() if revalidate else None
+        last_sent = time.monotonic()
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                event, data = subscription.get(timeout=wait)
+                yield f'event: {event}\ndata: {json.dumps(data)}\n\n'
+                last_sent = time.monotonic()
+                continue
+            except queue.Empty:
+                pass
+            # Con varios procesos los cambios de los demás solo se ven en la versión de la fecha
+            if revalidate:
+                current = day_version()
+                if current != version:
+                    version = current
+                    yield 'event: reload\ndata: {}\n\n'
+                    last_sent = time.monotonic()
+                    continue
+            # Un comentario periódico detecta los clientes desconectados
+            if time.monotonic() - last_sent >= keepalive:
+                yield ': keepalive\n\n'
+                last_sent = time.monotonic()
+    
+    response = Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # El servidor cierra la respuesta al desconectarse el cliente, incluso si el flujo no llegó a empezar
+    response.call_on_close(lambda: bus.unsubscribe(reservation_date, subscription))
+    return response
+
+@app.route('/recurring_reservations', methods=['GET', 'POST'])
+def recurring_reservations():
+    if request.method == 'POST':
+        form = request.form
+        try:
+            table_id = int(form['table_id'])
+            guests = int(form['guests'])
+            start_minute, end_minute = time_to_minutes(form['start_time']), time_to_minutes(form['end_time'])
+            rule = RecurrenceRule(rrule_from_form(form), form['dtstart'])
+            capacity = TableManager.get_capacity([table_id])
+            if capacity is None:
+                raise ValueError('La mesa seleccionada no existe.')
+            error = validate_reservation(start_minute, end_minute, guests, capacity)
+            if error:
+                raise ValueError(error)
+            create_standing_reservation(form['customer_name'], form['customer_phone'], table_id, start_minute,
+                                        end_minute, guests, form.get('reservation_type', 'standard'), rule)
+        except KeyError:
+            flash('Faltan datos en el formulario.', 'error')
+        except ValueError as e:
+            flash(str(e), 'error')
+        else:
+            flash('Reserva fija creada correctamente.', 'success')
+            return redirect(url_for('recurring_reservations'))
+    
+    # Las próximas fechas de cada regla, con una sola expansión para todas
+    today = date.today()
+    upcoming = {}
+    index = get_recurring_index()
+    for reservation_date, occurrence in index.occurrences_between(today.isoformat(),
+                                                                  (today + timedelta(days=60)).isoformat()):
+        upcoming.setdefault(occurrence.id, []).append(reservation_date)
+    standing = [{'rule': rule, 'table': TableManager.get_table(rule.table_id), 'upcoming': upcoming.get(rule.id, [])[:3],
+                 'start_time': TIME_LABELS[rule.start_minute], 'end_time': TIME_LABELS[rule.end_minute]}
+                for rule in index.snapshot().rules]
+    return render_template('recurring_reservations.html', standing=standing, tables=TableManager.get_all_tables(),
+                           form_data=request.form, today=today.isoformat(), weekdays=RecurrenceRule.WEEKDAYS,
+                           day_names=RecurrenceRule.DAY_NAMES)
+
+@app.route('/recurring_reservations/<int:rule_id>/cancel', methods=['POST'])
+def cancel_recurring_reservation(rule_id):
+    if cancel_standing_reservation(rule_id):
+        flash('Reserva fija cancelada.', 'success')
+    else:
+        flash('La reserva fija no existe o ya estaba cancelada.', 'error')
+    return redirect(url_for('recurring_reservations'))
+
+@app.route('/recurring_reservations/<int:rule_id>/skip', methods=['POST'])
+def skip_recurring_occurrence(rule_id):
+    reservation_date = request.form.get('reservation_date', '')
+    try:
+        skipped = skip_standing_occurrence(rule_id, reservation_date)
+    except ValueError:
+        skipped = False
+    if skipped:
+        flash(f'Reserva fija anulada para el {reservation_date}.', 'success')
+    else:
+        flash('Esa fecha no corresponde a la reserva fija.', 'error')
+    return redirect(url_for('view_reservations'))
+
+@app.route('/waitlist', methods=['GET', 'POST'])
+def waitlist():
+    reservation_date = request.values.get('reservation_date') or date.today().isoformat()
+    if request.method == 'POST':
+        form = request.form
+        try:
+            guests = int(form['guests'])
+            duration = int(form['duration'])
+            window_start, window_end = time_to_minutes(form['window_start']), time_to_minutes(form['window_end'])
+            check_date(reservation_date)
+            if reservation_date < date.today().isoformat():
+                raise ValueError('La fecha ya ha pasado.')
+            error = validate_reservation(window_start, window_end, guests, guests)
+            if error:
+                raise ValueError(error)
+            if duration <= 0 or window_start + duration > window_end:
+                raise ValueError('La duración no cabe en la franja indicada.')
+            # Los huecos se reparten mesa a mesa: el grupo debe caber en una sola
+            if not any(table.capacity >= guests for table in TableManager.get_all_tables()):
+                raise ValueError(f'Ninguna mesa admite {guests} personas.')
+            entry = add_waitlist_entry(form['customer_name'], form['customer_phone'], reservation_date,
+                                       window_start, window_end, duration, guests,
+                                       form.get('reservation_type', 'standard'), bool(form.get('auto_book')))
+        except KeyError:
+            flash('Faltan datos en el formulario.', 'error')
+        except ValueError as e:
+            flash(str(e), 'error')
+        else:
+            flash(f'{entry.customer_name} está en la lista de espera del {reservation_date}.', 'success')
+            return redirect(url_for('waitlist', reservation_date=reservation_date))
+    
+    cursor = get_db().cursor()
+    cursor.execute('''
+    SELECT w.*, t.number AS offer_table_number FROM waitlist w
+    LEFT JOIN tables t ON t.id = w.offer_table_id
+    WHERE w.reservation_date = ? AND w.status != 'cancelled'
+    ORDER BY w.status = 'booked', w.id
+    ''', (reservation_date,))
+    entries = [dict(row, window_start=TIME_LABELS[row['window_start']], window_end=TIME_LABELS[row['window_end']],
+                    offer_start=TIME_LABELS[row['offer_start_minute']] if row['offer_start_minute'] is not None else None,
+                    offer_end=(TIME_LABELS[row['offer_start_minute'] + row['duration']]
+                               if row['offer_start_minute'] is not None else None))
+               for row in cursor.fetchall()]
+    return render_template('waitlist.html', entries=entries, reservation_date=reservation_date,
+                           form_data=request.form if request.method == 'POST' else request.args,
+                           today=date.today().isoformat())
+
+@app.route('/waitlist/<int:entry_id>/accept', methods=['POST'])
+def accept_waitlist_entry(entry_id):
+    try:
+        match = accept_waitlist_offer(entry_id)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('waitlist', reservation_date=request.form.get('reservation_date')))
+    if match is not None:
+        flash(waitlist_message(match), 'success')
+    else:
+        flash('El hueco ofrecido ya no está libre: la petición vuelve a la lista de espera.', 'error')
+    return redirect(url_for('waitlist', reservation_date=request.form.get('reservation_date')))
+
+@app.route('/waitlist/<int:entry_id>/cancel', methods=['POST'])
+def cancel_waitlist(entry_id):
+    if cancel_waitlist_entry(entry_id):
+        flash('Petición retirada de la lista de espera.', 'success')
+    else:
+        flash('La petición no existe o ya no está en espera.', 'error')
+    return redirect(url_for('waitlist', reservation_date=request.form.get('reservation_date')))
+
+def release_reservation(reservation_id, status):
+    # Cancelación o no presentado: la reserva deja de ocupar sus mesas. Devuelve las
+    # peticiones de la lista de espera atendidas con el hueco
+    def release(cursor):
+        booking = load_booking(cursor, reservation_id)
+        cursor.execute("UPDATE reservations SET status = ? WHERE id = ?", (status, reservation_id))
+        # El hueco se ofrece a la lista de espera antes de que nadie más pueda ocuparlo
+        matches = fill_from_waitlist(cursor, booking[0], freed_intervals(booking, None)) if booking else []
+        return booking, matches
+    
+    booking, matches = run_write(release)
+    get_availability_index().remove(reservation_id)
+    if booking is not None:
+        publish_booking('released', reservation_id, *booking)
+    waitlist_matched(matches)
+    return matches
+
 @app.route('/cancel_reservation/<int:reservation_id>', methods=['POST'])
 def cancel_reservation(reservation_id):
-    conn = sqlite3.connect('restaurant.db')
-    cursor = conn.cursor()
-    cursor.execute("UPDATE reservations SET status = 'cancelled' WHERE id = ?", (reservation_id,))
-    conn.commit()
-    conn.close()
+    matches = release_reservation(reservation_id, 'cancelled')
     flash('Reserva cancelada exitosamente!', 'success')
+    for match in matches:
+        flash(waitlist_message(match), 'success')
+    return redirect(url_for('view_reservations'))
+
+@app.route('/no_show/<int:reservation_id>', methods=['POST'])
+def mark_no_show(reservation_id):
+    cursor = get_db().cursor()
+    cursor.execute("SELECT reservation_date, status FROM reservations WHERE id = ?", (reservation_id,))
+    reservation = cursor.fetchone()
+    if reservation is None or reservation['status'] != 'confirmed':
+        flash('Solo una reserva confirmada puede marcarse como no presentada.', 'error')
+    elif reservation['reservation_date'] > date.today().isoformat():
+        flash('La reserva todavía no ha llegado.', 'error')
+    else:
+        matches = release_reservation(reservation_id, 'no_show')
+        flash('Reserva marcada como no presentada.', 'success')
+        for match in matches:
+            flash(waitlist_message(match), 'success')
     return redirect(url_for('view_reservations'))
 
 @app.route('/edit_reservation/<int:reservation_id>', methods=['GET', 'POST'])
 def edit_reservation(reservation_id):
-    conn = sqlite3.connect('restaurant.db')
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cursor = conn.cursor()
     
     # Fetch the existing reservation
@@ -562,41 +4089,25 @@ def edit_reservation(reservation_id):
         end_time = request.form['end_time']
         guests = int(request.form['guests'])
         reservation_type = request.form['reservation_type']
-        
-        # Validate time slot
-        if start_time >= end_time:
-            flash('La hora de fin debe ser posterior a la hora de inicio.', 'error')
-            tables = TableManager.get_all_tables()
-            return render_template('new_reservation.html', tables=tables, form_data=request.form, editing=True, reservation_id=reservation_id)
-        
-        # Validate operating hours
-        if start_time < '10:00' or end_time > '22:00':
-            flash('Las reservas deben estar entre las 10:00 y las 22:00.', 'error')
+        try:
+            check_date(reservation_date)
+            start_minute, end_minute = time_to_minutes(start_time), time_to_minutes(end_time)
+        except ValueError as e:
+            flash(str(e), 'error')
             tables = TableManager.get_all_tables()
             return render_template('new_reservation.html', tables=tables, form_data=request.form, editing=True, reservation_id=reservation_id)
         
-        # Validate guests against table capacity
-        cursor.execute("SELECT capacity FROM tables WHERE id = ?", (table_id,))
-        table_capacity = cursor.fetchone()[0]
-        if guests > table_capacity:
-            flash(f'El número de personas ({guests}) excede la capacidad de la mesa ({table_capacity}).', 'error')
-            tables = TableManager.get_all_tables()
-            return render_template('new_reservation.html', tables=tables, form_data=request.form, editing=True, reservation_id=reservation_id)
+        # Una reserva de grupo conserva sus mesas adicionales mientras no cambie la mesa principal
+        joined_table_ids = []
+        if table_id == reservation['table_id']:
+            cursor.execute("SELECT table_id FROM reservation_tables WHERE reservation_id = ?", (reservation_id,))
+            joined_table_ids = [row[0] for row in cursor.fetchall()]
         
-        # Check table availability, excluding the current reservation
-        cursor.execute('''
-        SELECT COUNT(*) FROM reservations
-        WHERE table_id = ? 
-        AND reservation_date = ?
-        AND status = 'confirmed'
-        AND id != ?
-        AND (
-            (? < end_time AND ? > start_time)
-        )
-        ''', (table_id, reservation_date, reservation_id, start_time, end_time))
-        count = cursor.fetchone()[0]
-        if count > 0:
-            flash('La mesa no está disponible para el horario seleccionado.', 'error')
+        # Validate time slot, operating hours and guests against table capacity
+        table_capacity = TableManager.get_capacity([table_id] + joined_table_ids)
+        error = validate_reservation(start_minute, end_minute, guests, table_capacity)
+        if error:
+            flash(error, 'error')
             tables = TableManager.get_all_tables()
             return render_template('new_reservation.html', tables=tables, form_data=request.form, editing=True, reservation_id=reservation_id)
         
@@ -605,6 +4116,7 @@ def edit_reservation(reservation_id):
         updated_reservation = (builder
             .set_customer_info(customer_name, customer_phone)
             .set_table(table_id)
+            .set_joined_tables(joined_table_ids)
             .set_date_time(reservation_date, start_time, end_time)
             .set_guests(guests)
             .set_type(reservation_type)
@@ -612,25 +4124,22 @@ def edit_reservation(reservation_id):
             .build())
         
         try:
-            # Actualizar la reserva en la base de datos
-            cursor.execute('''
-            UPDATE reservations
-            SET customer_name = ?, customer_phone = ?, table_id = ?, reservation_date = ?,
-                start_time = ?, end_time = ?, guests = ?, type = ?, status = ?
-            WHERE id = ?
-            ''', (customer_name, customer_phone, table_id, reservation_date, start_time, end_time,
-                  guests, reservation_type, 'confirmed', reservation_id))
-            conn.commit()
+            # Comprueba la disponibilidad (excluyendo esta reserva) y actualiza de forma atómica
+            updated_reservation.update(reservation_id)
             flash('Reserva actualizada exitosamente!', 'success')
+            for match in updated_reservation.waitlist_matches:
+                flash(waitlist_message(match), 'success')
             return redirect(url_for('view_reservations'))
+        except ValueError as e:
+            flash(str(e), 'error')
+            tables = TableManager.get_all_tables()
+            return render_template('new_reservation.html', tables=tables, form_data=request.form, editing=True, reservation_id=reservation_id)
         except Exception as e:
-            conn.rollback()
             flash(f'Error al actualizar la reserva: {str(e)}', 'error')
             tables = TableManager.get_all_tables()
-            print(f"Error updating reservation: {str(e)}")
+            app.logger.warning("reservation_update_rejected id=%s date=%s start=%s end=%s error=%s",
+                               reservation_id, reservation_date, start_time, end_time, e)
             return render_template('new_reservation.html', tables=tables, form_data=request.form, editing=True, reservation_id=reservation_id)
-        finally:
-            conn.close()
     
     # For GET requests, pre-fill the form with existing reservation data
     tables = TableManager.get_all_tables()
@@ -639,25 +4148,109 @@ def edit_reservation(reservation_id):
         'customer_phone': reservation['customer_phone'],
         'table_id': str(reservation['table_id']),
         'reservation_date': reservation['reservation_date'],
-        'start_time': reservation['start_time'],
-        'end_time': reservation['end_time'],
+        'start_time': TIME_LABELS[reservation['start_minute']],
+        'end_time': TIME_LABELS[reservation['end_minute']],
         'guests': str(reservation['guests']),
         'reservation_type': reservation['type']
     }
-    conn.close()
     return render_template('new_reservation.html', tables=tables, form_data=form_data, editing=True, reservation_id=reservation_id)
 
+@app.route('/import_reservations', methods=['POST'])
+def import_reservations():
+    upload = request.files.get('file')
+    if upload:
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+        file_format = request.args.get('format') or guess_file_format(upload.filename)
+    else:
+        stream = io.TextIOWrapper(io.BufferedReader(request.stream), encoding='utf-8', newline='')
+        file_format = request.args.get('format', 'csv')
+    
+    if file_format not in ('csv', 'jsonl'):
+        return jsonify({'error': 'Formato no soportado.'}), 400
+    
+    report = ReservationImporter().import_stream(stream, file_format)
+    return jsonify(report)
+
+@app.route('/export_reservations')
+def export_reservations_view():
+    file_format = request.args.get('format', 'csv')
+    if file_format not in ('csv', 'jsonl'):
+        return jsonify({'error': 'Formato no soportado.'}), 400
+    
+    mimetype = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(export_reservations(file_format)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=reservations.{file_format}'})
+
+@app.route('/venues/summary', methods=['GET'])
+def venues_summary():
+    # Informe conjunto de todas las sedes, consultadas en paralelo
+    today = datetime.now().strftime('%Y-%m-%d')
+    date_from = request.args.get('date_from') or today
+    date_to = request.args.get('date_to') or date_from
+    venues = [dict(summary, venue=venue) for venue, summary in across_venues(venue_summary, date_from, date_to)]
+    totals = {key: sum(summary[key] for summary in venues)
+              for key in ('tables', 'reservations', 'standing', 'covers', 'cancelled')}
+    return jsonify({'date_from': date_from, 'date_to': date_to, 'venues': venues, 'totals': totals})
+
+@app.route('/customers', methods=['GET'])
+def customers():
+    query = request.args.get('q', '')
+    results = search_customers(query)
+    if request.args.get('format') == 'json':
+        return jsonify({'customers': [dict(row) for row in results]})
+    return render_template('customers.html', customers=results, query=query)
+
+@app.route('/customers/<int:customer_id>', methods=['GET'])
+def customer_detail(customer_id):
+    cursor = get_db().cursor()
+    cursor.execute("SELECT * FROM customers WHERE id = ?", (customer_id,))
+    customer = cursor.fetchone()
+    if customer is None:
+        flash('El cliente no existe.', 'error')
+        return redirect(url_for('customers'))
+    reservations = [dict(row, start_time=TIME_LABELS[row['start_minute']], end_time=TIME_LABELS[row['end_minute']])
+                    for row in customer_reservations(customer)]
+    return render_template('customer.html', customer=customer, reservations=reservations,
+                           standing=customer_standing_reservations(customer))
+
+@app.route('/analytics', methods=['GET'])
+def analytics():
+    # Por defecto, el mes en curso hasta hoy
+    today = date.today()
+    date_from = request.args.get('date_from') or today.replace(day=1).isoformat()
+    date_to = request.args.get('date_to') or today.isoformat()
+    try:
+        for value in (date_from, date_to):
+            check_date(value)
+        if date_from > date_to:
+            raise ValueError('La fecha inicial es posterior a la final.')
+    except ValueError as e:
+        if request.args.get('format') == 'json':
+            return jsonify({'error': str(e)}), 400
+        flash(str(e), 'error')
+        date_from = date_to = today.isoformat()
+    
+    report = analytics_report(date_from, date_to)
+    if request.args.get('format') == 'json':
+        return jsonify(report)
+    return render_template('analytics.html', report=report)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_view():
+    if not app.config['METRICS']:
+        return jsonify({'error': 'Las métricas están desactivadas.'}), 404
+    return Response(metrics.render(cache_statistics()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/debug_reservations')
 def debug_reservations():
-    conn = sqlite3.connect('restaurant.db')
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM reservations ORDER BY reservation_date, start_time")
+    cursor.execute("SELECT * FROM reservations_hhmm ORDER BY reservation_date, start_minute")
     reservations = cursor.fetchall()
-    conn.close()
     return render_template('reservations.html', reservations=reservations)
 
 if __name__ == '__main__':
-    init_db()       #Comentar la primera vez que se eejecute
-    # reset_db()      #Comentar cuando ya se realizo la primera visita
+    with app.app_context():
+        init_venues()       #Comentar la primera vez que se eejecute
+        # reset_db()      #Comentar cuando ya se realizo la primera visita
     app.run(debug=True)
\ No newline at end of file
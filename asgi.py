@@ -0,0 +1,22 @@
+"""Punto de entrada ASGI para servidores como uvicorn o hypercorn.
+
+    flask --app app init-db
+    uvicorn asgi:application --host 0.0.0.0 --port 8000 --workers 4
+
+La aplicación Flask sigue siendo síncrona: a2wsgi ejecuta cada petición en un
+pool acotado de hilos (las conexiones SQLite del pool más los flujos de eventos),
+de modo que las consultas de disponibilidad y de listados nunca bloquean el bucle
+de eventos.
+El esquema debe crearse antes de arrancar los workers (init-db), ya que varios
+procesos aplicando migraciones a la vez competirían por la base de datos.
+"""
+from a2wsgi import WSGIMiddleware
+
+from app import app
+
+# Con --workers cada proceso tiene su propio índice de disponibilidad
+app.config['AVAILABILITY_INDEX_REVALIDATE'] = True
+
+# Un hilo por conexión del pool más uno por cada flujo de /availability_events
+application = WSGIMiddleware(
+    app, workers=app.config['DB_POOL_SIZE'] + app.config['AVAILABILITY_EVENTS_MAX_SUBSCRIBERS'])
@@ -0,0 +1,107 @@
+"""Asignación automática de mesas en días completos sintéticos.
+
+Mide la elección de mesa para una reserva (TableAllocator.choose), la
+reoptimización de un día entero (TableAllocator.optimize) y la búsqueda de
+mesas combinadas para grupos grandes (TableAllocator.choose_combination).
+
+Uso: python benchmarks/bench_allocator.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import TableAllocator, app, get_db, init_db
+
+TABLE_COUNTS = [50, 200, 500]
+BOOKINGS_PER_TABLE = 6
+LOCATIONS = ['Ventana', 'Bar', 'Jardin', 'Area privada', 'Area principal']
+DATE = '2025-06-13'
+
+
+ROW_LENGTH = 10
+
+
+def seed_tables(count):
+    # Todas las mesas son combinables con sus vecinas de fila (filas de ROW_LENGTH mesas)
+    conn = get_db()
+    conn.execute("DELETE FROM table_adjacency")
+    conn.execute("DELETE FROM tables")
+    conn.executemany("INSERT INTO tables (id, number, capacity, location, combinable) VALUES (?, ?, ?, ?, 1)",
+                     [(i, i, random.choice([2, 2, 4, 4, 6, 8]), random.choice(LOCATIONS))
+                      for i in range(1, count + 1)])
+    pairs = [(i, i + 1) for i in range(1, count) if i % ROW_LENGTH]
+    conn.executemany("INSERT INTO table_adjacency (table_id, adjacent_table_id) VALUES (?, ?)",
+                     pairs + [(b, a) for a, b in pairs])
+    conn.commit()
+
+
+def synthetic_requests(count):
+    requests = []
+    for _ in range(count):
+        start = random.randrange(10 * 60, 20 * 60, 15)
+        length = random.choice([60, 90, 120])
+        requests.append({
+            'id': None,
+            'guests': random.choice([1, 2, 2, 2, 3, 4, 4, 5, 6, 8]),
+            'start_minute': start,
+            'end_minute': start + length,
+            'type': random.choice(['standard', 'standard', 'vip']),
+        })
+    return requests
+
+
+def main():
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'restaurant.db')
+        app.app_context().push()
+        init_db()
+        print(f"{'mesas':>6} {'peticiones':>10} {'sentadas':>9} {'choose (ms)':>12} "
+              f"{'optimize (ms)':>14} {'cubiertos':>10} {'reoptimizado':>13}")
+        combination_rows = []
+        for table_count in TABLE_COUNTS:
+            seed_tables(table_count)
+            requests = synthetic_requests(table_count * BOOKINGS_PER_TABLE)
+
+            # Reservas de una en una, en orden de llegada
+            allocator = TableAllocator(DATE, timelines={})
+            seated, covers = 0, 0
+            start = time.perf_counter()
+            for request_data in requests:
+                table = allocator.choose(request_data['guests'], request_data['start_minute'],
+                                         request_data['end_minute'], request_data['type'])
+                if table is not None:
+                    allocator.assign(table, request_data['start_minute'], request_data['end_minute'])
+                    seated += 1
+                    covers += request_data['guests']
+            choose_ms = (time.perf_counter() - start) * 1000 / len(requests)
+
+            # El día completo replanificado de una vez
+            start = time.perf_counter()
+            plan = TableAllocator(DATE, timelines={}).optimize(requests)
+            optimize_ms = (time.perf_counter() - start) * 1000
+            optimized_covers = sum(request_data['guests'] for request_data, table in plan if table)
+
+            print(f"{table_count:>6} {len(requests):>10} {seated:>9} {choose_ms:>12.3f} "
+                  f"{optimize_ms:>14.1f} {covers:>10} {optimized_covers:>13}")
+            # Las adyacencias se cargan ahora, antes de sembrar el siguiente plano
+            allocator._combinable_graph()
+            combination_rows.append((table_count, allocator))
+
+        # Grupos grandes sobre el día ya lleno
+        print()
+        print(f"{'mesas':>6} {'personas':>9} {'mesas usadas':>13} {'choose_combination (ms)':>24}")
+        for table_count, allocator in combination_rows:
+            for guests in (12, 20, 28):
+                start = time.perf_counter()
+                combination = allocator.choose_combination(guests, 20 * 60, 22 * 60)
+                elapsed = (time.perf_counter() - start) * 1000
+                print(f"{table_count:>6} {guests:>9} {len(combination or []):>13} {elapsed:>24.2f}")
+
+
+if __name__ == '__main__':
+    main()
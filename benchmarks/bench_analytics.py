@@ -0,0 +1,104 @@
+"""Informe mensual de analítica: agregados frente a recorrer las reservas.
+
+Siembra N reservas repartidas en varios años (los triggers mantienen los agregados
+durante la siembra) y mide el informe de un mes y el de un año leído de
+rollup_daily/rollup_hourly frente a las mismas cifras calculadas con GROUP BY sobre
+reservations. Mide también el recálculo completo de los agregados.
+
+Uso: python benchmarks/bench_analytics.py [--reservations 500000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import analytics_report, app, get_db, init_db, rebuild_rollups
+
+TABLE_COUNT = 50
+REPEATS = 10
+FIRST_DAY = date(2027, 1, 1)
+
+
+def seed(count, rng):
+    conn = get_db()
+    conn.executemany("INSERT INTO tables (number, capacity, location) VALUES (?, 4, ?)",
+                     [(i, rng.choice(['Area principal', 'Terraza', 'Bar'])) for i in range(6, TABLE_COUNT + 1)])
+    days = 4 * 365
+    rows = []
+    for i in range(count):
+        day = FIRST_DAY + timedelta(days=i * days // count)
+        hour = rng.randint(12, 21)
+        rows.append((rng.randint(1, TABLE_COUNT), day.isoformat(), hour * 60, hour * 60 + 90, rng.randint(1, 8),
+                     rng.choice(['standard', 'vip', 'group']),
+                     rng.choices(['confirmed', 'cancelled', 'no_show'], [85, 10, 5])[0]))
+    conn.executemany('''
+    INSERT INTO reservations
+    (customer_name, customer_phone, table_id, reservation_date, start_minute, end_minute, guests, type, status)
+    VALUES ('Cliente', '555', ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def raw_report(date_from, date_to):
+    # Las mismas cifras sin agregados: dos GROUP BY sobre las reservas del intervalo
+    cursor = get_db().cursor()
+    cursor.execute('''
+    SELECT r.reservation_date, r.type, t.location, r.status, COUNT(*), SUM(r.guests)
+    FROM reservations r LEFT JOIN tables t ON t.id = r.table_id
+    WHERE r.reservation_date BETWEEN ? AND ?
+    GROUP BY 1, 2, 3, 4
+    ''', (date_from, date_to))
+    cursor.fetchall()
+    cursor.execute('''
+    SELECT r.reservation_date, h.hour,
+        SUM((MIN(r.end_minute, h.hour * 60 + 60) - MAX(r.start_minute, h.hour * 60))
+            * (1 + (SELECT COUNT(*) FROM reservation_tables rt WHERE rt.reservation_id = r.id)))
+    FROM reservations r JOIN rollup_hours h ON h.hour * 60 < r.end_minute AND h.hour * 60 + 60 > r.start_minute
+    WHERE r.status = 'confirmed' AND r.reservation_date BETWEEN ? AND ?
+    GROUP BY 1, 2
+    ''', (date_from, date_to))
+    cursor.fetchall()
+
+
+def timed(func, *args):
+    func(*args)
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        func(*args)
+    return (time.perf_counter() - start) / REPEATS * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Informe de analítica con y sin agregados.')
+    parser.add_argument('--reservations', type=int, default=500_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'bench.db')
+        with app.app_context():
+            init_db()
+            start = time.perf_counter()
+            seed(args.reservations, random.Random(23))
+            seed_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            rebuild_rollups()
+            rebuild_seconds = time.perf_counter() - start
+
+            print(f"{args.reservations} reservas sembradas en {seed_seconds:.1f} s (con triggers); "
+                  f"recálculo completo en {rebuild_seconds:.1f} s")
+            print(f"{'intervalo':<12} {'agregados ms':>13} {'GROUP BY ms':>12}")
+            for name, days in (('un mes', 30), ('un año', 365)):
+                date_from = (FIRST_DAY + timedelta(days=400)).isoformat()
+                date_to = (FIRST_DAY + timedelta(days=400 + days - 1)).isoformat()
+                print(f"{name:<12} {timed(analytics_report, date_from, date_to):>13.2f} "
+                      f"{timed(raw_report, date_from, date_to):>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
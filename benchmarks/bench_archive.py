@@ -0,0 +1,110 @@
+"""Efecto del archivo mensual sobre las consultas del conjunto vivo.
+
+Siembra varios años de reservas pasadas más las de las próximas semanas y mide,
+antes y después de archive_reservations, las consultas que recorren la tabla:
+el listado de canceladas, la exportación completa y la disponibilidad por SQL
+(sin índice en memoria). Mide también el propio archivado y una página del
+histórico, que une los meses archivados bajo demanda.
+
+Uso: python benchmarks/bench_archive.py [--reservations 500000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, archive_reservations, export_reservations, get_db, init_db
+
+TABLE_COUNT = 50
+REPEATS = 20
+UPCOMING_DAYS = 30
+
+
+def seed(count, rng):
+    # count reservas repartidas en los tres años anteriores a hoy, más las próximas semanas
+    conn = get_db()
+    conn.executemany("INSERT INTO tables (number, capacity, location) VALUES (?, 4, 'Area principal')",
+                     [(i,) for i in range(6, TABLE_COUNT + 1)])
+    today = date.today()
+    days = 3 * 365
+    rows = []
+    for i in range(count):
+        day = today - timedelta(days=days - i * days // count)
+        hour = rng.randint(12, 21)
+        rows.append((rng.randint(1, TABLE_COUNT), day.isoformat(), hour * 60, hour * 60 + 90,
+                     rng.choice(['confirmed', 'confirmed', 'cancelled'])))
+    for offset in range(UPCOMING_DAYS):
+        day = (today + timedelta(days=offset)).isoformat()
+        rows.extend((table_id, day, 20 * 60, 22 * 60, 'confirmed') for table_id in range(1, TABLE_COUNT + 1, 2))
+    conn.executemany('''
+    INSERT INTO reservations
+    (customer_name, customer_phone, table_id, reservation_date, start_minute, end_minute, guests, type, status)
+    VALUES ('Cliente', '555', ?, ?, ?, ?, 2, 'standard', ?)
+    ''', rows)
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def timed(client, url):
+    client.get(url)
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        response = client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+    return (time.perf_counter() - start) / REPEATS * 1000
+
+
+def measure(client):
+    upcoming = (date.today() + timedelta(days=7)).isoformat()
+    with app.app_context():
+        start = time.perf_counter()
+        for _ in export_reservations('csv'):
+            pass
+        export_ms = (time.perf_counter() - start) * 1000
+    return {
+        'listado de canceladas': timed(client, '/reservations?status=cancelled'),
+        'disponibilidad (SQL)': timed(client, f'/get_available_tables?reservation_date={upcoming}'
+                                              '&start_time=20:30&end_time=21:30'),
+        'exportación completa': export_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Consultas del conjunto vivo antes y después de archivar.')
+    parser.add_argument('--reservations', type=int, default=500_000)
+    args = parser.parse_args()
+
+    app.config['RESPONSE_CACHE'] = False
+    app.config['METRICS'] = False
+    app.config['AVAILABILITY_INDEX'] = False
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'bench.db')
+        with app.app_context():
+            init_db()
+            seed(args.reservations, random.Random(20))
+        client = app.test_client()
+
+        before = measure(client)
+        with app.app_context():
+            start = time.perf_counter()
+            archived = archive_reservations()
+            archive_seconds = time.perf_counter() - start
+        after = measure(client)
+
+        print(f"{sum(archived.values())} de {args.reservations} reservas archivadas en {len(archived)} meses "
+              f"en {archive_seconds:.1f} s")
+        print(f"{'consulta':<32} {'antes ms':>10} {'después ms':>11}")
+        for (name, before_ms), after_ms in zip(before.items(), after.values()):
+            print(f"{name:<32} {before_ms:>10.2f} {after_ms:>11.2f}")
+        if archived:
+            history_url = f'/reservations?history=1&date_from={min(archived)}-01'
+            print(f"{'histórico, primera página':<32} {'':>10} {timed(client, history_url):>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
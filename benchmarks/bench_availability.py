@@ -0,0 +1,90 @@
+"""Latencia de disponibilidad: consulta por mesa, consulta agrupada e índice en memoria.
+
+Uso: python benchmarks/bench_availability.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import TableManager, app, get_availability_index, get_db, init_db
+
+TABLE_COUNTS = [10, 50, 100, 250, 500, 1000]
+RESERVATIONS_PER_TABLE = 20
+REPEATS = 5
+DATE = '2025-06-13'
+
+
+def seed(table_count):
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM reservations")
+    cursor.execute("DELETE FROM tables")
+    cursor.executemany("INSERT INTO tables (id, number, capacity, location) VALUES (?, ?, ?, ?)",
+                       [(i, i, random.choice([2, 4, 6, 8]), 'Area principal') for i in range(1, table_count + 1)])
+    rows = []
+    for table_id in range(1, table_count + 1):
+        for day in range(RESERVATIONS_PER_TABLE):
+            hour = random.randint(10, 20)
+            rows.append(('Cliente', '555', table_id, f'2025-06-{day + 1:02d}',
+                         hour * 60, (hour + 2) * 60, 2, 'standard', 'confirmed'))
+    cursor.executemany('''
+    INSERT INTO reservations
+    (customer_name, customer_phone, table_id, reservation_date, start_minute, end_minute, guests, type, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    get_availability_index().clear()
+
+
+def per_table():
+    tables = TableManager.get_all_tables()
+    return [t for t in tables if TableManager.is_table_available(t.id, DATE, 19 * 60, 21 * 60)]
+
+
+def batched():
+    app.config['AVAILABILITY_INDEX'] = False
+    return TableManager.get_available_tables(DATE, 19 * 60, 21 * 60)
+
+
+def overlaps_only():
+    return get_availability_index().busy_table_ids(DATE, 19 * 60, 21 * 60)
+
+
+def indexed():
+    app.config['AVAILABILITY_INDEX'] = True
+    return TableManager.get_available_tables(DATE, 19 * 60, 21 * 60)
+
+
+def best_of(fn):
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'restaurant.db')
+        app.app_context().push()
+        init_db()
+        print(f"{'mesas':>6} {'por mesa (ms)':>14} {'agrupada (ms)':>14} {'índice (ms)':>12} {'solo solapes (ms)':>18}")
+        for count in TABLE_COUNTS:
+            seed(count)
+            expected = [t.id for t in per_table()]
+            assert expected == [t.id for t in batched()] == [t.id for t in indexed()]
+            slow = best_of(per_table)
+            fast = best_of(batched)
+            cached = best_of(indexed)
+            lookup = best_of(overlaps_only)
+            print(f"{count:>6} {slow:>14.2f} {fast:>14.2f} {cached:>12.2f} {lookup:>18.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Directorio de clientes: alta masiva y búsqueda de quien llama.
+
+Siembra N reservas de M clientes, con cada teléfono escrito de varias formas y sin
+cliente asignado (como antes de la migración), y mide dedupe_customers. Después
+compara la búsqueda por teléfono completo, por sus primeras cifras y por nombre
+frente a buscar lo mismo con LIKE en las reservas.
+
+Uso: python benchmarks/bench_customers.py [--reservations 500000] [--customers 50000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, dedupe_customers, get_db, init_db, search_customers, write_transaction
+
+REPEATS = 200
+FIRST_NAMES = ['María', 'José', 'Lucía', 'Javier', 'Carmen', 'Andrés', 'Sofía', 'Íñigo', 'Elena', 'Raúl']
+LAST_NAMES = ['García', 'Pérez', 'López', 'Martínez', 'Sánchez', 'Gómez', 'Fernández', 'Ruiz', 'Díaz', 'Muñoz']
+
+
+def spellings(number):
+    # Las formas en que el personal apunta un mismo teléfono
+    return [number, f'{number[:3]} {number[3:6]} {number[6:]}', f'+34 {number}', f'0034-{number}',
+            f'({number[:3]}) {number[3:]}']
+
+
+def seed(reservation_count, customer_count, rng):
+    customers = []
+    for i in range(customer_count):
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}'
+        customers.append((name, str(600000000 + i * 7)))
+    rows = []
+    for i in range(reservation_count):
+        name, number = rng.choice(customers)
+        day = (date(2027, 1, 1) + timedelta(days=i * 1000 // reservation_count)).isoformat()
+        rows.append((name, rng.choice(spellings(number)), rng.randint(1, 5), day))
+    conn = get_db()
+    conn.executemany('''
+    INSERT INTO reservations
+    (customer_name, customer_phone, table_id, reservation_date, start_minute, end_minute, guests, type, status)
+    VALUES (?, ?, ?, ?, 1200, 1290, 2, 'standard', 'confirmed')
+    ''', rows)
+    conn.commit()
+    return customers
+
+
+def like_scan(pattern):
+    # Lo que había que hacer sin directorio: recorrer todas las reservas
+    cursor = get_db().execute('''
+    SELECT customer_name, customer_phone, COUNT(*) FROM reservations
+    WHERE customer_phone LIKE ? OR customer_name LIKE ?
+    GROUP BY customer_phone LIMIT 20
+    ''', (pattern, pattern))
+    return cursor.fetchall()
+
+
+def timed(func, values):
+    start = time.perf_counter()
+    for value in values:
+        func(value)
+    return (time.perf_counter() - start) / len(values) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Alta masiva y búsqueda de clientes.')
+    parser.add_argument('--reservations', type=int, default=500_000)
+    parser.add_argument('--customers', type=int, default=50_000)
+    args = parser.parse_args()
+    rng = random.Random(24)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'bench.db')
+        with app.test_request_context():
+            init_db()
+            customers = seed(args.reservations, args.customers, rng)
+            start = time.perf_counter()
+            with write_transaction() as cursor:
+                linked = dedupe_customers(cursor)
+            dedupe_seconds = time.perf_counter() - start
+            get_db().execute("ANALYZE")
+            count = get_db().execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+            print(f"{linked} reservas enlazadas con {count} clientes en {dedupe_seconds:.1f} s")
+
+            sample = rng.sample(customers, min(REPEATS, len(customers)))
+            phones = [rng.choice(spellings(number)) for _, number in sample]
+            prefixes = [number[:6] for _, number in sample]
+            names = [' '.join(word[:4] for word in name.split()[:2]) for name, _ in sample]
+            print(f"{'búsqueda':<22} {'directorio ms':>14} {'LIKE ms':>10}")
+            print(f"{'teléfono completo':<22} {timed(search_customers, phones):>14.3f} "
+                  f"{timed(like_scan, [f'%{number}%' for _, number in sample[:5]]):>10.3f}")
+            print(f"{'primeras cifras':<22} {timed(search_customers, prefixes):>14.3f} "
+                  f"{timed(like_scan, [f'{prefix}%' for prefix in prefixes[:5]]):>10.3f}")
+            print(f"{'nombre (prefijos)':<22} {timed(search_customers, names):>14.3f} "
+                  f"{timed(like_scan, [f'%{name.split()[1]}%' for name in names[:5]]):>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
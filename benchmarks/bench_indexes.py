@@ -0,0 +1,103 @@
+"""Latencia de las comprobaciones de disponibilidad frente al tamaño del histórico.
+
+Siembra hasta 1M de reservas históricas y mide is_table_available y
+get_available_tables con y sin los índices de reservas (table_id, fecha, estado, minutos).
+
+Uso: python benchmarks/bench_indexes.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import TableManager, app, get_db, init_db
+
+HISTORY_SIZES = [10_000, 100_000, 1_000_000]
+TABLE_COUNT = 50
+REPEATS = 50
+DATE = '2025-06-13'
+
+
+def grow_history(target):
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM reservations")
+    current = cursor.fetchone()[0]
+    first_day = date(2020, 1, 1)
+    rows = []
+    for i in range(current, target):
+        day = first_day + timedelta(days=i // (TABLE_COUNT * 4))
+        hour = random.randint(10, 20)
+        rows.append(('Cliente', '555', random.randint(1, TABLE_COUNT), day.isoformat(),
+                     hour * 60, (hour + 2) * 60, 2, 'standard',
+                     random.choice(['confirmed', 'confirmed', 'cancelled'])))
+    cursor.executemany('''
+    INSERT INTO reservations
+    (customer_name, customer_phone, table_id, reservation_date, start_minute, end_minute, guests, type, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+
+
+def drop_indexes():
+    conn = get_db()
+    conn.execute("DROP INDEX IF EXISTS idx_reservations_table_slot")
+    conn.execute("DROP INDEX IF EXISTS idx_reservations_date_start")
+    conn.commit()
+
+
+def create_indexes():
+    conn = get_db()
+    conn.execute('''
+    CREATE INDEX idx_reservations_table_slot
+    ON reservations (table_id, reservation_date, status, start_minute, end_minute)
+    ''')
+    conn.execute("CREATE INDEX idx_reservations_date_start ON reservations (reservation_date, start_minute)")
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def mean_ms(fn):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        fn()
+    return (time.perf_counter() - start) * 1000 / REPEATS
+
+
+def single():
+    TableManager.is_table_available(random.randint(1, TABLE_COUNT), DATE, 19 * 60, 21 * 60)
+
+
+def batched():
+    TableManager.get_available_tables(DATE, 19 * 60, 21 * 60)
+
+
+def main():
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'restaurant.db')
+        app.app_context().push()
+        init_db()
+        conn = get_db()
+        conn.execute("DELETE FROM tables")
+        conn.executemany("INSERT INTO tables (id, number, capacity, location) VALUES (?, ?, ?, ?)",
+                         [(i, i, 4, 'Area principal') for i in range(1, TABLE_COUNT + 1)])
+        conn.commit()
+        print(f"{'reservas':>9} {'una mesa sin idx':>17} {'una mesa con idx':>17} "
+              f"{'todas sin idx':>14} {'todas con idx':>14}  (ms)")
+        for size in HISTORY_SIZES:
+            grow_history(size)
+            drop_indexes()
+            slow_single, slow_batched = mean_ms(single), mean_ms(batched)
+            create_indexes()
+            fast_single, fast_batched = mean_ms(single), mean_ms(batched)
+            print(f"{size:>9} {slow_single:>17.3f} {fast_single:>17.3f} "
+                  f"{slow_batched:>14.3f} {fast_batched:>14.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""Prueba de carga HTTP de /get_available_tables con distintos servidores.
+
+Arranca cada servidor en un subproceso sobre la misma base de datos sembrada y lo
+satura con clientes concurrentes (varios procesos con varios hilos cada uno, con
+conexiones keep-alive) durante unos segundos. Compara el servidor de desarrollo
+(flask run) con gunicorn (gunicorn.conf.py) y uvicorn (asgi.py); los que no estén
+instalados se omiten.
+
+Uso: python benchmarks/bench_load.py [--duration 5] [--clients 32]
+"""
+import argparse
+import http.client
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from importlib.util import find_spec
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import app, get_db, init_db
+
+CLIENT_PROCESSES = 4
+WORKERS = 4
+TABLE_COUNT = 200
+DATE = '2030-01-15'
+SLOTS = [(f'{hour:02d}:00', f'{hour + 2:02d}:00') for hour in range(10, 21)]
+
+SERVERS = [
+    ('dev (flask run)', None,
+     [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', '{port}', '--no-reload']),
+    ('gunicorn gthread', 'gunicorn',
+     ['gunicorn', 'app:app', '--bind', '127.0.0.1:{port}', '--workers', str(WORKERS),
+      '--access-logfile', os.devnull]),
+    ('uvicorn asgi', 'a2wsgi',
+     ['uvicorn', 'asgi:application', '--port', '{port}', '--workers', str(WORKERS),
+      '--log-level', 'warning', '--no-access-log']),
+]
+
+
+def seed(database):
+    app.config['DATABASE'] = database
+    with app.app_context():
+        init_db()
+        conn = get_db()
+        conn.execute("DELETE FROM tables")
+        conn.executemany("INSERT INTO tables (id, number, capacity, location) VALUES (?, ?, ?, ?)",
+                         [(i, i, 2 + i % 4 * 2, 'Area principal') for i in range(1, TABLE_COUNT + 1)])
+        rows = []
+        for table_id in range(1, TABLE_COUNT + 1):
+            for hour in range(10, 22, 2):
+                if random.random() < 0.6:
+                    rows.append(('Cliente', '555', table_id, DATE, hour * 60, (hour + 2) * 60,
+                                 2, 'standard', 'confirmed'))
+        conn.executemany('''
+        INSERT INTO reservations
+        (customer_name, customer_phone, table_id, reservation_date, start_minute, end_minute, guests, type, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def client_loop(port, deadline, seed_value):
+    rng = random.Random(seed_value)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    latencies, errors = [], 0
+    while time.monotonic() < deadline:
+        start_time, end_time = rng.choice(SLOTS)
+        start = time.perf_counter()
+        try:
+            conn.request('GET', f'/get_available_tables?reservation_date={DATE}'
+                                f'&start_time={start_time}&end_time={end_time}')
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+            # El servidor de desarrollo responde con HTTP/1.0 y cierra la conexión
+            if response.will_close:
+                conn.close()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+    return latencies, errors
+
+
+def client_process(port, threads, deadline, process_index):
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(lambda i: client_loop(port, deadline, process_index * 1000 + i), range(threads)))
+    latencies = [latency for thread_latencies, _ in results for latency in thread_latencies]
+    return latencies, sum(errors for _, errors in results)
+
+
+def run_load(port, duration, clients):
+    deadline = time.monotonic() + duration
+    threads = max(1, clients // CLIENT_PROCESSES)
+    with ProcessPoolExecutor(CLIENT_PROCESSES) as pool:
+        results = list(pool.map(client_process, [port] * CLIENT_PROCESSES, [threads] * CLIENT_PROCESSES,
+                                [deadline] * CLIENT_PROCESSES, range(CLIENT_PROCESSES)))
+    latencies = sorted(latency for process_latencies, _ in results for latency in process_latencies)
+    errors = sum(errors for _, errors in results)
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga HTTP con distintos servidores.')
+    parser.add_argument('--duration', type=float, default=5, help='segundos por servidor')
+    parser.add_argument('--clients', type=int, default=32, help='clientes concurrentes')
+    args = parser.parse_args()
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'restaurant.db')
+        seed(database)
+        env = dict(os.environ, FLASK_DATABASE=database)
+        print(f"{TABLE_COUNT} mesas, {args.clients} clientes, {args.duration:.0f} s por servidor")
+        print(f"{'servidor':<18} {'peticiones/s':>13} {'p50 ms':>8} {'p99 ms':>8} {'errores':>8}")
+        for name, requirement, command in SERVERS:
+            if requirement and not (shutil.which(command[0]) and find_spec(requirement)):
+                print(f"{name:<18} {'no instalado':>13}")
+                continue
+            port = free_port()
+            server = subprocess.Popen([part.format(port=port) for part in command], cwd=ROOT, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                if not wait_ready(port):
+                    print(f"{name:<18} {'no arranca':>13}")
+                    continue
+                latencies, errors = run_load(port, args.duration, args.clients)
+            finally:
+                server.terminate()
+                server.wait()
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[int(len(latencies) * 0.99)] * 1000
+            print(f"{name:<18} {len(latencies) / args.duration:>13.0f} {p50:>8.2f} {p99:>8.2f} {errors:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark: vistas de disponibilidad y listado con y sin caché de respuestas.
+
+Para cada URL mide la respuesta sin caché, servida desde la caché y una petición
+condicional con If-None-Match (304), con 500 mesas y 20 000 reservas.
+
+Uso: python benchmarks/bench_response_cache.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, get_db, init_db
+
+TABLE_COUNT = 500
+RESERVATION_COUNT = 20000
+REPEATS = 200
+URLS = [
+    '/get_available_tables?reservation_date=2030-01-20&start_time=19:00&end_time=21:00',
+    '/tables?reservation_date=2030-01-20&start_time=19:00&end_time=21:00',
+    '/reservations',
+]
+
+
+def seed():
+    conn = get_db()
+    conn.execute("DELETE FROM tables")
+    conn.executemany("INSERT INTO tables (id, number, capacity, location) VALUES (?, ?, ?, ?)",
+                     [(i, i, 4, 'Area principal') for i in range(1, TABLE_COUNT + 1)])
+    conn.executemany('''
+    INSERT INTO reservations
+    (customer_name, customer_phone, table_id, reservation_date, start_minute, end_minute, guests, type, status)
+    VALUES ('Cliente', '555', ?, ?, 19 * 60, 21 * 60, 2, 'standard', 'confirmed')
+    ''', [(i % TABLE_COUNT + 1, f'2030-01-{i % 28 + 1:02d}') for i in range(RESERVATION_COUNT)])
+    conn.commit()
+
+
+def mean_ms(client, url, headers=None):
+    client.get(url, headers=headers)
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        client.get(url, headers=headers)
+    return (time.perf_counter() - start) / REPEATS * 1000
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'restaurant.db')
+        with app.app_context():
+            init_db()
+            seed()
+        client = app.test_client()
+        print(f"{'url':<22} {'sin caché':>10} {'en caché':>10} {'304':>10}  (ms)")
+        rows = []
+        for url in URLS:
+            app.config['RESPONSE_CACHE'] = False
+            uncached = mean_ms(client, url)
+            app.config['RESPONSE_CACHE'] = True
+            cached = mean_ms(client, url)
+            etag = client.get(url).headers['ETag']
+            conditional = mean_ms(client, url, {'If-None-Match': etag})
+            rows.append((url.split('?')[0], uncached, cached, conditional))
+        for path, uncached, cached, conditional in rows:
+            print(f"{path:<22} {uncached:>10.2f} {cached:>10.2f} {conditional:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Latencia de /next_available_slots frente al número de mesas y la ocupación.
+
+Siembra 14 días de reservas sobre salones de 100 a 1000 mesas con distinta
+ocupación y mide la búsqueda de los huecos más cercanos (±2 horas, 14 días). En
+el caso «lleno» no hay ningún hueco en la ventana pedida: es el peor caso, en el
+que se comprueban todas las horas de todos los días.
+
+Uso: python benchmarks/bench_slot_search.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, get_db, init_db
+
+TABLE_COUNTS = [100, 500, 1000]
+OCCUPANCY = {'50 %': 0.5, '95 %': 0.95, 'lleno': 1.0}
+DAYS = 14
+REPEATS = 20
+
+
+def seed(table_count, occupancy, rng):
+    # Turno de 18:00 a 23:00 en cada mesa ocupada: la ventana pedida (20:00 ± 2 h) queda
+    # libre solo en las mesas sin reserva
+    conn = get_db()
+    conn.execute("DELETE FROM reservations")
+    conn.execute("DELETE FROM tables")
+    conn.executemany("INSERT INTO tables (id, number, capacity, location) VALUES (?, ?, ?, ?)",
+                     [(i, i, rng.choice([2, 4, 4, 6]), rng.choice(['Area principal', 'Terraza', 'Bar']))
+                      for i in range(1, table_count + 1)])
+    first = date.today() + timedelta(days=1)
+    rows = []
+    for offset in range(DAYS):
+        day = (first + timedelta(days=offset)).isoformat()
+        for table_id in range(1, table_count + 1):
+            if rng.random() < occupancy:
+                rows.append((table_id, day, 17 * 60, 22 * 60))
+    conn.executemany('''
+    INSERT INTO reservations
+    (customer_name, customer_phone, table_id, reservation_date, start_minute, end_minute, guests, type, status)
+    VALUES ('Cliente', '555', ?, ?, ?, ?, 2, 'standard', 'confirmed')
+    ''', rows)
+    conn.execute("ANALYZE")
+    conn.commit()
+    return first.isoformat()
+
+
+def main():
+    app.config['METRICS'] = False
+    print(f"{'mesas':>6} {'ocupación':>10} {'huecos':>7} {'media ms':>9} {'máx ms':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'bench.db')
+        with app.app_context():
+            init_db()
+        client = app.test_client()
+        for table_count in TABLE_COUNTS:
+            for label, occupancy in OCCUPANCY.items():
+                with app.app_context():
+                    first = seed(table_count, occupancy, random.Random(table_count))
+                url = (f'/next_available_slots?reservation_date={first}&start_time=20:00&end_time=21:30'
+                       f'&guests=4&hours=2&days={DAYS}')
+                slots = client.get(url).json['slots']
+                timings = []
+                for _ in range(REPEATS):
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    timings.append(time.perf_counter() - start)
+                    assert response.status_code == 200
+                print(f"{table_count:>6} {label:>10} {len(slots):>7} {sum(timings) / REPEATS * 1000:>9.2f} "
+                      f"{max(timings) * 1000:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
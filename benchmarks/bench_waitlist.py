@@ -0,0 +1,93 @@
+"""Coste de la lista de espera en el camino de cancelación.
+
+Siembra un día con todas las mesas ocupadas a mediodía y por la noche y una lista
+de espera de N peticiones para esa fecha, y mide la latencia de POST /cancel_reservation con
+N = 0 y con varios miles de peticiones. Cada cancelación libera una mesa cuyo
+hueco busca petición en el índice en memoria, dentro de la misma transacción.
+
+Uso: python benchmarks/bench_waitlist.py [--tables 200] [--entries 0 1000 5000 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, get_db, init_db
+
+CANCELS = 100
+
+
+def seed(table_count, entry_count, reservation_date, rng):
+    # Cada mesa, ocupada de 12:00 a 17:00 y de 19:00 a 22:00 (las reservas de la noche
+    # son las que se cancelan); las ventanas pedidas se reparten por todo el día
+    conn = get_db()
+    conn.execute("DELETE FROM tables")
+    conn.executemany("INSERT INTO tables (id, number, capacity, location) VALUES (?, ?, ?, 'Area principal')",
+                     [(i, i, rng.choice([2, 4, 6])) for i in range(1, table_count + 1)])
+    conn.executemany('''
+    INSERT INTO reservations
+    (customer_name, customer_phone, table_id, reservation_date, start_minute, end_minute, guests, type, status)
+    VALUES ('Cliente', '555', ?, ?, ?, ?, 2, 'standard', 'confirmed')
+    ''', [(i, reservation_date, start_minute, end_minute)
+          for start_minute, end_minute in ((19 * 60, 22 * 60), (12 * 60, 17 * 60))
+          for i in range(1, table_count + 1)])
+    rows = []
+    for _ in range(entry_count):
+        window_start = rng.randrange(12 * 60, 21 * 60, 15)
+        rows.append(('Espera', '555', reservation_date, window_start, window_start + 60, 60,
+                     rng.randint(2, 6), 'standard'))
+    conn.executemany('''
+    INSERT INTO waitlist
+    (customer_name, customer_phone, reservation_date, window_start, window_end, duration, guests, type)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def measure(directory, table_count, entry_count):
+    rng = random.Random(entry_count)
+    reservation_date = (date.today() + timedelta(days=7)).isoformat()
+    app.config['DATABASE'] = os.path.join(directory, f'bench-{entry_count}.db')
+    with app.app_context():
+        init_db()
+        seed(table_count, entry_count, reservation_date, rng)
+    client = app.test_client()
+    # Primera cancelación fuera de la medida: carga el índice de la fecha
+    client.post('/cancel_reservation/1')
+    latencies = []
+    for reservation_id in range(2, min(table_count, CANCELS + 1) + 1):
+        # Los avisos no se leen: sin vaciarlos, la cookie de sesión crece en cada petición
+        with client.session_transaction() as session:
+            session.clear()
+        start = time.perf_counter()
+        response = client.post(f'/cancel_reservation/{reservation_id}')
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 302, response.status_code
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latencia de cancelación según el tamaño de la lista de espera.')
+    parser.add_argument('--tables', type=int, default=200)
+    parser.add_argument('--entries', type=int, nargs='+', default=[0, 1000, 5000, 20000])
+    args = parser.parse_args()
+
+    app.config['RESPONSE_CACHE'] = False
+    app.config['METRICS'] = False
+    app.logger.setLevel('ERROR')
+    print(f"{'peticiones':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for entry_count in args.entries:
+            p50, p95 = measure(tmp, args.tables, entry_count)
+            print(f"{entry_count:>10} {p50:>8.2f} {p95:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Reservas por segundo con y sin la cola de escritura (WRITE_QUEUE).
+
+Lanza C clientes concurrentes (hilos con el cliente de pruebas de Flask) que hacen
+POST /new_reservation: el camino completo de cada petición, con su transacción.
+Con la cola, las reservas de todos los clientes se confirman por lotes desde un
+único hilo escritor; sin ella, cada petición abre su BEGIN IMMEDIATE y compite por el
+bloqueo. Una parte de las peticiones pide franjas ya pedidas por otro cliente, y al
+final se comprueba que ninguna franja quedó reservada dos veces.
+
+Uso: python benchmarks/bench_write_queue.py [--clients 64] [--bookings 20] [--batch 64]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import TIME_LABELS, app, get_db, init_db
+
+SLOTS = [(12 * 60, 14 * 60), (14 * 60 + 30, 16 * 60 + 30), (19 * 60, 21 * 60)]
+BOOKING_DATE = '2030-06-01'
+
+
+def run(directory, clients, bookings, write_queue):
+    app.config['WRITE_QUEUE'] = write_queue
+    app.config['DATABASE'] = os.path.join(directory, f"bench-{'cola' if write_queue else 'directo'}.db")
+    table_count = clients * bookings // len(SLOTS) + 1
+    with app.app_context():
+        init_db()
+        conn = get_db()
+        conn.execute("DELETE FROM tables")
+        conn.executemany("INSERT INTO tables (id, number, capacity, location) VALUES (?, ?, 4, 'Area principal')",
+                         [(i, i) for i in range(1, table_count + 1)])
+        conn.commit()
+    slots = [(table_id, start, end) for table_id in range(1, table_count + 1) for start, end in SLOTS]
+    statuses, latencies = {}, []
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients)
+
+    def book(index):
+        client = app.test_client()
+        # Uno de cada cuatro clientes repite las franjas del anterior: conflictos reales
+        owner = index - 1 if index % 4 == 3 else index
+        own = slots[owner * bookings:(owner + 1) * bookings]
+        barrier.wait()
+        for table_id, start, end in own:
+            request_start = time.perf_counter()
+            response = client.post('/new_reservation', data={
+                'customer_name': f'Cliente {index}',
+                'customer_phone': f'6000{index:05d}',
+                'table_id': str(table_id),
+                'reservation_date': BOOKING_DATE,
+                'start_time': TIME_LABELS[start],
+                'end_time': TIME_LABELS[end],
+                'guests': '2',
+                'reservation_type': 'standard',
+            })
+            with lock:
+                latencies.append(time.perf_counter() - request_start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    threads = [threading.Thread(target=book, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        booked, double = get_db().execute('''
+        SELECT COUNT(*), COUNT(*) - COUNT(DISTINCT table_id || '-' || start_minute) FROM reservations
+        WHERE reservation_date = ? AND status = 'confirmed'
+        ''', (BOOKING_DATE,)).fetchone()
+    latencies.sort()
+    return {
+        'booked': booked,
+        'double': double,
+        'rejected': sum(count for status, count in statuses.items() if status != 302),
+        'per_second': booked / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reservas por segundo con y sin cola de escritura.')
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--bookings', type=int, default=20, help='peticiones por cliente')
+    parser.add_argument('--batch', type=int, default=64, help='WRITE_QUEUE_BATCH')
+    args = parser.parse_args()
+
+    app.config['RESPONSE_CACHE'] = False
+    app.config['METRICS'] = False
+    app.config['WRITE_QUEUE_BATCH'] = args.batch
+    app.logger.setLevel('CRITICAL')
+    print(f"{args.clients} clientes, {args.bookings} peticiones cada uno")
+    print(f"{'camino':<10} {'reservas/s':>11} {'p50 ms':>8} {'p95 ms':>8} {'hechas':>7} {'rechazos':>9} {'dobles':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, write_queue in (('directo', False), ('cola', True)):
+            result = run(tmp, args.clients, args.bookings, write_queue)
+            print(f"{name:<10} {result['per_second']:>11.0f} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+                  f"{result['booked']:>7} {result['rejected']:>9} {result['double']:>7}")
+
+
+if __name__ == '__main__':
+    main()
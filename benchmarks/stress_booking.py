@@ -0,0 +1,76 @@
+"""Prueba de carga: muchos hilos reservan la misma mesa y franja a la vez.
+
+Cada hilo hace un POST a /new_reservation con su propio cliente de pruebas.
+Debe haber exactamente una reserva confirmada para la franja disputada.
+
+Uso: python benchmarks/stress_booking.py [hilos] [rondas]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, get_db, init_db
+
+THREADS = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+ROUNDS = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+
+def book(barrier, day, results, index):
+    client = app.test_client()
+    barrier.wait()
+    response = client.post('/new_reservation', data={
+        'customer_name': f'Cliente {index}',
+        'customer_phone': '555',
+        'table_id': '1',
+        'reservation_date': day,
+        'start_time': '20:00',
+        'end_time': '22:00',
+        'guests': '2',
+        'reservation_type': 'standard',
+    })
+    results[index] = response.status_code
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'restaurant.db')
+        # Los rechazos de las reservas perdedoras se registran como avisos
+        app.logger.setLevel('ERROR')
+        with app.app_context():
+            init_db()
+        requests_sent = 0
+        start = time.perf_counter()
+        for round_number in range(ROUNDS):
+            day = f'2030-01-{round_number + 1:02d}'
+            barrier = threading.Barrier(THREADS)
+            results = [None] * THREADS
+            threads = [threading.Thread(target=book, args=(barrier, day, results, i)) for i in range(THREADS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            requests_sent += THREADS
+            # Éxito = redirección a /reservations; conflicto = formulario con error (200)
+            assert results.count(302) == 1, results
+            assert results.count(200) == THREADS - 1, results
+        elapsed = time.perf_counter() - start
+
+        with app.app_context():
+            cursor = get_db().cursor()
+            cursor.execute('''
+            SELECT reservation_date, COUNT(*) FROM reservations
+            WHERE table_id = 1 AND status = 'confirmed'
+            GROUP BY reservation_date
+            ''')
+            counts = cursor.fetchall()
+        assert len(counts) == ROUNDS and all(row[1] == 1 for row in counts), [tuple(r) for r in counts]
+        print(f"{ROUNDS} rondas x {THREADS} hilos: un solo ganador por franja, "
+              f"{requests_sent / elapsed:.0f} peticiones/s")
+
+
+if __name__ == '__main__':
+    main()
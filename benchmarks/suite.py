@@ -0,0 +1,254 @@
+"""Suite de benchmarks reproducible de las rutas de reservas y disponibilidad.
+
+Para cada combinación de salón (número de mesas) e histórico (número de reservas)
+siembra una base de datos con datos sintéticos (semilla fija) y mide con el cliente
+de pruebas de Flask la latencia y el rendimiento de /tables, /get_available_tables,
+/reservations y de POST concurrentes a /new_reservation. La caché de respuestas se
+desactiva para medir el trabajo real de cada ruta.
+
+Los resultados se guardan en JSON; con --compare se comparan con una ejecución
+anterior y el proceso termina con código 1 si alguna mediana empeora más del umbral.
+
+Uso: python benchmarks/suite.py [--full] [--output resultados.json] [--compare base.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import TIME_LABELS, app, get_db, init_db
+
+QUICK = {'tables': [10, 100], 'reservations': [1000, 10000]}
+FULL = {'tables': [10, 100, 1000], 'reservations': [1000, 10000, 100000, 1000000]}
+# Tres turnos por mesa y día, sin solapes dentro de una mesa
+SLOTS = [(12 * 60, 14 * 60), (14 * 60 + 30, 16 * 60 + 30), (19 * 60, 21 * 60)]
+FIRST_DAY = date(2030, 1, 1)
+REQUESTS = 200
+POST_THREADS = 16
+POSTS_PER_THREAD = 20
+
+
+def seed(table_count, reservation_count, rng):
+    # Reparte el histórico en días consecutivos con los tres turnos de cada mesa
+    # ocupados al 80 %; devuelve las fechas sembradas
+    conn = get_db()
+    conn.execute("DELETE FROM tables")
+    conn.executemany("INSERT INTO tables (id, number, capacity, location) VALUES (?, ?, ?, ?)",
+                     [(i, i, rng.choice([2, 4, 4, 6, 8]), rng.choice(['Area principal', 'Terraza', 'Bar']))
+                      for i in range(1, table_count + 1)])
+    rows, day = [], 0
+    while len(rows) < reservation_count:
+        reservation_date = (FIRST_DAY + timedelta(days=day)).isoformat()
+        for table_id in range(1, table_count + 1):
+            for start_minute, end_minute in SLOTS:
+                if len(rows) < reservation_count and rng.random() < 0.8:
+                    status = rng.choices(['confirmed', 'cancelled', 'completed'], [85, 10, 5])[0]
+                    rows.append(('Cliente', '555', table_id, reservation_date, start_minute, end_minute,
+                                 2, 'standard', status))
+        day += 1
+    conn.executemany('''
+    INSERT INTO reservations
+    (customer_name, customer_phone, table_id, reservation_date, start_minute, end_minute, guests, type, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.execute("ANALYZE")
+    conn.commit()
+    return [(FIRST_DAY + timedelta(days=offset)).isoformat() for offset in range(day)]
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        'requests': count,
+        'mean_ms': round(sum(latencies) / count * 1000, 3),
+        'p50_ms': round(latencies[count // 2] * 1000, 3),
+        'p95_ms': round(latencies[min(count - 1, int(count * 0.95))] * 1000, 3),
+        'p99_ms': round(latencies[min(count - 1, int(count * 0.99))] * 1000, 3),
+        'throughput_rps': round(count / elapsed, 1),
+    }
+
+
+def measure_get(client, make_url, rng):
+    urls = [make_url(rng) for _ in range(REQUESTS)]
+    client.get(urls[0])
+    latencies = []
+    start = time.perf_counter()
+    for url in urls:
+        request_start = time.perf_counter()
+        response = client.get(url)
+        latencies.append(time.perf_counter() - request_start)
+        assert response.status_code == 200, (url, response.status_code)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def measure_posts(table_count, booking_date):
+    # Cada hilo reserva franjas distintas (mesa y turno propios): mide el camino de
+    # escritura completo, con su transacción, sin conflictos entre hilos
+    slots = [(table_id, start_minute, end_minute)
+             for table_id in range(1, table_count + 1) for start_minute, end_minute in SLOTS]
+    per_thread = min(POSTS_PER_THREAD, len(slots) // POST_THREADS) or 1
+    threads_used = min(POST_THREADS, len(slots))
+    latencies, failures = [], []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads_used)
+
+    def book(index):
+        client = app.test_client()
+        own = slots[index * per_thread:(index + 1) * per_thread]
+        barrier.wait()
+        for table_id, start_minute, end_minute in own:
+            request_start = time.perf_counter()
+            response = client.post('/new_reservation', data={
+                'customer_name': f'Cliente {index}',
+                'customer_phone': '555',
+                'table_id': str(table_id),
+                'reservation_date': booking_date,
+                'start_time': TIME_LABELS[start_minute],
+                'end_time': TIME_LABELS[end_minute],
+                'guests': '2',
+                'reservation_type': 'standard',
+            })
+            with lock:
+                latencies.append(time.perf_counter() - request_start)
+                if response.status_code != 302:
+                    failures.append(response.status_code)
+
+    threads = [threading.Thread(target=book, args=(i,)) for i in range(threads_used)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(latencies, time.perf_counter() - start)
+    result.update(threads=threads_used, failures=len(failures))
+    return result
+
+
+def run_case(directory, table_count, reservation_count):
+    rng = random.Random(f'{table_count}-{reservation_count}')
+    app.config['DATABASE'] = os.path.join(directory, f'bench-{table_count}-{reservation_count}.db')
+    with app.app_context():
+        init_db()
+        start = time.perf_counter()
+        dates = seed(table_count, reservation_count, rng)
+        seed_seconds = time.perf_counter() - start
+
+    client = app.test_client()
+
+    def availability_query(rng):
+        start_minute, end_minute = rng.choice(SLOTS)
+        return (f'reservation_date={rng.choice(dates)}'
+                f'&start_time={TIME_LABELS[start_minute]}&end_time={TIME_LABELS[end_minute]}')
+
+    endpoints = {
+        '/tables': lambda rng: f'/tables?{availability_query(rng)}',
+        '/get_available_tables': lambda rng: f'/get_available_tables?{availability_query(rng)}',
+        '/reservations': lambda rng: '/reservations',
+        '/reservations?date': lambda rng: f'/reservations?date_from={rng.choice(dates)}&status=confirmed',
+    }
+    results = []
+    for endpoint, make_url in endpoints.items():
+        result = measure_get(client, make_url, rng)
+        results.append(dict(endpoint=endpoint, **result))
+    booking_date = (FIRST_DAY + timedelta(days=len(dates) + 1)).isoformat()
+    results.append(dict(endpoint='POST /new_reservation', **measure_posts(table_count, booking_date)))
+
+    for result in results:
+        result.update(tables=table_count, reservations=reservation_count, seed_seconds=round(seed_seconds, 2))
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    # Compara medianas por (mesas, reservas, ruta); devuelve las que empeoran más del umbral
+    with open(baseline_path) as f:
+        baseline = {(r['tables'], r['reservations'], r['endpoint']): r for r in json.load(f)['results']}
+    print(f"\nFrente a {baseline_path} (umbral {threshold:.0%}):")
+    print(f"{'mesas':>6} {'reservas':>9} {'ruta':<24} {'p50 antes':>10} {'p50 ahora':>10} {'cambio':>8}")
+    regressions = []
+    for result in results:
+        previous = baseline.get((result['tables'], result['reservations'], result['endpoint']))
+        if previous is None:
+            continue
+        change = result['p50_ms'] / previous['p50_ms'] - 1 if previous['p50_ms'] else 0
+        flag = '  <-- peor' if change > threshold else ''
+        if flag:
+            regressions.append(result)
+        print(f"{result['tables']:>6} {result['reservations']:>9} {result['endpoint']:<24} "
+              f"{previous['p50_ms']:>10.2f} {result['p50_ms']:>10.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks de reservas y disponibilidad.')
+    parser.add_argument('--full', action='store_true', help='10-1000 mesas y 1k-1M reservas (lento)')
+    parser.add_argument('--tables', type=int, nargs='+', help='número de mesas a probar')
+    parser.add_argument('--reservations', type=int, nargs='+', help='tamaños del histórico a probar')
+    parser.add_argument('--output', default=os.path.join(ROOT, 'benchmarks', 'results.json'))
+    parser.add_argument('--compare', metavar='BASE', help='JSON de una ejecución anterior')
+    parser.add_argument('--threshold', type=float, default=0.10, help='empeoramiento tolerado (0.10 = 10 %%)')
+    args = parser.parse_args()
+
+    grid = FULL if args.full else QUICK
+    table_counts = args.tables or grid['tables']
+    reservation_counts = args.reservations or grid['reservations']
+
+    # Se mide el trabajo de cada ruta, no la caché; los rechazos no ensucian la salida
+    app.config['RESPONSE_CACHE'] = False
+    app.config['METRICS'] = False
+    app.logger.setLevel('ERROR')
+
+    results = []
+    print(f"{'mesas':>6} {'reservas':>9} {'ruta':<24} {'media ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'pet./s':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for table_count in table_counts:
+            for reservation_count in reservation_counts:
+                for result in run_case(tmp, table_count, reservation_count):
+                    results.append(result)
+                    print(f"{table_count:>6} {reservation_count:>9} {result['endpoint']:<24} {result['mean_ms']:>9.2f} "
+                          f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['throughput_rps']:>8.0f}")
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'requests_per_endpoint': REQUESTS,
+            'post_threads': POST_THREADS,
+            'config': {key: app.config[key] for key in ('AVAILABILITY_INDEX', 'AVAILABILITY_INDEX_DATES',
+                                                        'RESPONSE_CACHE', 'DB_POOL_SIZE',
+                                                        'RESERVATIONS_PAGE_SIZE')},
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResultados en {args.output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
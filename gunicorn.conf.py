@@ -0,0 +1,37 @@
+"""Configuración de gunicorn para servir la aplicación en producción (WSGI).
+
+gunicorn lee este fichero automáticamente desde el directorio de trabajo:
+
+    gunicorn app:app
+    FLASK_DATABASE=/srv/restaurant.db gunicorn app:app --bind 0.0.0.0:8080 --workers 4
+
+Cada worker atiende las peticiones con un pool acotado de hilos (gthread): los
+del pool de conexiones SQLite más uno por cada flujo de eventos permitido. Una
+consulta lenta ocupa un hilo, no el worker entero. El esquema se crea una sola
+vez en el proceso maestro, en la base de datos de cada sede (FLASK_VENUES).
+"""
+import multiprocessing
+
+from app import app, close_pools, init_venues
+
+bind = '127.0.0.1:8000'
+# SQLite admite un solo escritor: más procesos solo reparten las lecturas
+workers = min(multiprocessing.cpu_count(), 4)
+worker_class = 'gthread'
+# Cada flujo de /availability_events ocupa un hilo mientras está abierto, casi sin usar
+# la base de datos: se reservan hilos aparte para que no dejen sin servicio al resto
+threads = app.config['DB_POOL_SIZE'] + app.config['AVAILABILITY_EVENTS_MAX_SUBSCRIBERS']
+keepalive = 5
+timeout = 30
+accesslog = '-'
+
+
+def on_starting(server):
+    init_venues()
+    # Las conexiones SQLite no deben heredarse a través de fork
+    close_pools()
+
+
+def post_fork(server, worker):
+    # Cada worker tiene su propio índice de disponibilidad en memoria
+    app.config['AVAILABILITY_INDEX_REVALIDATE'] = server.cfg.workers > 1
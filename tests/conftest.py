@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, close_pools, init_db
+
+
+@pytest.fixture
+def client(tmp_path):
+    # Base de datos nueva por prueba, con las cinco mesas de ejemplo de init_db; los
+    # registros en memoria van por ruta de base de datos, así que también empiezan vacíos
+    saved = dict(app.config)
+    app.config.update(DATABASE=str(tmp_path / 'test.db'), TESTING=True, RESPONSE_CACHE=False, METRICS=False)
+    with app.app_context():
+        init_db()
+    yield app.test_client()
+    close_pools()
+    app.config.clear()
+    app.config.update(saved)
+
+
+def book(client, table_id, reservation_date, start_time, end_time, guests=2, name='Cliente', phone='600000000'):
+    return client.post('/new_reservation', data={
+        'customer_name': name,
+        'customer_phone': phone,
+        'table_id': str(table_id),
+        'reservation_date': reservation_date,
+        'start_time': start_time,
+        'end_time': end_time,
+        'guests': str(guests),
+        'reservation_type': 'standard',
+    })
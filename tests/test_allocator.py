@@ -0,0 +1,58 @@
+import pytest
+
+from app import Table, TableAllocator, TableTimeline, app
+
+
+@pytest.fixture
+def allocator(client):
+    # Mesas de init_db: 1 (4, Ventana), 2 (2, Bar), 3 (6, Jardin), 4 (8, Area privada), 5 (4, Area principal);
+    # solo 3 y 4 se pueden juntar
+    with app.test_request_context():
+        yield lambda timelines=None: TableAllocator('2030-05-10', timelines={} if timelines is None else timelines)
+
+
+def test_smallest_table_that_fits(allocator):
+    assert allocator().choose(2, 20 * 60, 21 * 60).id == 2
+    assert allocator().choose(3, 20 * 60, 21 * 60).id == 1
+    assert allocator().choose(7, 20 * 60, 21 * 60).id == 4
+    assert allocator().choose(9, 20 * 60, 21 * 60) is None
+
+
+def test_busy_tables_are_skipped(allocator):
+    busy = {1: TableTimeline([(19 * 60, 21 * 60, 1)]), 2: TableTimeline([(20 * 60, 22 * 60, 2)])}
+    assert allocator(busy).choose(2, 20 * 60, 21 * 60).id == 5
+
+
+def test_least_dead_time_between_equivalent_tables(allocator):
+    # La mesa 5 queda pegada a su reserva anterior; la 1 dejaría libre toda la tarde
+    timelines = {5: TableTimeline([(18 * 60, 20 * 60, 1)])}
+    assert allocator(timelines).choose(4, 20 * 60, 21 * 60).id == 5
+
+
+def test_vip_location_only_breaks_ties_between_tables_of_a_size(allocator):
+    # Una pareja VIP no ocupa la mesa de 8 del área privada
+    assert allocator().choose(2, 20 * 60, 21 * 60, 'vip').id == 2
+    assert allocator({1: TableTimeline([(20 * 60, 21 * 60, 1)])}).choose(4, 20 * 60, 21 * 60, 'vip').id == 5
+    # Entre mesas del mismo tamaño decide la ubicación preferida, aunque tenga un id mayor
+    with app.test_request_context():
+        tables = [Table(1, 1, 4, 'Area principal'), Table(2, 2, 4, 'Ventana'), Table(3, 3, 6, 'Area privada')]
+        assert TableAllocator('2030-05-10', timelines={}, tables=tables).choose(4, 20 * 60, 21 * 60, 'vip').id == 2
+        assert TableAllocator('2030-05-10', timelines={}, tables=tables).choose(4, 20 * 60, 21 * 60).id == 1
+
+
+def test_combination_of_adjacent_tables(allocator):
+    combination = allocator().choose_combination(12, 20 * 60, 21 * 60)
+    assert [table.id for table in combination] == [4, 3]
+    assert allocator().choose_combination(15, 20 * 60, 21 * 60) is None
+    busy = {3: TableTimeline([(20 * 60 + 30, 21 * 60 + 30, 1)])}
+    assert allocator(busy).choose_combination(12, 20 * 60, 21 * 60) is None
+
+
+def test_optimize_places_larger_pending_requests_first(allocator):
+    plan = allocator().optimize([
+        {'id': None, 'guests': 2, 'start_minute': 20 * 60, 'end_minute': 21 * 60},
+        {'id': None, 'guests': 8, 'start_minute': 20 * 60, 'end_minute': 21 * 60},
+        {'id': None, 'guests': 8, 'start_minute': 20 * 60, 'end_minute': 21 * 60},
+    ])
+    assert [(request['guests'], table.id if table else None) for request, table in plan] == [
+        (8, 4), (8, None), (2, 2)]
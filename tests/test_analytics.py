@@ -0,0 +1,25 @@
+from app import app, venue_summary
+
+from conftest import book
+
+
+def test_standing_occurrences_count_in_the_report(client):
+    assert book(client, 1, '2030-01-07', '20:00', '21:00', guests=3).status_code == 302
+    # Todos los lunes de enero de 2030 (7, 14, 21 y 28) en la mesa 2 (Bar)
+    response = client.post('/recurring_reservations', data={
+        'customer_name': 'Fijo', 'customer_phone': '611111111', 'table_id': '2', 'guests': '2',
+        'start_time': '13:30', 'end_time': '15:00', 'dtstart': '2030-01-07', 'rrule': 'FREQ=WEEKLY;COUNT=4',
+    })
+    assert response.status_code == 302
+
+    report = client.get('/analytics?date_from=2030-01-01&date_to=2030-01-31&format=json').get_json()
+    assert (report['reservations'], report['standing'], report['covers']) == (5, 4, 11)
+    assert report['covers_by_location'] == {'Bar': 8, 'Ventana': 3}
+    hours = {hour['hour']: hour['table_minutes'] for hour in report['hours']}
+    assert (hours[13], hours[14], hours[20]) == (4 * 30, 4 * 60, 60)
+    [day] = [day for day in report['days'] if day['reservation_date'] == '2030-01-07']
+    assert (day['reservations'], day['standing'], day['table_minutes']) == (2, 1, 150)
+
+    with app.app_context():
+        summary = venue_summary('2030-01-14', '2030-01-20')
+    assert (summary['reservations'], summary['standing'], summary['covers']) == (1, 1, 2)
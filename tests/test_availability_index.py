@@ -0,0 +1,38 @@
+import sqlite3
+
+from app import app, get_availability_index
+
+from conftest import book
+
+
+def test_cancel_after_another_process_moved_the_reservation(client):
+    # Con AVAILABILITY_INDEX_REVALIDATE, otro proceso mueve la reserva a otra fecha y mesa;
+    # al recargar la fecha nueva la entrada antigua se sustituye y la cancelación no falla
+    app.config['AVAILABILITY_INDEX_REVALIDATE'] = True
+    assert book(client, 1, '2030-03-01', '20:00', '21:00').status_code == 302
+    client.get('/get_available_tables?reservation_date=2030-03-01&start_time=20:00&end_time=21:00')
+
+    other = sqlite3.connect(app.config['DATABASE'])
+    other.execute("UPDATE reservations SET reservation_date = '2030-03-02', table_id = 2 WHERE id = 1")
+    other.execute("UPDATE reservation_tables SET table_id = 2 WHERE reservation_id = 1")
+    other.commit()
+    other.close()
+
+    response = client.get('/get_available_tables?reservation_date=2030-03-02&start_time=20:00&end_time=21:00')
+    assert 2 not in {table['id'] for table in response.get_json()['tables']}
+    assert client.post('/cancel_reservation/1').status_code == 302
+
+    with app.app_context():
+        assert get_availability_index().busy_table_ids('2030-03-02', 20 * 60, 21 * 60) == set()
+        assert get_availability_index().busy_table_ids('2030-03-01', 20 * 60, 21 * 60) == set()
+
+
+def test_remove_tolerates_an_evicted_date(client):
+    with app.app_context():
+        index = get_availability_index()
+        index.busy_table_ids('2030-03-01', 0, 1)
+        index.add(7, [1], '2030-03-01', 600, 660)
+        index.invalidate('2030-03-01')
+        index._locations[7] = ('2030-03-01', {1})
+        index.remove(7)
+        assert 7 not in index._locations
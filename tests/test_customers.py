@@ -0,0 +1,99 @@
+import sqlite3
+from datetime import date
+
+from app import MIGRATIONS, app, archive_path, archive_reservations, init_db
+
+from conftest import book
+
+
+def customer_json(client, query):
+    return client.get(f'/customers?q={query}&format=json').get_json()['customers']
+
+
+def test_phone_variants_share_one_customer(client):
+    book(client, 1, '2030-01-10', '20:00', '21:00', phone='600 111 222')
+    book(client, 2, '2030-01-11', '20:00', '21:00', phone='+34 600-111-222', name='Ana')
+    [customer] = customer_json(client, '600111222')
+    assert customer['phone_key'] == '+34600111222'
+    assert customer['reservations'] == 2
+    assert customer['last_visit'] == '2030-01-11'
+
+
+def test_archived_reservations_stay_in_the_customer_history(client):
+    # La reserva con el id más alto nunca se archiva: la futura va la última
+    book(client, 1, '2020-03-10', '13:00', '14:00', phone='611000000')
+    for day, table_id in (('2020-01-10', 1), ('2020-02-10', 2), ('2030-01-10', 1)):
+        assert book(client, table_id, day, '20:00', '21:00', phone='600111222').status_code == 302
+    with app.app_context():
+        assert archive_reservations('2021-01-01') == {'2020-01': 1, '2020-02': 1, '2020-03': 1}
+
+    [customer] = customer_json(client, '600111222')
+    assert (customer['reservations'], customer['last_visit']) == (3, '2030-01-10')
+    [archived_only] = customer_json(client, '611000000')
+    assert (archived_only['reservations'], archived_only['last_visit']) == (1, '2020-03-10')
+
+    page = client.get(f"/customers/{customer['id']}").get_data(as_text=True)
+    assert page.index('2030-01-10') < page.index('2020-02-10') < page.index('2020-01-10')
+    assert '2020-03-10' not in page
+
+
+def test_archive_files_without_customers_are_upgraded(client):
+    book(client, 1, '2020-01-10', '20:00', '21:00', phone='600111222')
+    book(client, 1, '2030-01-10', '20:00', '21:00', phone='699999999')
+    with app.app_context():
+        archive_reservations('2021-01-01')
+        path = archive_path('2020-01')
+    # Un fichero de antes de ARCHIVE_VERSION 1: sin customer_id ni contadores
+    old = sqlite3.connect(path)
+    old.execute("DROP INDEX idx_reservations_customer")
+    old.execute("ALTER TABLE reservations DROP COLUMN customer_id")
+    old.execute("PRAGMA user_version = 0")
+    old.commit()
+    old.close()
+    main = sqlite3.connect(app.config['DATABASE'])
+    main.execute("UPDATE customers SET archived_reservations = 0, archived_last_visit = NULL")
+    main.commit()
+    main.close()
+
+    with app.app_context():
+        init_db()
+        init_db()
+    [customer] = customer_json(client, '600111222')
+    assert (customer['reservations'], customer['last_visit']) == (1, '2020-01-10')
+    assert '2020-01-10' in client.get(f"/customers/{customer['id']}").get_data(as_text=True)
+
+
+def test_standing_reservation_creates_its_customer(client):
+    start = date.today().isoformat()
+    response = client.post('/recurring_reservations', data={
+        'customer_name': 'Fijo', 'customer_phone': '611 111 111', 'table_id': '1', 'guests': '2',
+        'start_time': '20:00', 'end_time': '22:00', 'dtstart': start, 'rrule': 'FREQ=WEEKLY',
+    })
+    assert response.status_code == 302
+    [customer] = customer_json(client, '611111111')
+    assert (customer['name'], customer['standing']) == ('Fijo', 1)
+    page = client.get(f"/customers/{customer['id']}").get_data(as_text=True)
+    assert '<h4>Reservas fijas</h4>' in page and start in page
+
+
+def test_existing_standing_reservations_are_linked_on_upgrade(client):
+    book(client, 1, '2030-01-10', '20:00', '21:00', phone='600111222', name='Ana')
+    main = sqlite3.connect(app.config['DATABASE'])
+    main.execute("DROP INDEX idx_recurring_customer")
+    main.execute("ALTER TABLE recurring_reservations DROP COLUMN customer_id")
+    main.executemany('''
+    INSERT INTO recurring_reservations
+    (customer_name, customer_phone, table_id, start_minute, end_minute, guests, type, dtstart, rrule)
+    VALUES (?, ?, 2, 1200, 1320, 2, 'standard', '2030-01-07', 'FREQ=WEEKLY')
+    ''', [('Ana fija', '+34 600 111 222'), ('Luis', '622000000'), ('Luis nuevo', '622 000 000')])
+    main.execute(f"PRAGMA user_version = {len(MIGRATIONS) - 1}")
+    main.commit()
+    main.close()
+
+    with app.app_context():
+        init_db()
+    # Ana conserva su nombre; Luis se da de alta con el de su regla más reciente
+    [ana] = customer_json(client, '600111222')
+    assert (ana['name'], ana['reservations'], ana['standing']) == ('Ana', 1, 1)
+    [luis] = customer_json(client, '622000000')
+    assert (luis['name'], luis['standing']) == ('Luis nuevo', 2)
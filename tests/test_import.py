@@ -0,0 +1,40 @@
+import json
+
+HEADER = 'customer_name,customer_phone,table_id,reservation_date,start_time,end_time,guests,type,status\n'
+
+
+def import_csv(client, rows):
+    return client.post('/import_reservations?format=csv', data=HEADER + ''.join(rows)).get_json()
+
+
+def test_import_checks_overlaps_within_the_file(client):
+    report = import_csv(client, [
+        'Ana,600111222,1,2030-01-10,20:00,21:00,2,standard,confirmed\n',
+        'Luis,600333444,1,2030-01-10,20:30,21:30,2,standard,\n',
+        'Eva,600555666,1,2030-01-10,20:30,21:30,2,standard,cancelled\n',
+    ])
+    assert report['imported'] == 2
+    assert report['rejected'] == [{'row': 3, 'error': 'La mesa no está disponible para el horario seleccionado.'}]
+
+
+def test_import_rejects_unknown_status(client):
+    report = import_csv(client, [
+        'Ana,600111222,1,2030-01-10,20:00,21:00,2,standard,bogus\n',
+        'Luis,600333444,1,2030-01-10,20:00,21:00,2,standard,no_show\n',
+    ])
+    assert report['imported'] == 1
+    assert report['rejected'] == [{'row': 2, 'error': "Valor no válido: estado desconocido 'bogus'"}]
+
+
+def test_import_jsonl_reports_line_numbers(client):
+    lines = [json.dumps({'customer_name': 'Ana', 'customer_phone': '600111222', 'table_id': 9,
+                         'reservation_date': '2030-01-10', 'start_time': '20:00', 'end_time': '21:00',
+                         'guests': 2}),
+             '{no es json',
+             json.dumps({'customer_name': 'Luis', 'table_id': 1})]
+    report = client.post('/import_reservations?format=jsonl', data='\n'.join(lines)).get_json()
+    assert report == {'imported': 0, 'rejected': [
+        {'row': 2, 'error': 'JSON no válido.'},
+        {'row': 1, 'error': 'La mesa 9 no existe.'},
+        {'row': 3, 'error': 'Falta el campo customer_phone.'},
+    ]}
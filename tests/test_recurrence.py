@@ -0,0 +1,141 @@
+from datetime import date
+
+import pytest
+
+from app import RecurrenceRule
+
+from conftest import book
+
+
+def standing(client, rrule, dtstart, table_id=1, start_time='20:00', end_time='22:00'):
+    return client.post('/recurring_reservations', data={
+        'customer_name': 'Fijo',
+        'customer_phone': '611111111',
+        'table_id': str(table_id),
+        'guests': '2',
+        'start_time': start_time,
+        'end_time': end_time,
+        'dtstart': dtstart,
+        'rrule': rrule,
+    }, follow_redirects=True)
+
+
+def test_weekly_count_ends_on_last_occurrence():
+    # 2030-01-02 es miércoles: mi 2, lu 7, mi 9, lu 14
+    rule = RecurrenceRule('FREQ=WEEKLY;BYDAY=MO,WE;COUNT=4', '2030-01-02')
+    assert rule.until == date(2030, 1, 14)
+    assert rule.occurs_on(date(2030, 1, 14))
+    assert not rule.occurs_on(date(2030, 1, 16))
+    assert str(rule) == 'FREQ=WEEKLY;BYDAY=MO,WE;COUNT=4'
+
+
+def test_weekly_interval_counts_weeks_from_the_first_monday():
+    rule = RecurrenceRule('FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,FR;COUNT=3', '2030-01-02')
+    # Viernes 4, y la semana siguiente se salta: lunes 14 y viernes 18
+    assert [day for day in range(1, 20) if rule.occurs_on(date(2030, 1, day))] == [4, 14, 18]
+
+
+def test_until_is_inclusive():
+    rule = RecurrenceRule('FREQ=DAILY;INTERVAL=3;UNTIL=20300107', '2030-01-01')
+    assert [day for day in range(1, 12) if rule.occurs_on(date(2030, 1, day))] == [1, 4, 7]
+
+
+def test_monthday_31_skips_short_months():
+    rule = RecurrenceRule('FREQ=MONTHLY;BYMONTHDAY=31;COUNT=3', '2030-01-01')
+    assert rule.until == date(2030, 5, 31)
+    assert not rule.occurs_on(date(2030, 2, 28))
+    assert not rule.occurs_on(date(2030, 4, 30))
+    assert rule.occurs_on(date(2030, 3, 31))
+
+
+@pytest.mark.parametrize('rrule, dtstart', [
+    ('FREQ=MONTHLY;BYMONTHDAY=30;INTERVAL=12;COUNT=2', '2030-02-01'),
+    ('FREQ=DAILY;COUNT=5', '9999-12-30'),
+])
+def test_count_that_never_completes_is_rejected(rrule, dtstart):
+    with pytest.raises(ValueError, match='suficientes ocurrencias'):
+        RecurrenceRule(rrule, dtstart)
+
+
+@pytest.mark.parametrize('rrule', [
+    'FREQ=YEARLY',
+    'FREQ=DAILY;INTERVAL=0',
+    'FREQ=DAILY;COUNT=2;UNTIL=20300110',
+    'FREQ=DAILY;BYDAY=MO',
+    'FREQ=MONTHLY;BYMONTHDAY=32',
+    'FREQ=WEEKLY;BYDAY=XX',
+    'FREQ=DAILY;UNTIL=20291231',
+])
+def test_invalid_rules(rrule):
+    with pytest.raises(ValueError):
+        RecurrenceRule(rrule, '2030-01-01')
+
+
+def test_unreachable_count_is_a_form_error(client):
+    response = standing(client, 'FREQ=MONTHLY;BYMONTHDAY=30;INTERVAL=12;COUNT=2', '2030-02-01')
+    assert response.status_code == 200
+    assert 'suficientes ocurrencias' in response.get_data(as_text=True)
+
+
+def test_conflict_with_a_single_reservation_on_an_occurrence(client):
+    assert book(client, 1, '2030-01-16', '21:00', '22:00').status_code == 302
+    response = standing(client, 'FREQ=WEEKLY;BYDAY=WE', '2030-01-02')
+    assert 'ocupada el 2030-01-16' in response.get_data(as_text=True)
+    # Un jueves no es una de sus fechas
+    response = standing(client, 'FREQ=WEEKLY;BYDAY=TH', '2030-01-02')
+    assert 'Reserva fija creada' in response.get_data(as_text=True)
+
+
+def test_conflict_between_two_rules(client):
+    assert 'Reserva fija creada' in standing(client, 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO', '2030-01-07').get_data(as_text=True)
+    # Cada dos semanas desde otra semana: nunca coinciden
+    assert 'Reserva fija creada' in standing(client, 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO', '2030-01-14').get_data(as_text=True)
+    assert 'ocupada el 2030-01-21' in standing(client, 'FREQ=DAILY;COUNT=30', '2030-01-15').get_data(as_text=True)
+
+
+def test_skipped_occurrence_frees_the_table(client):
+    standing(client, 'FREQ=WEEKLY;BYDAY=WE', '2030-01-02')
+    assert book(client, 1, '2030-01-09', '20:00', '21:00').status_code == 200
+
+    response = client.post('/recurring_reservations/1/skip', data={'reservation_date': '2030-01-09'},
+                           follow_redirects=True)
+    assert 'anulada para el 2030-01-09' in response.get_data(as_text=True)
+    assert book(client, 1, '2030-01-09', '20:00', '21:00').status_code == 302
+    # Las demás fechas siguen ocupadas, y una fecha que no es de la regla no se anula
+    assert book(client, 1, '2030-01-16', '20:00', '21:00').status_code == 200
+    response = client.post('/recurring_reservations/1/skip', data={'reservation_date': '2030-01-10'},
+                           follow_redirects=True)
+    assert 'no corresponde' in response.get_data(as_text=True)
+
+
+@pytest.mark.parametrize('method, url, data', [
+    ('get', '/get_available_tables?reservation_date=garbage&start_time=20:00&end_time=21:00', None),
+    ('get', '/suggest_table?reservation_date=2030-13-01&start_time=20:00&end_time=21:00&guests=2', None),
+    ('get', '/availability_grid?reservation_date=x', None),
+    ('get', '/availability_events?reservation_date=x', None),
+    ('get', '/reservations?date_from=zzz&format=json', None),
+    ('get', '/next_available_slots?reservation_date=20300101&start_time=20:00&end_time=21:00&guests=2', None),
+    ('get', '/tables?reservation_date=2030-13-01&start_time=20:00&end_time=21:00', None),
+    ('get', '/reservations?date_from=zzz', None),
+    ('get', '/new_reservation?reservation_date=zzz&start_time=20:00&end_time=21:00', None),
+    ('post', '/new_reservation', {'customer_name': 'Ana', 'customer_phone': '600111222', 'table_id': 'auto',
+                                  'reservation_date': 'garbage', 'start_time': '20:00', 'end_time': '21:00',
+                                  'guests': '2', 'reservation_type': 'standard'}),
+])
+def test_invalid_dates_with_a_standing_rule(client, method, url, data):
+    # Con una regla activa el índice de reservas fijas interpreta la fecha: debe llegarle validada
+    standing(client, 'FREQ=DAILY', '2030-01-01')
+    response = getattr(client, method)(url, data=data)
+    if response.is_json:
+        assert response.status_code == 400
+        assert 'Fecha no válida' in response.get_json()['error']
+    else:
+        assert response.status_code == 200
+        assert 'Fecha no válida' in response.get_data(as_text=True) or 'new_reservation?' in url
+
+
+def test_invalid_page_key_starts_from_the_first_page(client):
+    standing(client, 'FREQ=DAILY', date.today().isoformat())
+    response = client.get('/reservations?after=zzz,0,1&format=json')
+    assert response.status_code == 200
+    assert response.get_json()['reservations']
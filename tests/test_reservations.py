@@ -0,0 +1,55 @@
+import sqlite3
+import threading
+
+import pytest
+
+from app import app
+
+from conftest import book
+
+
+def test_unknown_table_is_a_validation_error(client):
+    response = book(client, 99, '2030-03-01', '20:00', '21:00')
+    assert response.status_code == 200
+    assert 'Mesa no encontrada.' in response.get_data(as_text=True)
+
+    assert book(client, 1, '2030-03-01', '20:00', '21:00').status_code == 302
+    response = client.post('/edit_reservation/1', data={
+        'customer_name': 'Cliente', 'customer_phone': '600000000', 'table_id': '99',
+        'reservation_date': '2030-03-01', 'start_time': '20:00', 'end_time': '21:00',
+        'guests': '2', 'reservation_type': 'standard',
+    })
+    assert response.status_code == 200
+    assert 'Mesa no encontrada.' in response.get_data(as_text=True)
+
+
+@pytest.mark.parametrize('write_queue', [False, True])
+def test_concurrent_bookings_of_one_slot_have_a_single_winner(client, monkeypatch, write_queue):
+    # BEGIN IMMEDIATE (o el escritor único) serializa la comprobación y la escritura;
+    # varias rondas, porque una carrera no se da en todas
+    monkeypatch.setitem(app.config, 'WRITE_QUEUE', write_queue)
+    threads_count, days = 16, [f'2030-03-{day:02d}' for day in range(1, 9)]
+
+    def attempt(barrier, day, results, index):
+        own_client = app.test_client()
+        barrier.wait()
+        results[index] = book(own_client, 1, day, '20:00', '22:00', name=f'Cliente {index}').status_code
+
+    for day in days:
+        barrier = threading.Barrier(threads_count)
+        results = [None] * threads_count
+        threads = [threading.Thread(target=attempt, args=(barrier, day, results, index))
+                   for index in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(results) == [200] * (threads_count - 1) + [302], day
+
+    conn = sqlite3.connect(app.config['DATABASE'])
+    confirmed = conn.execute('''
+    SELECT reservation_date, COUNT(*) FROM reservations
+    WHERE table_id = 1 AND status = 'confirmed' GROUP BY reservation_date
+    ''').fetchall()
+    conn.close()
+    assert confirmed == [(day, 1) for day in days]
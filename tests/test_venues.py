@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from app import app, init_venues
+
+
+@pytest.fixture
+def venues(client, tmp_path):
+    app.config['VENUES'] = {'centro': str(tmp_path / 'centro.db'), 'playa': str(tmp_path / 'playa.db')}
+    app.config['DATABASE'] = str(tmp_path / 'restaurant.db')
+    with app.app_context():
+        init_venues()
+    return client
+
+
+def test_prefixed_venues_are_served(venues):
+    assert venues.get('/centro/tables').status_code == 200
+    assert venues.get('/playa/reservations?format=json').get_json()['reservations'] == []
+
+
+def test_unknown_or_missing_venue_is_not_found(venues):
+    assert venues.get('/tables').status_code == 404
+    assert venues.get('/sur/tables').status_code == 404
+    # DATABASE no se usa con sedes: no aparece un fichero vacío
+    assert not os.path.exists(app.config['DATABASE'])
+
+
+def test_default_venue_and_hosts(venues):
+    app.config['VENUE_HOSTS'] = {'playa.example.com': 'playa'}
+    assert venues.get('/tables', headers={'Host': 'playa.example.com'}).status_code == 200
+    app.config['DEFAULT_VENUE'] = 'centro'
+    assert venues.get('/tables').status_code == 200
+    assert not os.path.exists(app.config['DATABASE'])
+
+
+def test_commands_need_a_venue(venues):
+    result = app.test_cli_runner().invoke(args=['archive-reservations'])
+    assert isinstance(result.exception, RuntimeError)
+    assert not os.path.exists(app.config['DATABASE'])
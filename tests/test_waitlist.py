@@ -0,0 +1,106 @@
+import sqlite3
+
+import pytest
+
+from app import app
+
+from conftest import book
+
+DAY = '2030-05-10'
+
+
+def join(client, name, guests, duration, window_start, window_end, auto_book=False):
+    data = {'customer_name': name, 'customer_phone': '600111222', 'reservation_date': DAY, 'guests': str(guests),
+            'duration': str(duration), 'window_start': window_start, 'window_end': window_end}
+    if auto_book:
+        data['auto_book'] = '1'
+    response = client.post('/waitlist', data=data)
+    assert response.status_code == 302, response.get_data(as_text=True)
+
+
+def waitlist(name):
+    conn = sqlite3.connect(app.config['DATABASE'])
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT * FROM waitlist WHERE customer_name = ?", (name,)).fetchone()
+    conn.close()
+    return row
+
+
+@pytest.fixture
+def gap(client):
+    # Mesa 1 (4 plazas) ocupada de 18:00 a 22:00 en tres reservas seguidas; al cancelar
+    # la central (id 2) queda libre exactamente de 20:00 a 21:00
+    for start, end in (('18:00', '20:00'), ('20:00', '21:00'), ('21:00', '22:00')):
+        assert book(client, 1, DAY, start, end).status_code == 302
+    for table_id in (2, 3, 4, 5):
+        assert book(client, table_id, DAY, '10:00', '22:00').status_code == 302
+    return client
+
+
+def test_gap_between_adjacent_bookings_goes_to_the_largest_group_that_fits(gap):
+    join(gap, 'Pareja', 2, 60, '19:00', '22:00')
+    join(gap, 'Larga', 4, 90, '19:00', '22:00')
+    join(gap, 'Grupo', 4, 60, '19:30', '21:30')
+    join(gap, 'Grande', 6, 60, '20:00', '21:00')
+
+    response = gap.post('/cancel_reservation/2', follow_redirects=True)
+    assert 'se ha ofrecido a Grupo' in response.get_data(as_text=True)
+    offered = waitlist('Grupo')
+    assert (offered['status'], offered['offer_table_id'], offered['offer_start_minute']) == ('offered', 1, 20 * 60)
+    # 90 minutos no caben en el hueco y 6 personas no caben en la mesa
+    assert waitlist('Larga')['status'] == waitlist('Grande')['status'] == 'waiting'
+
+
+def test_window_opening_inside_the_gap_starts_at_its_own_time(gap):
+    join(gap, 'Tarde', 2, 30, '20:30', '22:00')
+    gap.post('/cancel_reservation/2')
+    assert waitlist('Tarde')['offer_start_minute'] == 20 * 60 + 30
+
+
+def test_same_window_goes_to_the_oldest_request(gap):
+    join(gap, 'Primera', 3, 60, '20:00', '21:00')
+    join(gap, 'Segunda', 3, 60, '20:00', '21:00')
+    gap.post('/cancel_reservation/2')
+    assert waitlist('Primera')['status'] == 'offered'
+    assert waitlist('Segunda')['status'] == 'waiting'
+
+
+def test_auto_book_reserves_the_freed_slot(gap):
+    join(gap, 'Auto', 2, 60, '20:00', '21:00', auto_book=True)
+    response = gap.post('/cancel_reservation/2', follow_redirects=True)
+    assert 'se ha reservado para Auto' in response.get_data(as_text=True)
+    entry = waitlist('Auto')
+    assert entry['status'] == 'booked' and entry['reservation_id'] is not None
+    assert book(gap, 1, DAY, '20:00', '21:00').status_code == 200
+
+
+def test_accept_offer_books_it_once(gap):
+    join(gap, 'Oferta', 2, 60, '20:00', '21:00')
+    gap.post('/cancel_reservation/2')
+    entry_id = waitlist('Oferta')['id']
+
+    response = gap.post(f'/waitlist/{entry_id}/accept', data={'reservation_date': DAY}, follow_redirects=True)
+    assert 'se ha reservado para Oferta' in response.get_data(as_text=True)
+    response = gap.post(f'/waitlist/{entry_id}/accept', data={'reservation_date': DAY}, follow_redirects=True)
+    assert 'no tiene ninguna oferta pendiente' in response.get_data(as_text=True)
+
+
+def test_offer_taken_meanwhile_returns_to_the_waitlist(gap):
+    join(gap, 'Lenta', 2, 60, '20:00', '21:00')
+    gap.post('/cancel_reservation/2')
+    assert book(gap, 1, DAY, '20:00', '21:00').status_code == 302
+
+    entry_id = waitlist('Lenta')['id']
+    response = gap.post(f'/waitlist/{entry_id}/accept', data={'reservation_date': DAY}, follow_redirects=True)
+    assert 'ya no está libre' in response.get_data(as_text=True)
+    assert waitlist('Lenta')['status'] == 'waiting'
+
+
+def test_shortened_reservation_offers_only_the_freed_part(gap):
+    join(gap, 'Media', 2, 30, '20:00', '21:00')
+    response = gap.post('/edit_reservation/2', data={
+        'customer_name': 'Cliente', 'customer_phone': '600000000', 'table_id': '1', 'reservation_date': DAY,
+        'start_time': '20:00', 'end_time': '20:30', 'guests': '2', 'reservation_type': 'standard',
+    })
+    assert response.status_code == 302
+    assert waitlist('Media')['offer_start_minute'] == 20 * 60 + 30
@@ -0,0 +1,49 @@
+import sqlite3
+
+import pytest
+
+from app import app, close_pools, get_pool, run_write
+
+
+class FailingCommitConnection(sqlite3.Connection):
+    # La siguiente confirmación falla como lo haría con SQLITE_BUSY o un error de E/S
+    fail_next_commit = False
+
+    def commit(self):
+        if FailingCommitConnection.fail_next_commit:
+            FailingCommitConnection.fail_next_commit = False
+            raise sqlite3.OperationalError('database is locked')
+        return super().commit()
+
+
+@pytest.fixture
+def queued(client, monkeypatch):
+    monkeypatch.setitem(app.config, 'WRITE_QUEUE', True)
+    with app.app_context():
+        # Las conexiones nuevas del pool (la del escritor incluida) usan la clase que falla
+        close_pools()
+        monkeypatch.setattr(get_pool(), 'factory', FailingCommitConnection)
+        yield
+
+
+def add_table(location):
+    return run_write(lambda cursor: cursor.execute(
+        "INSERT INTO tables (capacity, location) VALUES (?, ?)", (2, location)).lastrowid)
+
+
+def locations():
+    conn = sqlite3.connect(app.config['DATABASE'])
+    rows = conn.execute("SELECT location FROM tables").fetchall()
+    conn.close()
+    return {row[0] for row in rows}
+
+
+def test_failed_commit_rolls_back_and_the_queue_keeps_writing(queued):
+    add_table('Antes')
+    FailingCommitConnection.fail_next_commit = True
+    with pytest.raises(sqlite3.OperationalError):
+        add_table('Perdida')
+    # Sin el rollback el escritor seguiría dentro de la transacción y este BEGIN fallaría
+    add_table('Despues')
+    assert {'Antes', 'Despues'} <= locations()
+    assert 'Perdida' not in locations()